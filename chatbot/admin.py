@@ -3,7 +3,8 @@ from django.utils import timezone
 from django.contrib import messages
 from unfold.decorators import display
 from unfold.admin import ModelAdmin
-from .models import Evento
+from .limpieza import programar_limpieza
+from .models import Evento, EventoArchivado, SerieEvento
 
 # Register your models here.
 
@@ -21,7 +22,7 @@ class EventoAdmin(ModelAdmin):
     search_fields = ['titulo', 'descripcion', 'ubicacion']
     date_hierarchy = 'fecha_inicio'
     readonly_fields = ['fecha_creacion', 'fecha_actualizacion']
-    actions = ['eliminar_eventos_pasados']
+    actions = ['eliminar_eventos_pasados', 'archivar_eventos_pasados']
     
     fieldsets = (
         ('Información básica', {
@@ -59,43 +60,97 @@ class EventoAdmin(ModelAdmin):
         Si se seleccionaron eventos específicos, solo elimina los pasados de esa selección.
         Si no se seleccionó ninguno, elimina todos los eventos pasados.
         """
+        self._limpiar_eventos_pasados(request, queryset, archivar=False)
+
+    @admin.action(description='Archivar eventos pasados')
+    def archivar_eventos_pasados(self, request, queryset):
+        """
+        Como eliminar_eventos_pasados, pero antes copia cada evento a la tabla
+        de eventos archivados.
+        """
+        self._limpiar_eventos_pasados(request, queryset, archivar=True)
+
+    def _limpiar_eventos_pasados(self, request, queryset, archivar):
+        # Por lotes, cada uno en su transacción, en un hilo aparte: con muchos
+        # eventos la petición pasaría del timeout (ver limpieza.py)
         ahora = timezone.now()
-        
+
         if queryset.exists():
-            # Si hay eventos seleccionados, solo eliminar los pasados de esa selección
+            # Si hay eventos seleccionados, solo los pasados de esa selección
             eventos_pasados = queryset.filter(fecha_inicio__lt=ahora)
-            cantidad = eventos_pasados.count()
-            
-            if cantidad == 0:
-                self.message_user(
-                    request,
-                    'No hay eventos pasados en la selección.',
-                    messages.INFO
-                )
-                return
-            
-            eventos_pasados.delete()
-            self.message_user(
-                request,
-                f'Se eliminaron {cantidad} evento(s) pasado(s) exitosamente.',
-                messages.SUCCESS
-            )
+            sin_eventos = 'No hay eventos pasados en la selección.'
         else:
-            # Si no hay selección, eliminar todos los eventos pasados
+            # Si no hay selección, todos los eventos pasados
             eventos_pasados = Evento.objects.filter(fecha_inicio__lt=ahora)
-            cantidad = eventos_pasados.count()
-            
-            if cantidad == 0:
-                self.message_user(
-                    request,
-                    'No hay eventos pasados para eliminar.',
-                    messages.INFO
-                )
-                return
-            
-            eventos_pasados.delete()
-            self.message_user(
-                request,
-                f'Se eliminaron {cantidad} evento(s) pasado(s) exitosamente.',
-                messages.SUCCESS
-            )
+            sin_eventos = 'No hay eventos pasados para eliminar.'
+
+        total = eventos_pasados.count()
+        if not total:
+            self.message_user(request, sin_eventos, messages.INFO)
+            return
+
+        programar_limpieza(eventos_pasados, archivar=archivar)
+        accion = 'archivando' if archivar else 'eliminando'
+        self.message_user(
+            request,
+            f'Se están {accion} {total} evento(s) pasado(s) en segundo plano; '
+            f'recarga la página en unos momentos para ver el resultado.',
+            messages.SUCCESS
+        )
+
+
+@admin.register(SerieEvento)
+class SerieEventoAdmin(ModelAdmin):
+    list_display = [
+        'titulo',
+        'categoria',
+        'fecha_inicio',
+        'regla',
+        'fecha_ultima',
+        'precio_display',
+        'activo_display'
+    ]
+    list_filter = ['categoria', 'activo']
+    search_fields = ['titulo', 'descripcion', 'ubicacion']
+    readonly_fields = ['fecha_ultima', 'fecha_creacion', 'fecha_actualizacion']
+
+    fieldsets = (
+        ('Información básica', {
+            'fields': ('titulo', 'descripcion', 'categoria')
+        }),
+        ('Recurrencia', {
+            'fields': ('fecha_inicio', 'duracion', 'regla', 'excepciones', 'fecha_ultima')
+        }),
+        ('Ubicación', {
+            'fields': ('ubicacion', 'direccion')
+        }),
+        ('Información adicional', {
+            'fields': ('precio', 'contacto', 'enlace', 'activo')
+        }),
+        ('Metadatos', {
+            'fields': ('fecha_creacion', 'fecha_actualizacion'),
+            'classes': ('collapse',)
+        }),
+    )
+
+    @display(description='Precio')
+    def precio_display(self, obj):
+        if obj.es_gratuito:
+            return 'Gratis'
+        return f'${obj.precio}'
+
+    @display(description='Activo', boolean=True)
+    def activo_display(self, obj):
+        return obj.activo
+
+
+@admin.register(EventoArchivado)
+class EventoArchivadoAdmin(ModelAdmin):
+    list_display = ['titulo', 'categoria', 'fecha_inicio', 'fecha_archivado']
+    list_filter = ['categoria', 'fecha_inicio']
+    search_fields = ['titulo']
+    date_hierarchy = 'fecha_inicio'
+    readonly_fields = ['evento_id', 'titulo', 'categoria', 'fecha_inicio', 'datos', 'fecha_archivado']
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,408 @@
+"""
+Búsqueda de texto completo sobre título, descripción y ubicación de los eventos.
+
+En SQLite usa una tabla FTS5 (``chatbot_evento_fts``) con contenido externo,
+mantenida al día con triggers, y en PostgreSQL una columna ``tsvector``
+generada con una configuración en español sin tildes (``chatbot_es``) y un
+índice GIN. En ambos casos la búsqueda ignora mayúsculas y tildes ("musica"
+encuentra "Música") y ordena por relevancia.
+
+Al reconstruir la tabla de eventos (SQLite lo hace en algunas migraciones que
+alteran columnas) los triggers se pierden: esas migraciones deben volver a
+llamar a ``crear_indice_busqueda``.
+"""
+import contextlib
+import difflib
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import normalizar_titulo
+
+
+TABLA_FTS = 'chatbot_evento_fts'
+TABLA_VOCABULARIO = 'chatbot_evento_fts_vocab'
+CONFIGURACION_PG = 'chatbot_es'
+
+# Palabras frecuentes que no sirven para buscar. PostgreSQL ya las descarta con
+# la configuración en español; en SQLite se quitan aquí.
+PALABRAS_VACIAS = frozenset({
+    'a', 'al', 'algo', 'como', 'con', 'de', 'del', 'el', 'en', 'es', 'esta', 'este',
+    'evento', 'eventos', 'hay', 'la', 'las', 'lo', 'los', 'me', 'mi', 'o', 'para',
+    'por', 'que', 'quiero', 'se', 'sobre', 'su', 'un', 'una', 'unos', 'y',
+})
+
+MAX_TERMINOS = 8
+
+# Pesos de bm25 por columna de la tabla FTS (titulo, descripcion, ubicacion)
+PESOS_FTS = '10.0, 1.0, 4.0'
+
+# Títulos parecidos que se comparan con el pedido cuando no hay uno igual, y
+# parecido mínimo (ratio de difflib, de 0 a 1) para aceptar el mejor
+MAX_CANDIDATOS_TITULO = 20
+PARECIDO_MINIMO_TITULO = 0.75
+
+_TRIGGER_INSERCION_SQLITE = f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON chatbot_evento BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, titulo, descripcion, ubicacion)
+        VALUES (new.id, new.titulo, new.descripcion, new.ubicacion);
+    END
+    """
+
+
+
+def _triggers_cambio_sqlite(hasta_id=None):
+    """
+    Triggers de borrado y actualización del índice. Con ``hasta_id`` solo
+    tocan las filas ya indexadas (las de id menor o igual), para usarlos
+    durante carga_masiva: sacar del índice una fila que aún no está en él
+    lo corrompe.
+    """
+    cuando = '' if hasta_id is None else f'WHEN old.id <= {int(hasta_id)} '
+    return [
+        f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON chatbot_evento {cuando}BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, titulo, descripcion, ubicacion)
+        VALUES ('delete', old.id, old.titulo, old.descripcion, old.ubicacion);
+    END
+    """,
+        f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF titulo, descripcion, ubicacion ON chatbot_evento {cuando}BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, titulo, descripcion, ubicacion)
+        VALUES ('delete', old.id, old.titulo, old.descripcion, old.ubicacion);
+        INSERT INTO {TABLA_FTS}(rowid, titulo, descripcion, ubicacion)
+        VALUES (new.id, new.titulo, new.descripcion, new.ubicacion);
+    END
+    """,
+    ]
+
+
+_SQL_SQLITE = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        titulo, descripcion, ubicacion,
+        content='chatbot_evento', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    _TRIGGER_INSERCION_SQLITE,
+    *_triggers_cambio_sqlite(),
+    # Indexar los eventos que ya existían
+    f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')",
+]
+
+_SQL_SQLITE_REVERSO = [
+    f'DROP TRIGGER IF EXISTS {TABLA_FTS}_ai',
+    f'DROP TRIGGER IF EXISTS {TABLA_FTS}_ad',
+    f'DROP TRIGGER IF EXISTS {TABLA_FTS}_au',
+    f'DROP TABLE IF EXISTS {TABLA_FTS}',
+]
+
+_SQL_POSTGRESQL = [
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    f"""
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIGURACION_PG}') THEN
+            CREATE TEXT SEARCH CONFIGURATION {CONFIGURACION_PG} (COPY = spanish);
+            ALTER TEXT SEARCH CONFIGURATION {CONFIGURACION_PG}
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+        END IF;
+    END $$
+    """,
+    f"""
+    ALTER TABLE chatbot_evento ADD COLUMN IF NOT EXISTS busqueda_fts tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{CONFIGURACION_PG}'::regconfig, coalesce(titulo, '')), 'A') ||
+        setweight(to_tsvector('{CONFIGURACION_PG}'::regconfig, coalesce(ubicacion, '')), 'B') ||
+        setweight(to_tsvector('{CONFIGURACION_PG}'::regconfig, coalesce(descripcion, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS chatbot_evento_fts_idx ON chatbot_evento USING gin (busqueda_fts)',
+]
+
+_SQL_POSTGRESQL_REVERSO = [
+    'DROP INDEX IF EXISTS chatbot_evento_fts_idx',
+    'ALTER TABLE chatbot_evento DROP COLUMN IF EXISTS busqueda_fts',
+    f'DROP TEXT SEARCH CONFIGURATION IF EXISTS {CONFIGURACION_PG}',
+]
+
+
+_SQL_TITULOS = {
+    # Palabras de los títulos, leídas del índice FTS5, para corregir errores de tipeo
+    'sqlite': [f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_VOCABULARIO} USING fts5vocab({TABLA_FTS}, 'col')"],
+    'postgresql': [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE INDEX IF NOT EXISTS chatbot_evento_titulo_trgm_idx '
+        'ON chatbot_evento USING gin (titulo_normalizado gin_trgm_ops)',
+    ],
+}
+
+_SQL_TITULOS_REVERSO = {
+    'sqlite': [f'DROP TABLE IF EXISTS {TABLA_VOCABULARIO}'],
+    'postgresql': ['DROP INDEX IF EXISTS chatbot_evento_titulo_trgm_idx'],
+}
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    """
+    Crea (o completa) el índice de texto completo para el motor actual. Es
+    idempotente; se usa desde migraciones con ``RunPython``.
+    """
+    sentencias = {
+        'sqlite': _SQL_SQLITE,
+        'postgresql': _SQL_POSTGRESQL,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in sentencias:
+        schema_editor.execute(sql)
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    sentencias = {
+        'sqlite': _SQL_SQLITE_REVERSO,
+        'postgresql': _SQL_POSTGRESQL_REVERSO,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in sentencias:
+        schema_editor.execute(sql)
+
+
+def crear_indice_titulos(apps, schema_editor):
+    """
+    Lo que usa ``buscar_por_titulo`` para los títulos parecidos: el
+    vocabulario de la tabla FTS5 en SQLite y un índice de trigramas sobre
+    titulo_normalizado en PostgreSQL (pg_trgm).
+    """
+    for sql in _SQL_TITULOS.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def eliminar_indice_titulos(apps, schema_editor):
+    for sql in _SQL_TITULOS_REVERSO.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+@contextlib.contextmanager
+def carga_masiva():
+    """
+    Para inserciones de miles de eventos. En SQLite, indexar fila por fila
+    desde el trigger se vuelve cada vez más lento dentro de una misma
+    transacción; aquí se suspende el trigger de inserción y al salir se
+    indexan todas las filas nuevas con una sola sentencia, con sus valores
+    finales. Mientras tanto, los triggers de borrado y actualización solo
+    tocan las filas que ya estaban indexadas. En otros motores no hace nada
+    (la columna de PostgreSQL es generada).
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM chatbot_evento')
+        ultimo_id = cursor.fetchone()[0]
+        for sufijo in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {TABLA_FTS}_{sufijo}')
+        for sql in _triggers_cambio_sqlite(hasta_id=ultimo_id):
+            cursor.execute(sql)
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for sufijo in ('ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {TABLA_FTS}_{sufijo}')
+            for sql in _triggers_cambio_sqlite():
+                cursor.execute(sql)
+            cursor.execute(
+                f'INSERT INTO {TABLA_FTS}(rowid, titulo, descripcion, ubicacion) '
+                f'SELECT id, titulo, descripcion, ubicacion FROM chatbot_evento WHERE id > %s',
+                (ultimo_id,),
+            )
+            cursor.execute(_TRIGGER_INSERCION_SQLITE)
+
+
+def terminos_busqueda(texto):
+    """
+    Palabras de ``texto`` útiles para buscar: sin signos ni palabras vacías.
+    """
+    terminos = []
+    for palabra in re.findall(r'\w+', (texto or '').lower()):
+        if len(palabra) > 1 and palabra not in PALABRAS_VACIAS and palabra not in terminos:
+            terminos.append(palabra)
+    return terminos[:MAX_TERMINOS]
+
+
+def ids_por_relevancia(texto):
+    """
+    Retorna los ids de hasta settings.BUSQUEDA_MAX_RESULTADOS eventos que
+    coinciden con ``texto``, del más al menos relevante. Basta con que
+    coincida una de las palabras, como prefijo; el título pesa más que la
+    ubicación y esta más que la descripción.
+
+    Retorna None si el motor no tiene índice de texto completo o el texto no
+    tiene palabras útiles.
+    """
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return None
+
+    limite = settings.BUSQUEDA_MAX_RESULTADOS
+    if connection.vendor == 'sqlite':
+        sql = (
+            f'SELECT fts.rowid FROM {TABLA_FTS} AS fts '
+            f'JOIN chatbot_evento AS evento ON evento.id = fts.rowid '
+            f'WHERE {TABLA_FTS} MATCH %s AND evento.activo '
+            f'ORDER BY bm25({TABLA_FTS}, {PESOS_FTS}) LIMIT %s'
+        )
+        parametros = (' OR '.join(f'"{termino}"*' for termino in terminos), limite)
+    elif connection.vendor == 'postgresql':
+        tsquery = f"to_tsquery('{CONFIGURACION_PG}', %s)"
+        sql = (
+            f'SELECT id FROM chatbot_evento WHERE busqueda_fts @@ {tsquery} AND activo '
+            f'ORDER BY ts_rank(busqueda_fts, {tsquery}) DESC LIMIT %s'
+        )
+        consulta = ' | '.join(f'{termino}:*' for termino in terminos)
+        parametros = (consulta, consulta, limite)
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def filtrar_por_texto(query, texto):
+    """
+    Limita ``query`` a los eventos de ``ids_por_relevancia`` y les anota
+    ``relevancia``, un entero que crece con el puesto en el ranking. El
+    ranking se calcula una sola vez, con una consulta aparte sobre el índice.
+
+    Retorna None si no se puede usar el índice; en ese caso se busca con
+    ``icontains``.
+    """
+    ids = ids_por_relevancia(texto)
+    if ids is None:
+        return None
+
+    return query.filter(id__in=ids).annotate(relevancia=_puesto_en(ids))
+
+
+def valores_relevancia(ids):
+    """
+    El valor de ``relevancia`` que ``filtrar_por_texto`` anota a cada id de
+    ``ids``, para ordenar y paginar fuera de la base de datos con los mismos
+    cursores.
+    """
+    if connection.vendor == 'postgresql':
+        return {pk: puesto for puesto, pk in enumerate(ids, 1)}
+    valores, posicion = {}, 1
+    for pk in ids:
+        valores[pk] = posicion
+        posicion += len(str(pk)) + 1
+    return valores
+
+
+def _puesto_en(ids):
+    """
+    Expresión SQL con la posición del evento en ``ids``. Un Case/When con una
+    rama por id cuesta más en compilar la consulta que en ejecutarla.
+    """
+    if connection.vendor == 'postgresql':
+        # Los ids son BigAutoField: con integer[] no se encuentran los mayores a 2^31
+        return RawSQL('array_position(%s::bigint[], "chatbot_evento"."id")', (ids,))
+    # En SQLite, la posición del ",id," dentro de ",id1,id2,...,"
+    lista = ',' + ','.join(str(pk) for pk in ids) + ','
+    return RawSQL('''instr(%s, ',' || "chatbot_evento"."id" || ',')''', (lista,))
+
+
+def buscar_por_titulo(query, titulo):
+    """
+    Retorna el evento de ``query`` con el título ``titulo`` o, si no hay uno
+    igual, el de título más parecido (tildes, mayúsculas, signos y errores
+    de tipeo aparte). Retorna None si ninguno se parece lo suficiente.
+
+    La coincidencia exacta es una sola consulta sobre el índice de
+    titulo_normalizado. En SQLite, si no la hay, se corrige cada palabra que
+    no aparece en ningún título y se vuelve a buscar por el índice; solo si
+    tampoco así se encuentra, se ordenan candidatos por relevancia.
+    """
+    clave = normalizar_titulo(titulo)
+    if not clave:
+        return None
+
+    evento = query.filter(titulo_normalizado=clave).first()
+    if evento is not None:
+        return evento
+
+    if connection.vendor == 'sqlite':
+        corregida = _corregir_palabras(clave)
+        if corregida != clave:
+            evento = query.filter(titulo_normalizado=corregida).first()
+            if evento is not None:
+                return evento
+
+    mejor_id, mejor_parecido = None, PARECIDO_MINIMO_TITULO
+    for pk, candidato in _titulos_parecidos(clave):
+        parecido = difflib.SequenceMatcher(None, clave, candidato).ratio()
+        if parecido >= mejor_parecido:
+            mejor_id, mejor_parecido = pk, parecido
+    if mejor_id is None:
+        return None
+    return query.filter(id=mejor_id).first()
+
+
+def _corregir_palabras(clave):
+    """
+    Cambia cada palabra de ``clave`` que no está en ningún título por la más
+    parecida que sí, entre las que empiezan con sus dos primeras letras. Los
+    números se dejan como están.
+    """
+    sql_existe = f"SELECT 1 FROM {TABLA_VOCABULARIO} WHERE col = 'titulo' AND term = %s"
+    sql_prefijo = f"SELECT term FROM {TABLA_VOCABULARIO} WHERE col = 'titulo' AND term >= %s AND term < %s"
+    palabras = []
+    with connection.cursor() as cursor:
+        for palabra in clave.split():
+            if palabra.isdigit() or len(palabra) < 3:
+                palabras.append(palabra)
+                continue
+            cursor.execute(sql_existe, (palabra,))
+            if cursor.fetchone():
+                palabras.append(palabra)
+                continue
+            prefijo = palabra[:2]
+            cursor.execute(sql_prefijo, (prefijo, prefijo[:-1] + chr(ord(prefijo[-1]) + 1)))
+            parecidas = difflib.get_close_matches(
+                palabra, [fila[0] for fila in cursor.fetchall()], n=1, cutoff=PARECIDO_MINIMO_TITULO,
+            )
+            palabras.append(parecidas[0] if parecidas else palabra)
+    return ' '.join(palabras)
+
+
+def _titulos_parecidos(clave):
+    """
+    (id, titulo_normalizado) de hasta MAX_CANDIDATOS_TITULO eventos con
+    títulos parecidos a ``clave``: por trigramas en PostgreSQL y por las
+    palabras del título en la tabla FTS5 de SQLite.
+    """
+    if connection.vendor == 'postgresql':
+        sql = (
+            'SELECT id, titulo_normalizado FROM chatbot_evento WHERE titulo_normalizado %% %s '
+            'ORDER BY similarity(titulo_normalizado, %s) DESC LIMIT %s'
+        )
+        parametros = (clave, clave, MAX_CANDIDATOS_TITULO)
+    elif connection.vendor == 'sqlite':
+        # Aquí no se quitan palabras vacías: en un título pueden ser lo único
+        # que lo distingue ("Evento 3")
+        palabras = ' OR '.join(f'"{palabra}"*' for palabra in clave.split()[:MAX_TERMINOS])
+        sql = (
+            f'SELECT evento.id, evento.titulo_normalizado FROM {TABLA_FTS} AS fts '
+            f'JOIN chatbot_evento AS evento ON evento.id = fts.rowid '
+            f'WHERE {TABLA_FTS} MATCH %s '
+            f'ORDER BY bm25({TABLA_FTS}, {PESOS_FTS}) LIMIT %s'
+        )
+        parametros = (f'titulo : ({palabras})', MAX_CANDIDATOS_TITULO)
+    else:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
@@ -0,0 +1,201 @@
+"""
+Cachés en memoria del proceso para el pipeline del chatbot.
+"""
+import random
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+
+def normalizar_mensaje(mensaje):
+    """
+    Normaliza un mensaje para usarlo como clave de caché: minúsculas,
+    sin tildes y con los espacios colapsados.
+    """
+    texto = unicodedata.normalize('NFKD', (mensaje or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.split())
+
+
+def proxima_medianoche_local():
+    """
+    Retorna el timestamp de la próxima medianoche en la zona horaria local.
+    """
+    manana = timezone.localdate() + timedelta(days=1)
+    return timezone.make_aware(datetime.combine(manana, datetime.min.time())).timestamp()
+
+
+class CacheLRU:
+    """
+    Caché LRU acotada y segura entre hilos, con expiración opcional por entrada.
+
+    Lleva contadores de aciertos, fallos, expulsiones y expiraciones para
+    poder medir su efectividad.
+    """
+
+    def __init__(self, tamano_maximo=1000):
+        self.tamano_maximo = tamano_maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.expiraciones = 0
+
+    def obtener(self, clave, defecto=None):
+        """
+        Retorna el valor guardado para ``clave`` o ``defecto`` si no existe
+        o ya expiró.
+        """
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return defecto
+
+            valor, expira_en = entrada
+            if expira_en is not None and expira_en <= time.time():
+                del self._datos[clave]
+                self.expiraciones += 1
+                self.fallos += 1
+                return defecto
+
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor, expira_en=None):
+        """
+        Guarda ``valor`` bajo ``clave``. ``expira_en`` es un timestamp
+        (segundos desde epoch) o None para no expirar.
+        """
+        with self._lock:
+            self._datos[clave] = (valor, expira_en)
+            self._datos.move_to_end(clave)
+            self._expulsar_sobrantes()
+
+    def _expulsar_sobrantes(self):
+        # Debe llamarse con el lock tomado
+        while len(self._datos) > self.tamano_maximo:
+            clave, (valor, _) = self._datos.popitem(last=False)
+            self.expulsiones += 1
+            self._al_quitar(clave, valor)
+
+    def _al_quitar(self, clave, valor):
+        """
+        Se llama (con el lock tomado) cuando una entrada sale de la caché por
+        expulsión o invalidación. Las subclases lo usan para mantener índices.
+        """
+
+    def invalidar(self, clave):
+        with self._lock:
+            entrada = self._datos.pop(clave, None)
+            if entrada is not None:
+                self._al_quitar(clave, entrada[0])
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def estadisticas(self):
+        """
+        Retorna un diccionario con el tamaño y los contadores de la caché.
+        """
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'tamano': len(self._datos),
+                'tamano_maximo': self.tamano_maximo,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'expulsiones': self.expulsiones,
+                'expiraciones': self.expiraciones,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            }
+
+
+class CacheVariantes(CacheLRU):
+    """
+    Caché LRU que guarda hasta ``variantes`` valores por clave y
+    responde con uno al azar, para que un mismo resultado no produzca siempre
+    el mismo texto.
+
+    Cada clave puede llevar etiquetas (por ejemplo, los ids de los eventos que
+    contiene) para invalidar de una vez todas las claves que las comparten.
+    """
+
+    def __init__(self, tamano_maximo=500, variantes=3):
+        super().__init__(tamano_maximo)
+        self.variantes = variantes
+        self._claves_por_etiqueta = {}
+
+    def obtener_variante(self, clave):
+        """
+        Retorna una variante al azar, o None mientras la clave aún no tenga
+        todas sus variantes (el llamador debe generar una nueva).
+        """
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or len(entrada[0][0]) < self.variantes:
+                self.fallos += 1
+                return None
+
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return random.choice(entrada[0][0])
+
+    def agregar_variante(self, clave, valor, etiquetas=()):
+        """
+        Agrega ``valor`` a las variantes de ``clave``; si ya hay ``variantes``
+        se descarta la más antigua.
+        """
+        etiquetas = frozenset(etiquetas)
+        with self._lock:
+            entrada = self._datos.get(clave)
+            existentes = entrada[0][0] if entrada else ()
+            existentes = (existentes + (valor,))[-self.variantes:]
+            self._datos[clave] = ((existentes, etiquetas), None)
+            self._datos.move_to_end(clave)
+            for etiqueta in etiquetas:
+                self._claves_por_etiqueta.setdefault(etiqueta, set()).add(clave)
+            self._expulsar_sobrantes()
+
+    def variantes_de(self, clave):
+        """
+        Retorna la tupla de variantes guardadas para ``clave`` (vacía si no
+        hay), sin contar acierto ni fallo.
+        """
+        with self._lock:
+            entrada = self._datos.get(clave)
+            return entrada[0][0] if entrada else ()
+
+    def invalidar_etiqueta(self, etiqueta):
+        """
+        Elimina todas las claves que llevan ``etiqueta``.
+        """
+        with self._lock:
+            for clave in self._claves_por_etiqueta.pop(etiqueta, ()):
+                entrada = self._datos.pop(clave, None)
+                if entrada is not None:
+                    self._al_quitar(clave, entrada[0])
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._claves_por_etiqueta.clear()
+
+    def _al_quitar(self, clave, valor):
+        _, etiquetas = valor
+        for etiqueta in etiquetas:
+            claves = self._claves_por_etiqueta.get(etiqueta)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._claves_por_etiqueta[etiqueta]
@@ -0,0 +1,173 @@
+"""
+Caché en dos niveles para el pipeline del chatbot.
+
+El primer nivel (L1) es una ``CacheLRU`` en la memoria del proceso; el segundo
+(L2) es una caché de Django común a todos los procesos (settings.CACHES, la
+tabla de la base de datos o un directorio). Las lecturas buscan primero en L1
+y lo que encuentran en L2 lo copian a L1; las escrituras van a los dos.
+
+Las entradas se agrupan por espacio (intenciones, resumenes, faq, detalles),
+cada uno con su TTL y la opción de quedarse solo en L1. En L2 se guarda junto
+con el valor el instante en que expira, para que al copiarlo a L1 conserve el
+plazo que le queda y no uno nuevo.
+"""
+import hashlib
+import time
+
+from django.core.cache import caches
+
+from .cache_local import CacheLRU
+from .metricas import Contadores
+
+_FALTA = object()
+
+
+class CacheNiveles:
+    """
+    Caché L1 (proceso) + L2 (compartida) con TTL por espacio.
+
+    ``espacios`` es un diccionario {espacio: {'TTL': segundos, 'L2': bool}};
+    ``l1`` permite dar a un espacio su propia ``CacheLRU`` en lugar de la
+    común de ``tamano_l1`` entradas. Un fallo de L2 (por ejemplo, la tabla
+    aún no creada) cuenta como fallo de caché y se registra en
+    ``<espacio>.errores_l2``.
+    """
+
+    def __init__(self, alias_l2, espacios, tamano_l1=2000, l1=None):
+        self.alias_l2 = alias_l2
+        self.espacios = espacios
+        self._l1_comun = CacheLRU(tamano_maximo=tamano_l1)
+        self._l1 = dict(l1 or {})
+        # "<espacio>.l1", ".l2" (aciertos por nivel), ".fallos" y ".errores_l2"
+        self.contadores = Contadores()
+
+    def obtener(self, espacio, clave, defecto=None):
+        """
+        Retorna el valor guardado para ``clave`` en ``espacio``, buscando en
+        L1 y luego en L2, o ``defecto`` si no está en ninguno.
+        """
+        valor = self._cache_l1(espacio).obtener((espacio, clave), _FALTA)
+        if valor is not _FALTA:
+            self.contadores.incrementar(f'{espacio}.l1')
+            return valor
+
+        entrada = self._leer_l2(espacio, clave) if self._usa_l2(espacio) else None
+        if entrada is None:
+            self.contadores.incrementar(f'{espacio}.fallos')
+            return defecto
+
+        valor, expira_en = entrada
+        self._cache_l1(espacio).guardar((espacio, clave), valor, expira_en=expira_en)
+        self.contadores.incrementar(f'{espacio}.l2')
+        return valor
+
+    def guardar(self, espacio, clave, valor, expira_en=None):
+        """
+        Guarda ``valor`` en L1 y en L2 durante el TTL del espacio, o hasta
+        ``expira_en`` (timestamp) si es antes.
+        """
+        expira_en = self._expiracion(espacio, expira_en)
+        self._cache_l1(espacio).guardar((espacio, clave), valor, expira_en=expira_en)
+        if self._usa_l2(espacio):
+            self._escribir_l2(espacio, clave, valor, expira_en)
+
+    def obtener_o_calcular(self, espacio, clave, calcular, expira_en=None):
+        """
+        Retorna el valor guardado o, si no hay, el de ``calcular()``, que se
+        guarda salvo que sea None.
+        """
+        valor = self.obtener(espacio, clave, _FALTA)
+        if valor is _FALTA:
+            valor = calcular()
+            if valor is not None:
+                self.guardar(espacio, clave, valor, expira_en=expira_en)
+        return valor
+
+    def invalidar(self, espacio, clave):
+        self._cache_l1(espacio).invalidar((espacio, clave))
+        if self._usa_l2(espacio):
+            try:
+                caches[self.alias_l2].delete(self._clave_l2(espacio, clave))
+            except Exception:
+                self.contadores.incrementar(f'{espacio}.errores_l2')
+
+    def limpiar_local(self):
+        """
+        Vacía L1 (las cachés propias de cada espacio incluidas); L2 no se toca.
+        """
+        self._l1_comun.limpiar()
+        for cache in self._l1.values():
+            cache.limpiar()
+
+    # Acceso directo a L2, para espacios cuyo L1 no es una CacheLRU
+    # (los resúmenes guardan variantes en una CacheVariantes).
+
+    def obtener_l2(self, espacio, clave, defecto=None):
+        entrada = self._leer_l2(espacio, clave)
+        if entrada is None:
+            self.contadores.incrementar(f'{espacio}.fallos')
+            return defecto
+        self.contadores.incrementar(f'{espacio}.l2')
+        return entrada[0]
+
+    def guardar_l2(self, espacio, clave, valor):
+        self._escribir_l2(espacio, clave, valor, self._expiracion(espacio, None))
+
+    def registrar_acierto_l1(self, espacio):
+        self.contadores.incrementar(f'{espacio}.l1')
+
+    def estadisticas(self):
+        """
+        Aciertos por nivel, fallos y tasas de acierto de cada espacio, más el
+        estado del L1 común.
+        """
+        valores = self.contadores.valores()
+        resultado = {'l1_comun': self._l1_comun.estadisticas()}
+        for espacio in self.espacios:
+            l1 = valores.get(f'{espacio}.l1', 0)
+            l2 = valores.get(f'{espacio}.l2', 0)
+            fallos = valores.get(f'{espacio}.fallos', 0)
+            consultas = l1 + l2 + fallos
+            resultado[espacio] = {
+                'aciertos_l1': l1,
+                'aciertos_l2': l2,
+                'fallos': fallos,
+                'errores_l2': valores.get(f'{espacio}.errores_l2', 0),
+                'tasa_l1': l1 / consultas if consultas else 0.0,
+                'tasa_l2': l2 / consultas if consultas else 0.0,
+            }
+        return resultado
+
+    def _cache_l1(self, espacio):
+        return self._l1.get(espacio, self._l1_comun)
+
+    def _usa_l2(self, espacio):
+        return self.espacios[espacio].get('L2', True)
+
+    def _expiracion(self, espacio, expira_en):
+        limite = time.time() + self.espacios[espacio]['TTL']
+        return limite if expira_en is None else min(limite, expira_en)
+
+    def _clave_l2(self, espacio, clave):
+        # repr es estable entre procesos para las tuplas de cadenas, números
+        # y booleanos que se usan como claves
+        return f'{espacio}:{hashlib.sha1(repr(clave).encode()).hexdigest()}'
+
+    def _leer_l2(self, espacio, clave):
+        """
+        Retorna (valor, expira_en) desde L2, o None si no está o L2 falló.
+        """
+        try:
+            return caches[self.alias_l2].get(self._clave_l2(espacio, clave))
+        except Exception:
+            self.contadores.incrementar(f'{espacio}.errores_l2')
+            return None
+
+    def _escribir_l2(self, espacio, clave, valor, expira_en):
+        segundos = expira_en - time.time()
+        if segundos <= 0:
+            return
+        try:
+            caches[self.alias_l2].set(self._clave_l2(espacio, clave), (valor, expira_en), timeout=segundos)
+        except Exception:
+            self.contadores.incrementar(f'{espacio}.errores_l2')
@@ -0,0 +1,104 @@
+"""
+Calendario de eventos por día (modelo DiaEvento).
+
+Las consultas por fecha del chat ("hoy", "este fin de semana", un mes) deben
+incluir los eventos de varios días que ya estaban en curso: una feria de tres
+días que empezó ayer también es de hoy. Comparar fecha_inicio y fecha_fin a la
+vez obligaría a recorrer todos los eventos que empezaron antes del rango; en
+su lugar cada evento tiene una fila por día local en curso, y la consulta es
+un solo rango sobre el índice (dia, fecha_inicio, evento).
+
+Las filas se rehacen al guardar un evento (signals.py), por lote al importar
+(importacion.py) y al sembrar el catálogo sintético; lo que cambie las fechas
+de otra forma (``update()``, SQL directo) debe llamar a ``indexar_dias``. Los
+días dependen de settings.TIME_ZONE: si cambia, hay que rehacerlas todas con
+``python manage.py indexar_calendario``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import DiaEvento
+
+LOTE = 5000
+
+# Orden de filtrar_por_dias: equivale a (fecha_inicio, id) para la fila que
+# se elige de cada evento
+ORDEN_DIAS = ('dias__dia', 'dias__fecha_inicio', 'dias__evento_id')
+
+_MICROSEGUNDO = timedelta(microseconds=1)
+
+
+def dias_del_evento(fecha_inicio, fecha_fin, zona=None):
+    """
+    Primer y último día local en que el evento está en curso. Un fin a
+    medianoche no cuenta ese día, y los eventos sin fin (o con un fin
+    anterior al inicio) ocupan solo el día de inicio. Se limita a
+    settings.CALENDARIO_MAX_DIAS días, para que un fin mal cargado no llene
+    la tabla. ``zona`` evita buscar la zona actual en cada llamada.
+    """
+    primero = timezone.localdate(fecha_inicio, zona)
+    ultimo = primero
+    if fecha_fin is not None and fecha_fin > fecha_inicio:
+        ultimo = timezone.localdate(fecha_fin - _MICROSEGUNDO, zona)
+    return primero, min(ultimo, primero + timedelta(days=settings.CALENDARIO_MAX_DIAS - 1))
+
+
+def indexar_dias(eventos):
+    """
+    Rehace las filas de DiaEvento de los eventos de la QuerySet ``eventos``,
+    en una transacción. Inserta con una sentencia preparada por lote, como
+    catalogo_sintetico.py: con ``bulk_create`` adaptar cada fila cuesta más
+    que insertarla.
+    """
+    campos = [DiaEvento._meta.get_field(nombre) for nombre in ('evento', 'dia', 'primer_dia', 'fecha_inicio')]
+    nombre = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        nombre(DiaEvento._meta.db_table),
+        ', '.join(nombre(campo.column) for campo in campos),
+        ', '.join(['%s'] * len(campos)),
+    )
+    adaptar_dia = connection.ops.adapt_datefield_value
+    adaptar_fecha = connection.ops.adapt_datetimefield_value
+
+    with transaction.atomic():
+        DiaEvento.objects.filter(evento__in=eventos.values('pk')).delete()
+        fechas = eventos.order_by().values_list('pk', 'fecha_inicio', 'fecha_fin').iterator(chunk_size=LOTE)
+        filas = []
+        with connection.cursor() as cursor:
+            for pk, fecha_inicio, fecha_fin in fechas:
+                primero, ultimo = dias_del_evento(fecha_inicio, fecha_fin)
+                inicio, primer_dia = adaptar_fecha(fecha_inicio), adaptar_dia(primero)
+                for numero in range((ultimo - primero).days + 1):
+                    filas.append((pk, adaptar_dia(primero + timedelta(days=numero)), primer_dia, inicio))
+                if len(filas) >= LOTE:
+                    cursor.executemany(sql, filas)
+                    filas = []
+            if filas:
+                cursor.executemany(sql, filas)
+
+
+def filtrar_por_dias(query, desde, hasta=None):
+    """
+    Los eventos de ``query`` en curso algún día desde ``desde`` hasta
+    ``hasta`` (fechas locales, ``hasta`` excluido y None sin límite),
+    ordenados por (fecha_inicio, id).
+
+    De cada evento se toma una fila: la del día ``desde`` si ya estaba en
+    curso, si no la de su día de inicio. Para esas filas el orden (dia,
+    fecha_inicio, evento) es el mismo que (fecha_inicio, id), así que sale del
+    índice sin ordenar los resultados.
+    """
+    # En un solo filter() para que todas las condiciones usen la misma fila
+    dias = Q(dias__dia__gte=desde) & (Q(dias__dia=desde) | Q(dias__dia=F('dias__primer_dia')))
+    if hasta is not None:
+        dias &= Q(dias__dia__lt=hasta)
+    return query.filter(dias).order_by(*ORDEN_DIAS)
+
+
+def es_consulta_por_dias(query):
+    return tuple(query.query.order_by[:1]) == ORDEN_DIAS[:1]
+
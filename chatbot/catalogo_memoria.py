@@ -0,0 +1,441 @@
+"""
+Catálogo de los eventos activos en la memoria del proceso, para responder
+``ejecutar_consulta_eventos`` sin consultar la base de datos.
+
+Los eventos se guardan en columnas compactas (``array``) ordenadas por
+(fecha_inicio, id), el mismo orden de la consulta del ORM: los rangos de
+fechas se resuelven por bisección (más los eventos de varios días ya en curso
+al empezar el rango, cuando la consulta es por días), y las categorías y los
+eventos gratuitos
+con mapas de bits precalculados (un entero de Python con un bit por
+posición). La ubicación y el precio máximo se comprueban evento por evento,
+solo hasta llenar la página. Las búsquedas de texto piden el ranking al índice
+de texto completo (busqueda.py) y toman los datos de aquí.
+
+Se carga completo la primera vez que se usa y después se actualiza evento por
+evento con las señales post_save y post_delete, al confirmarse la
+transacción (signals.py). Los cambios que no emiten señales (``update()``,
+``bulk_create``, SQL directo) no se ven hasta llamar a ``descartar``.
+"""
+import bisect
+import itertools
+import math
+import sys
+import threading
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models.functions import Left
+
+from .busqueda import ids_por_relevancia, valores_relevancia
+from .calendario import dias_del_evento
+from .models import Evento
+
+
+_EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSEGUNDO = timedelta(microseconds=1)
+
+_CATEGORIAS = [clave for clave, _ in Evento.CATEGORIA_CHOICES]
+_CODIGO_CATEGORIA = {clave: codigo for codigo, clave in enumerate(_CATEGORIAS)}
+
+# icontains distingue mayúsculas según el motor: el LIKE de SQLite solo las
+# ignora en letras ASCII y PostgreSQL compara con UPPER()
+_MINUSCULAS_ASCII = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def _plegar(texto):
+    if connection.vendor == 'sqlite':
+        return texto.translate(_MINUSCULAS_ASCII)
+    return texto.upper()
+
+
+def _a_microsegundos(fecha):
+    return (fecha - _EPOCA) // _MICROSEGUNDO
+
+
+def _de_microsegundos(valor):
+    return _EPOCA + timedelta(microseconds=valor)
+
+
+def _a_centavos(precio):
+    return int(precio.scaleb(2))
+
+
+def _mapa_de_bits(posiciones, total):
+    bits = bytearray((total + 7) // 8)
+    for posicion in posiciones:
+        bits[posicion >> 3] |= 1 << (posicion & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _insertar_bit(mapa, posicion, valor):
+    bajos = mapa & ((1 << posicion) - 1)
+    return bajos | ((mapa >> posicion) << (posicion + 1)) | (int(valor) << posicion)
+
+
+def _quitar_bit(mapa, posicion):
+    bajos = mapa & ((1 << posicion) - 1)
+    return bajos | ((mapa >> (posicion + 1)) << posicion)
+
+
+def _bits_en(mapa, desde, hasta):
+    """
+    Posiciones con el bit encendido en ``mapa``, de ``desde`` a ``hasta`` (excluido).
+    """
+    mapa = (mapa >> desde) & ((1 << max(hasta - desde, 0)) - 1)
+    while mapa:
+        bit = mapa & -mapa
+        yield desde + bit.bit_length() - 1
+        mapa ^= bit
+
+
+class CatalogoMemoria:
+    """
+    Eventos activos en columnas ordenadas por (fecha_inicio, id). ``consultar``
+    recibe los criterios de ``evento_queries.criterios_consulta`` y retorna
+    una ``ConsultaMemoria`` que se pagina igual que la consulta del ORM, con
+    eventos cargados como los de ``proyeccion_tarjetas``.
+    """
+
+    def __init__(self, campos, largo_descripcion):
+        # campos: columnas de las tarjetas (evento_queries.CAMPOS_TARJETA)
+        self.campos = tuple(campos)
+        self.largo_descripcion = largo_descripcion
+        self._nombres = [
+            campo.attname for campo in Evento._meta.concrete_fields if campo.name in self.campos
+        ]
+        # Columnas que se guardan como texto (las numéricas van en arrays propios)
+        self._campos_texto = [
+            nombre for nombre in self._nombres
+            if nombre not in ('id', 'fecha_inicio', 'fecha_actualizacion', 'precio', 'categoria')
+        ]
+        self._lock = threading.RLock()
+        self._vaciar()
+
+    @property
+    def cargado(self):
+        return self._cargado
+
+    def descartar(self):
+        """
+        Olvida los eventos; se vuelven a cargar en la siguiente consulta.
+        """
+        with self._lock:
+            self._vaciar()
+
+    def _vaciar(self):
+        self._cargado = False
+        self._ids = array('q')
+        self._fechas = array('q')
+        self._actualizaciones = array('q')
+        self._precios = array('q')
+        self._categorias = array('B')
+        self._textos = {nombre: [] for nombre in self._campos_texto}
+        self._descripciones = []
+        # Ubicación y dirección ya pasadas por _plegar, para el filtro por
+        # ubicación; internadas para que los textos repetidos no ocupen más
+        self._ubicaciones_plegadas = []
+        self._direcciones_plegadas = []
+        self._mapas_categoria = {}
+        self._mapa_gratuitos = 0
+        self._fecha_por_id = {}
+        # Último día en curso (ordinal de la fecha local) de los eventos que
+        # duran más de un día, para las consultas por días (calendario.py)
+        self._ultimo_dia_por_id = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _consulta_filas(self):
+        return (
+            Evento.objects.filter(activo=True)
+            .annotate(descripcion_corta=Left('descripcion', self.largo_descripcion))
+            .values_list(*self._nombres, 'descripcion_corta', 'direccion', 'fecha_fin')
+        )
+
+    def _cargar(self):
+        # Debe llamarse con el lock tomado
+        self._vaciar()
+        por_categoria = {}
+        gratuitos = []
+        filas = self._consulta_filas().order_by('fecha_inicio', 'id').iterator(chunk_size=5000)
+        for posicion, fila in enumerate(filas):
+            self._agregar_al_final(fila)
+            codigo = self._categorias[-1]
+            por_categoria.setdefault(codigo, []).append(posicion)
+            if self._precios[-1] == 0:
+                gratuitos.append(posicion)
+        total = len(self._ids)
+        self._mapas_categoria = {
+            codigo: _mapa_de_bits(posiciones, total) for codigo, posiciones in por_categoria.items()
+        }
+        self._mapa_gratuitos = _mapa_de_bits(gratuitos, total)
+        self._cargado = True
+
+    def _valores(self, fila):
+        valores = dict(zip(self._nombres, fila))
+        return (
+            valores,
+            _a_microsegundos(valores['fecha_inicio']),
+            _CODIGO_CATEGORIA[valores['categoria']],
+            fila[-3] or '',
+            sys.intern(_plegar(valores['ubicacion'] or '')),
+            sys.intern(_plegar(fila[-2] or '')),
+        )
+
+    def _registrar_dias(self, pk, fecha_inicio, fecha_fin):
+        primero, ultimo = dias_del_evento(fecha_inicio, fecha_fin)
+        if ultimo > primero:
+            self._ultimo_dia_por_id[pk] = ultimo.toordinal()
+
+    def _agregar_al_final(self, fila):
+        valores, fecha, codigo, descripcion, ubicacion, direccion = self._valores(fila)
+        self._registrar_dias(valores['id'], valores['fecha_inicio'], fila[-1])
+        self._ids.append(valores['id'])
+        self._fechas.append(fecha)
+        self._actualizaciones.append(_a_microsegundos(valores['fecha_actualizacion']))
+        self._precios.append(_a_centavos(valores['precio']))
+        self._categorias.append(codigo)
+        for nombre in self._campos_texto:
+            self._textos[nombre].append(valores[nombre])
+        self._descripciones.append(descripcion)
+        self._ubicaciones_plegadas.append(ubicacion)
+        self._direcciones_plegadas.append(direccion)
+        self._fecha_por_id[valores['id']] = fecha
+
+    def recargar_evento(self, pk):
+        """
+        Vuelve a leer el evento ``pk`` de la base de datos y lo agrega, lo
+        mueve o lo quita (si ya no existe o no está activo). No hace nada si
+        el catálogo aún no se cargó.
+        """
+        with self._lock:
+            if not self._cargado:
+                return
+            self._quitar(pk)
+            fila = self._consulta_filas().filter(id=pk).first()
+            if fila is not None:
+                self._insertar(fila)
+
+    def _posicion(self, pk):
+        fecha = self._fecha_por_id.get(pk)
+        if fecha is None:
+            return None
+        posicion = bisect.bisect_left(self._fechas, fecha)
+        while self._ids[posicion] != pk:
+            posicion += 1
+        return posicion
+
+    def _quitar(self, pk):
+        posicion = self._posicion(pk)
+        if posicion is None:
+            return
+        codigo = self._categorias[posicion]
+        for columna in (self._ids, self._fechas, self._actualizaciones, self._precios, self._categorias,
+                        self._descripciones, self._ubicaciones_plegadas, self._direcciones_plegadas,
+                        *self._textos.values()):
+            del columna[posicion]
+        for clave, mapa in self._mapas_categoria.items():
+            self._mapas_categoria[clave] = _quitar_bit(mapa, posicion)
+        self._mapa_gratuitos = _quitar_bit(self._mapa_gratuitos, posicion)
+        del self._fecha_por_id[pk]
+        self._ultimo_dia_por_id.pop(pk, None)
+
+    def _insertar(self, fila):
+        valores, fecha, codigo, descripcion, ubicacion, direccion = self._valores(fila)
+        pk = valores['id']
+        self._registrar_dias(pk, valores['fecha_inicio'], fila[-1])
+        # Después de los de la misma fecha con menor id
+        posicion = bisect.bisect_left(self._fechas, fecha)
+        while posicion < len(self._ids) and self._fechas[posicion] == fecha and self._ids[posicion] < pk:
+            posicion += 1
+
+        precio = _a_centavos(valores['precio'])
+        self._ids.insert(posicion, pk)
+        self._fechas.insert(posicion, fecha)
+        self._actualizaciones.insert(posicion, _a_microsegundos(valores['fecha_actualizacion']))
+        self._precios.insert(posicion, precio)
+        self._categorias.insert(posicion, codigo)
+        for nombre in self._campos_texto:
+            self._textos[nombre].insert(posicion, valores[nombre])
+        self._descripciones.insert(posicion, descripcion)
+        self._ubicaciones_plegadas.insert(posicion, ubicacion)
+        self._direcciones_plegadas.insert(posicion, direccion)
+        self._mapas_categoria.setdefault(codigo, 0)
+        for clave, mapa in self._mapas_categoria.items():
+            self._mapas_categoria[clave] = _insertar_bit(mapa, posicion, clave == codigo)
+        self._mapa_gratuitos = _insertar_bit(self._mapa_gratuitos, posicion, precio == 0)
+        self._fecha_por_id[pk] = fecha
+
+    def consultar(self, criterios):
+        """
+        Retorna la ``ConsultaMemoria`` para ``criterios``, o None si hay que
+        usar el ORM: búsquedas de texto sin índice de texto completo, que
+        comparan la descripción completa.
+        """
+        ranking = None
+        if criterios['texto']:
+            ids = ids_por_relevancia(criterios['texto'])
+            if ids is None:
+                return None
+            ranking = valores_relevancia(ids)
+
+        with self._lock:
+            if not self._cargado:
+                self._cargar()
+        return ConsultaMemoria(self, criterios, ranking)
+
+    def _evento(self, posicion, relevancia=None):
+        # Debe llamarse con el lock tomado
+        valores = {
+            'id': self._ids[posicion],
+            'fecha_inicio': _de_microsegundos(self._fechas[posicion]),
+            'fecha_actualizacion': _de_microsegundos(self._actualizaciones[posicion]),
+            'precio': Decimal(self._precios[posicion]).scaleb(-2),
+            'categoria': _CATEGORIAS[self._categorias[posicion]],
+        }
+        for nombre in self._campos_texto:
+            valores[nombre] = self._textos[nombre][posicion]
+        evento = Evento.from_db(connection.alias, self._nombres, [valores[nombre] for nombre in self._nombres])
+        evento.descripcion_corta = self._descripciones[posicion]
+        if relevancia is not None:
+            evento.relevancia = relevancia
+        return evento
+
+
+class ConsultaMemoria:
+    """
+    Resultado de ``CatalogoMemoria.consultar``. ``campo_orden`` es el primer
+    campo del orden, como en la consulta del ORM: 'fecha_inicio', o
+    'relevancia' en las búsquedas de texto.
+    """
+
+    def __init__(self, catalogo, criterios, ranking=None):
+        self.catalogo = catalogo
+        self.criterios = criterios
+        self.ranking = ranking
+        self.campo_orden = 'relevancia' if ranking is not None else 'fecha_inicio'
+
+    def pagina(self, posicion, cantidad):
+        """
+        Hasta ``cantidad`` eventos después de ``posicion`` (valor del campo de
+        orden e id del último evento ya mostrado), o los primeros.
+        """
+        catalogo = self.catalogo
+        with catalogo._lock:
+            if not catalogo._cargado:
+                catalogo._cargar()
+            if self.criterios['vacio']:
+                return []
+            if self.ranking is not None:
+                return self._pagina_por_relevancia(posicion, cantidad)
+
+            desde, hasta = self._rango()
+            en_curso = self._en_curso(desde)
+            if posicion is not None:
+                valor, pk = posicion
+                fecha = _a_microsegundos(valor)
+                siguiente = bisect.bisect_left(catalogo._fechas, fecha, 0, hasta)
+                while siguiente < hasta and catalogo._fechas[siguiente] == fecha and catalogo._ids[siguiente] <= pk:
+                    siguiente += 1
+                desde = max(desde, siguiente)
+                en_curso = [indice for indice in en_curso if indice >= siguiente]
+
+            mapa = self._mapa()
+            candidatas = range(desde, hasta) if mapa is None else _bits_en(mapa, desde, hasta)
+            if en_curso:
+                if mapa is not None:
+                    en_curso = [indice for indice in en_curso if mapa >> indice & 1]
+                candidatas = itertools.chain(en_curso, candidatas)
+            cumple = self._condicion()
+            if cumple is not None:
+                candidatas = filter(cumple, candidatas)
+            return [catalogo._evento(indice) for indice in itertools.islice(candidatas, cantidad)]
+
+    def _rango(self):
+        fechas = self.catalogo._fechas
+        desde, hasta = 0, len(fechas)
+        if self.criterios['desde'] is not None:
+            desde = bisect.bisect_left(fechas, _a_microsegundos(self.criterios['desde']))
+        if self.criterios['hasta'] is not None:
+            limite = _a_microsegundos(self.criterios['hasta'])
+            if self.criterios['hasta_incluido']:
+                hasta = bisect.bisect_right(fechas, limite)
+            else:
+                hasta = bisect.bisect_left(fechas, limite)
+        return desde, hasta
+
+    def _en_curso(self, desde):
+        """
+        En las consultas por días, posiciones (anteriores a ``desde``, en
+        orden) de los eventos que empezaron antes del primer día y siguen en
+        curso ese día. Van antes que los del rango, como en el ORM.
+        """
+        if self.criterios['dias'] is None:
+            return []
+        catalogo = self.catalogo
+        primer_dia = self.criterios['dias'][0].toordinal()
+        posiciones = (
+            catalogo._posicion(pk) for pk, ultimo in catalogo._ultimo_dia_por_id.items() if ultimo >= primer_dia
+        )
+        return sorted(posicion for posicion in posiciones if posicion < desde)
+
+    def _mapa(self):
+        """
+        Mapa de bits de las posiciones que cumplen los filtros de categoría y
+        de eventos gratuitos, o None si no hay ninguno.
+        """
+        mapa = None
+        if self.criterios['categoria']:
+            codigo = _CODIGO_CATEGORIA.get(self.criterios['categoria'])
+            mapa = self.catalogo._mapas_categoria.get(codigo, 0)
+        if self.criterios['solo_gratuitos']:
+            gratuitos = self.catalogo._mapa_gratuitos
+            mapa = gratuitos if mapa is None else mapa & gratuitos
+        return mapa
+
+    def _condicion(self):
+        """
+        Función que dice si la posición cumple los filtros que se comprueban
+        evento por evento (ubicación y precio máximo), o None si no hay
+        ninguno. Se llama una vez por evento recorrido: se arma sin capas de
+        más para que recorrer todo el catálogo siga siendo barato.
+        """
+        catalogo = self.catalogo
+        por_ubicacion = por_precio = None
+        if self.criterios['ubicacion']:
+            buscada = _plegar(self.criterios['ubicacion'])
+            ubicaciones = catalogo._ubicaciones_plegadas
+            direcciones = catalogo._direcciones_plegadas
+
+            def por_ubicacion(indice):
+                return buscada in ubicaciones[indice] or buscada in direcciones[indice]
+
+        if self.criterios['precio_maximo'] is not None:
+            # Los precios están en centavos enteros
+            tope = math.floor(self.criterios['precio_maximo'].scaleb(2))
+            precios = catalogo._precios
+
+            def por_precio(indice):
+                return precios[indice] <= tope or precios[indice] == 0
+
+        if por_ubicacion and por_precio:
+            return lambda indice: por_ubicacion(indice) and por_precio(indice)
+        return por_ubicacion or por_precio
+
+    def _pagina_por_relevancia(self, posicion, cantidad):
+        # Debe llamarse con el lock tomado
+        catalogo = self.catalogo
+        cumple = self._condicion() or (lambda indice: True)
+        elegidas = []
+        for pk, relevancia in self.ranking.items():
+            if posicion is not None and (relevancia, pk) <= tuple(posicion):
+                continue
+            indice = catalogo._posicion(pk)
+            if indice is not None and cumple(indice):
+                elegidas.append((indice, relevancia))
+                if len(elegidas) == cantidad:
+                    break
+        return [catalogo._evento(indice, relevancia) for indice, relevancia in elegidas]
@@ -0,0 +1,99 @@
+"""
+Catálogo sintético de eventos para pruebas de rendimiento y benchmarks.
+
+Genera títulos, descripciones y ubicaciones con vocabulario de eventos de Loja
+(con tildes), fechas repartidas en dos años alrededor de hoy, un 10% de
+eventos de varios días (ferias y festivales de hasta cuatro), un 20% de
+eventos gratuitos y un 5% de inactivos.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .busqueda import carga_masiva
+from .calendario import indexar_dias
+from .models import DiaEvento, Evento, normalizar_titulo
+
+
+TIPOS = [
+    'Concierto', 'Festival', 'Obra de teatro', 'Feria', 'Taller',
+    'Exposición', 'Conferencia', 'Torneo', 'Recital', 'Muestra',
+]
+TEMAS = [
+    'música andina', 'rock nacional', 'danza folclórica', 'gastronomía lojana',
+    'arte contemporáneo', 'cine ecuatoriano', 'fotografía', 'ciencia',
+    'ajedrez', 'poesía', 'jazz', 'artesanías',
+]
+LUGARES = [
+    'Teatro Bolívar', 'Parque Jipiro', 'Puerta de la Ciudad', 'Plaza San Sebastián',
+    'Casa de la Cultura', 'Coliseo Ciudad de Loja', 'Parque Central',
+    'Universidad Nacional de Loja',
+]
+
+LOTE = 10_000
+
+
+def sembrar_eventos(total, desde=0):
+    """
+    Inserta los eventos ``desde`` .. ``total - 1`` del catálogo en lotes con
+    una sentencia preparada (con el ORM, cien mil filas tardan varias veces
+    más). Los valores se adaptan con los propios campos del modelo, así que
+    sirve en cualquier motor. Al terminar llena el calendario por día de los
+    eventos nuevos y actualiza las estadísticas del planificador con ANALYZE.
+    """
+    campos = [campo for campo in Evento._meta.concrete_fields if not campo.primary_key]
+    posicion = {campo.name: indice for indice, campo in enumerate(campos)}
+    por_nombre = {campo.name: campo for campo in campos}
+    ahora = timezone.now()
+    fijos = {'fecha_creacion': ahora, 'fecha_actualizacion': ahora}
+    base = [
+        campo.get_db_prep_save(fijos[campo.name] if campo.name in fijos else campo.get_default(), connection)
+        for campo in campos
+    ]
+    categorias = [clave for clave, _ in Evento.CATEGORIA_CHOICES]
+    precios = [por_nombre['precio'].get_db_prep_save(Decimal(valor), connection) for valor in range(50)]
+    minutos_por_anio = 365 * 24 * 60
+
+    def fila(indice):
+        tipo = TIPOS[indice % len(TIPOS)]
+        tema = TEMAS[(indice // len(TIPOS)) % len(TEMAS)]
+        lugar = LUGARES[(indice * 7) % len(LUGARES)]
+        inicio = ahora + timedelta(minutes=(indice * 7919) % (2 * minutos_por_anio) - minutos_por_anio)
+        valores = list(base)
+        titulo = f'{tipo} de {tema} #{indice}'
+        valores[posicion['titulo']] = titulo
+        valores[posicion['titulo_normalizado']] = normalizar_titulo(titulo)
+        valores[posicion['descripcion']] = (
+            f'{tipo} de {tema} en {lugar}. Una jornada para disfrutar en familia '
+            f'con artistas y colectivos locales de la ciudad de Loja.'
+        )
+        valores[posicion['categoria']] = categorias[indice % len(categorias)]
+        valores[posicion['fecha_inicio']] = por_nombre['fecha_inicio'].get_db_prep_save(inicio, connection)
+        if indice % 10 == 3:
+            fin = inicio + timedelta(days=indice % 4 + 1)
+            valores[posicion['fecha_fin']] = por_nombre['fecha_fin'].get_db_prep_save(fin, connection)
+        valores[posicion['ubicacion']] = lugar
+        valores[posicion['precio']] = precios[0 if indice % 5 == 0 else indice % 50]
+        valores[posicion['activo']] = indice % 20 != 0
+        return valores
+
+    nombre = connection.ops.quote_name
+    tabla = nombre(Evento._meta.db_table)
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        tabla,
+        ', '.join(nombre(campo.column) for campo in campos),
+        ', '.join(['%s'] * len(campos)),
+    )
+    ultimo_id = Evento.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    with transaction.atomic(), carga_masiva():
+        for inicio_lote in range(desde, total, LOTE):
+            filas = [fila(indice) for indice in range(inicio_lote, min(inicio_lote + LOTE, total))]
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, filas)
+        indexar_dias(Evento.objects.filter(id__gt=ultimo_id))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'ANALYZE {tabla}')
+        cursor.execute(f'ANALYZE {nombre(DiaEvento._meta.db_table)}')
@@ -0,0 +1,109 @@
+"""
+Interruptor de circuito (circuit breaker) para servicios externos como Gemini.
+"""
+import threading
+import time
+
+
+class CircuitoAbierto(Exception):
+    """
+    Se lanza en lugar de llamar al servicio mientras el circuito está abierto.
+    """
+
+
+class Circuito:
+    """
+    Interruptor de circuito seguro entre hilos.
+
+    Tras ``umbral_fallos`` fallos consecutivos se abre y rechaza las llamadas
+    durante ``enfriamiento`` segundos. Después deja pasar una sola llamada de
+    prueba (semiabierto): si funciona se cierra y si falla se vuelve a abrir.
+    """
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    SEMIABIERTO = 'semiabierto'
+
+    def __init__(self, umbral_fallos=5, enfriamiento=30.0):
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+        self._estado = self.CERRADO
+        self._fallos_consecutivos = 0
+        self._abierto_desde = None
+        self._sonda_desde = None
+        self._lock = threading.Lock()
+        self.aperturas = 0
+        self.rechazadas = 0
+
+    def permitir(self):
+        """
+        Indica si se puede llamar al servicio ahora. En estado semiabierto
+        solo deja pasar una llamada de prueba por periodo de enfriamiento.
+        """
+        with self._lock:
+            if self._estado == self.CERRADO:
+                return True
+
+            ahora = time.monotonic()
+            if self._estado == self.ABIERTO:
+                if ahora - self._abierto_desde < self.enfriamiento:
+                    self.rechazadas += 1
+                    return False
+                self._estado = self.SEMIABIERTO
+            elif self._sonda_desde is not None and ahora - self._sonda_desde < self.enfriamiento:
+                # Ya hay una llamada de prueba en curso
+                self.rechazadas += 1
+                return False
+
+            self._sonda_desde = ahora
+            return True
+
+    def verificar(self):
+        """
+        Como ``permitir`` pero lanza ``CircuitoAbierto`` si no se puede llamar.
+        """
+        if not self.permitir():
+            raise CircuitoAbierto('Circuito abierto: se omite la llamada al servicio')
+
+    def registrar_exito(self):
+        with self._lock:
+            self._estado = self.CERRADO
+            self._fallos_consecutivos = 0
+            self._sonda_desde = None
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos_consecutivos += 1
+            debe_abrir = (
+                self._estado == self.SEMIABIERTO
+                or (self._estado == self.CERRADO and self._fallos_consecutivos >= self.umbral_fallos)
+            )
+            if debe_abrir:
+                self._estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+                self._sonda_desde = None
+                self.aperturas += 1
+
+    def reiniciar(self):
+        with self._lock:
+            self._estado = self.CERRADO
+            self._fallos_consecutivos = 0
+            self._abierto_desde = None
+            self._sonda_desde = None
+            self.aperturas = 0
+            self.rechazadas = 0
+
+    def estadisticas(self):
+        """
+        Retorna el estado del circuito y sus contadores para monitoreo.
+        """
+        with self._lock:
+            reabre_en = 0.0
+            if self._estado == self.ABIERTO:
+                reabre_en = max(0.0, self.enfriamiento - (time.monotonic() - self._abierto_desde))
+            return {
+                'estado': self._estado,
+                'fallos_consecutivos': self._fallos_consecutivos,
+                'aperturas': self.aperturas,
+                'rechazadas': self.rechazadas,
+                'reabre_en': round(reabre_en, 1),
+            }
@@ -0,0 +1,205 @@
+"""
+Coalescencia de peticiones idénticas en curso (single-flight).
+
+La primera petición con una clave hace el trabajo (líder) y publica sus
+partes a medida que las produce; las que llegan con la misma clave mientras
+tanto (seguidores) reciben esas mismas partes en lugar de repetir el trabajo.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from collections import Counter
+
+
+class VueloCancelado(Exception):
+    """
+    Lo reciben los seguidores cuando el líder se interrumpe con algo que no es
+    un error propio (cancelación de la tarea, cierre del generador).
+    """
+
+
+class Vuelo:
+    """
+    Trabajo en curso de un líder, seguido desde otros hilos.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.terminado = False
+        self.error = None
+        self.seguidores = 0
+        # Llamadas a servicios externos que hizo el líder, por tipo
+        self.llamadas = Counter()
+        self._condicion = threading.Condition()
+
+    def publicar(self, parte):
+        with self._condicion:
+            self.partes.append(parte)
+            self._condicion.notify_all()
+
+    def _marcar_terminado(self, error=None):
+        with self._condicion:
+            self.terminado = True
+            self.error = error
+            self._condicion.notify_all()
+
+    def seguir(self, espera_maxima):
+        """
+        Itera las partes publicadas y espera las nuevas hasta que el líder
+        termine. Relanza el error del líder, o ``TimeoutError`` si pasan
+        ``espera_maxima`` segundos sin novedades.
+        """
+        indice = 0
+        while True:
+            with self._condicion:
+                limite = time.monotonic() + espera_maxima
+                while indice >= len(self.partes) and not self.terminado:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise TimeoutError('El líder de la petición coalescida no respondió a tiempo')
+                    self._condicion.wait(restante)
+                nuevas = self.partes[indice:]
+                terminado, error = self.terminado, self.error
+
+            indice += len(nuevas)
+            yield from nuevas
+            if terminado:
+                # Si el líder falló sin publicar nada, el seguidor falla igual
+                if error is not None and indice == 0:
+                    raise error
+                return
+
+
+class VueloAsync:
+    """
+    Trabajo en curso de un líder, seguido desde corrutinas del mismo event loop.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.terminado = False
+        self.error = None
+        self.seguidores = 0
+        self.llamadas = Counter()
+        self.loop = asyncio.get_running_loop()
+        self._cambio = asyncio.Event()
+
+    def _avisar(self):
+        cambio, self._cambio = self._cambio, asyncio.Event()
+        cambio.set()
+
+    def publicar(self, parte):
+        self.partes.append(parte)
+        self._avisar()
+
+    def _marcar_terminado(self, error=None):
+        self.terminado = True
+        self.error = error
+        # Django cierra las respuestas desde un hilo (sync_to_async), y los
+        # eventos de asyncio solo se tocan desde su loop
+        try:
+            en_el_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            en_el_loop = False
+        if en_el_loop:
+            self._avisar()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._avisar)
+
+    async def seguir(self, espera_maxima):
+        """
+        Versión asíncrona de ``Vuelo.seguir``.
+        """
+        indice = 0
+        while True:
+            if indice >= len(self.partes) and not self.terminado:
+                try:
+                    await asyncio.wait_for(self._cambio.wait(), espera_maxima)
+                except asyncio.TimeoutError:
+                    raise TimeoutError('El líder de la petición coalescida no respondió a tiempo')
+                continue
+
+            nuevas = self.partes[indice:]
+            terminado = self.terminado
+            indice += len(nuevas)
+            for parte in nuevas:
+                yield parte
+            if terminado and indice >= len(self.partes):
+                if self.error is not None and indice == 0:
+                    raise self.error
+                return
+
+
+class Vuelos:
+    """
+    Registro de vuelos en curso por clave, para hilos (``unirse``) y para
+    corrutinas (``unirse_async``, uno por event loop).
+
+    Lleva contadores de líderes, seguidores y llamadas a servicios externos
+    evitadas (las que hizo cada líder, una vez por seguidor).
+    """
+
+    def __init__(self):
+        self._vuelos = {}
+        self._vuelos_async = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.lideres = 0
+        self.seguidores = 0
+        self.llamadas_evitadas = 0
+
+    def unirse(self, clave):
+        """
+        Retorna (vuelo, es_lider). El líder debe llamar a ``terminar`` al
+        acabar, con o sin error.
+        """
+        with self._lock:
+            return self._unirse(self._vuelos, clave, Vuelo)
+
+    def unirse_async(self, clave):
+        """
+        Como ``unirse`` pero para el event loop actual.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            vuelos = self._vuelos_async.setdefault(loop, {})
+            return self._unirse(vuelos, clave, VueloAsync)
+
+    def _unirse(self, vuelos, clave, clase):
+        vuelo = vuelos.get(clave)
+        if vuelo is not None:
+            vuelo.seguidores += 1
+            self.seguidores += 1
+            return vuelo, False
+
+        vuelo = clase()
+        vuelos[clave] = vuelo
+        self.lideres += 1
+        return vuelo, True
+
+    def terminar(self, clave, vuelo, error=None):
+        """
+        Retira el vuelo del registro y avisa a sus seguidores. Se puede llamar
+        desde cualquier hilo; un ``error`` que no hereda de Exception (como
+        ``asyncio.CancelledError``) les llega como ``VueloCancelado``.
+        """
+        if error is not None and not isinstance(error, Exception):
+            error = VueloCancelado(f'La petición líder se interrumpió ({type(error).__name__})')
+        with self._lock:
+            if isinstance(vuelo, VueloAsync):
+                vuelos = self._vuelos_async.get(vuelo.loop, {})
+            else:
+                vuelos = self._vuelos
+            if vuelos.get(clave) is vuelo:
+                del vuelos[clave]
+            self.llamadas_evitadas += sum(vuelo.llamadas.values()) * vuelo.seguidores
+        vuelo._marcar_terminado(error)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'lideres': self.lideres,
+                'seguidores': self.seguidores,
+                'llamadas_evitadas': self.llamadas_evitadas,
+                'en_curso': len(self._vuelos) + sum(len(v) for v in self._vuelos_async.values()),
+            }
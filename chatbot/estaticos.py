@@ -0,0 +1,179 @@
+"""
+Construcción y servicio de los archivos estáticos.
+
+``AlmacenEstaticos`` es el almacenamiento de ``collectstatic``: además de
+copiar cada archivo con el hash de su contenido en el nombre
+(``ManifestStaticFilesStorage``), convierte los GIF animados a WebP animado
+(la mascota pasa de megabytes a cientos de kilobytes, con su transparencia)
+y guarda junto a cada CSS, JS o SVG su versión comprimida con gzip y, si
+está instalado el paquete ``brotli``, con Brotli. Las variantes WebP también
+quedan en el manifiesto, con hash, y la plantilla las ofrece con la etiqueta
+``imagen_animada`` (templatetags/estaticos.py) y el GIF como respaldo.
+
+``servir_estatico`` sirve STATIC_ROOT con DEBUG=False cuando no hay un
+servidor web delante: elige la versión comprimida según Accept-Encoding y
+marca los archivos con hash como inmutables por un año (su URL cambia si
+cambia el contenido). ``python manage.py construir_estaticos`` ejecuta
+collectstatic y reporta cuántos bytes se ahorran por archivo.
+"""
+import functools
+import gzip
+import io
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import Http404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.static import serve
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:  # opcional: sin él solo se genera la versión gzip
+    brotli = None
+
+# Extensión de cada versión comprimida, en orden de preferencia al servir
+# (codificación de Accept-Encoding, extensión)
+CODIFICACIONES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def nombre_webp(nombre):
+    """'images/mascota.gif' -> 'images/mascota.webp'"""
+    return posixpath.splitext(nombre)[0] + '.webp'
+
+
+def es_comprimible(nombre):
+    return posixpath.splitext(nombre)[1].lower() in settings.ESTATICOS['COMPRIMIR']
+
+
+class AlmacenEstaticos(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage que, al terminar collectstatic, agrega la
+    variante WebP de cada GIF animado y las versiones .gz y .br de los
+    archivos de texto.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        for nombre in sorted(paths):
+            if nombre.lower().endswith('.gif'):
+                webp = self._transcodificar(nombre)
+                if webp:
+                    yield nombre, webp, True
+        self.save_manifest()
+
+        for nombre, con_hash in self.hashed_files.items():
+            if es_comprimible(nombre):
+                self._comprimir(con_hash)
+
+    def _transcodificar(self, nombre):
+        """
+        Guarda la variante WebP animada del GIF ``nombre`` (con el hash de su
+        contenido) y la agrega al manifiesto. Retorna su nombre, o None si no
+        es una animación o no resulta más liviana que el GIF.
+        """
+        ajustes = settings.ESTATICOS
+        with self.open(self.hashed_files[self.hash_key(self.clean_name(nombre))]) as archivo:
+            original = archivo.read()
+        with Image.open(io.BytesIO(original)) as gif:
+            if getattr(gif, 'n_frames', 1) < 2:
+                return None
+            duraciones = []
+            for cuadro in range(gif.n_frames):
+                gif.seek(cuadro)
+                duraciones.append(gif.info.get('duration', 100))
+            gif.seek(0)
+            salida = io.BytesIO()
+            gif.save(
+                salida, 'WEBP', save_all=True, duration=duraciones,
+                # Sin la extensión NETSCAPE el GIF se reproduce una sola vez
+                loop=gif.info.get('loop', 1),
+                # El fondo del GIF es un índice de su paleta; el WebP queda transparente
+                background=(0, 0, 0, 0),
+                quality=ajustes['CALIDAD_WEBP'], method=ajustes['METODO_WEBP'],
+            )
+        datos = salida.getvalue()
+        if len(datos) >= len(original):
+            return None
+
+        webp = nombre_webp(nombre)
+        contenido = ContentFile(datos)
+        con_hash = self.hashed_name(webp, contenido)
+        if not self.exists(con_hash):
+            self._save(con_hash, contenido)
+        self.hashed_files[self.hash_key(self.clean_name(webp))] = con_hash
+        return con_hash
+
+    def _comprimir(self, nombre):
+        """Guarda nombre.gz y nombre.br si son más livianos que el original."""
+        with self.open(nombre) as archivo:
+            datos = archivo.read()
+        comprimidos = {'.gz': gzip.compress(datos, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            comprimidos['.br'] = brotli.compress(datos, quality=11)
+        for extension, comprimido in comprimidos.items():
+            # Los nombres llevan el hash del original: si ya existe, es igual
+            if len(comprimido) < len(datos) and not self.exists(nombre + extension):
+                self._save(nombre + extension, ContentFile(comprimido))
+
+
+def informe_estaticos(almacen=None):
+    """
+    Bytes de cada archivo del manifiesto y de su mejor variante: lista de
+    (nombre, original, optimizado, formato), con optimizado=None si no tiene
+    ninguna. Los tamaños son los de STATIC_ROOT.
+    """
+    almacen = almacen or staticfiles_storage
+    archivos = almacen.hashed_files
+    filas = []
+    for nombre, con_hash in sorted(archivos.items()):
+        if nombre.endswith('.webp') and posixpath.splitext(nombre)[0] + '.gif' in archivos:
+            continue  # se reporta junto a su GIF
+        original = almacen.size(con_hash)
+        variantes = []
+        if nombre.lower().endswith('.gif') and nombre_webp(nombre) in archivos:
+            variantes.append((almacen.size(archivos[nombre_webp(nombre)]), 'webp'))
+        for formato, extension in CODIFICACIONES:
+            if almacen.exists(con_hash + extension):
+                variantes.append((almacen.size(con_hash + extension), formato))
+        optimizado, formato = min(variantes) if variantes else (None, '')
+        filas.append((nombre, original, optimizado, formato))
+    return filas
+
+
+@functools.cache
+def _nombres_con_hash():
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def servir_estatico(request, ruta):
+    """
+    Sirve un archivo de STATIC_ROOT con la mejor versión comprimida que
+    acepte el navegador y caché de un año si el nombre lleva hash.
+    """
+    nombre = posixpath.normpath(ruta).lstrip('/')
+    candidatos = [nombre]
+    if es_comprimible(nombre):
+        aceptadas = request.headers.get('Accept-Encoding', '')
+        candidatos[:0] = [nombre + extension for codificacion, extension in CODIFICACIONES if codificacion in aceptadas]
+    for candidato in candidatos:
+        try:
+            # serve() se encarga del Content-Encoding según la extensión
+            respuesta = serve(request, candidato, document_root=settings.STATIC_ROOT)
+            break
+        except Http404:
+            if candidato == nombre:
+                raise
+
+    if nombre in _nombres_con_hash():
+        patch_cache_control(respuesta, public=True, max_age=settings.ESTATICOS['CACHE_CON_HASH'], immutable=True)
+    else:
+        patch_cache_control(respuesta, public=True, max_age=settings.ESTATICOS['CACHE_SIN_HASH'])
+    if es_comprimible(nombre):
+        patch_vary_headers(respuesta, ('Accept-Encoding',))
+    return respuesta
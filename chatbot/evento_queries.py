@@ -5,11 +5,529 @@ el lenguaje natural y extraer parámetros para las consultas SQL.
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.db.models import Q
+from django.db.models.functions import Left
 from .models import Evento
-from google import genai
+from .busqueda import filtrar_por_texto
+from .calendario import es_consulta_por_dias, filtrar_por_dias
+from .catalogo_memoria import CatalogoMemoria, ConsultaMemoria
+from .gemini import obtener_cliente, cliente_async, plazo_llamada
+from .imagenes import info_imagen
+from .circuito import Circuito, CircuitoAbierto
+from .cache_niveles import CacheNiveles
+from .cache_local import CacheLRU, CacheVariantes, normalizar_mensaje, proxima_medianoche_local
+from .metricas import Contadores
+from .recomendacion import MuestreadorEventos
+from .recurrencia import CatalogoSeries, ConsultaConSeries
+from .version_catalogo import VigilanteVersion
 from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from google.genai import errors as genai_errors
+from google.genai import types
+import asyncio
+import contextlib
+import contextvars
+import functools
+import httpx
 import json
+import random
 import re
+import time
+
+
+MODELO_GEMINI = "gemini-2.5-flash"
+
+# Parámetros ya interpretados por Gemini, por mensaje normalizado. Las entradas
+# expiran a medianoche porque "hoy" o "mañana" cambian de fecha cada día.
+cache_intenciones = CacheLRU(tamano_maximo=settings.CACHE_INTENCIONES_TAMANO)
+
+# Textos con los que Gemini presentó una lista de eventos, por lista (ids y
+# fecha_actualizacion, en orden) y criterios. Se guardan varias variantes por
+# lista y se invalidan al guardar o eliminar uno de sus eventos (signals.py).
+cache_resumenes = CacheVariantes(
+    tamano_maximo=settings.CACHE_RESUMENES_TAMANO,
+    variantes=settings.CACHE_RESUMENES_VARIANTES,
+)
+
+# Segundo nivel, común a todos los procesos, de las cachés anteriores y de las
+# respuestas de preguntas frecuentes y los detalles de eventos (views.py), con
+# el TTL de cada espacio en settings.CACHE_NIVELES. cache_intenciones es su L1
+# para las intenciones; los resúmenes usan cache_resumenes (ver
+# _resumen_guardado).
+cache_niveles = CacheNiveles(
+    alias_l2=settings.CACHE_NIVELES['ALIAS_L2'],
+    espacios=settings.CACHE_NIVELES['ESPACIOS'],
+    tamano_l1=settings.CACHE_NIVELES['TAMANO_L1'],
+    l1={'intenciones': cache_intenciones},
+)
+
+# Evento al azar para "recomiéndame algo" (settings.RECOMENDACION); los conteos
+# por día que guarda se descartan al guardar o eliminar uno (signals.py).
+muestreador_recomendaciones = MuestreadorEventos(
+    horizonte_dias=settings.RECOMENDACION['HORIZONTE_DIAS'],
+    vida_media_dias=settings.RECOMENDACION['VIDA_MEDIA_DIAS'],
+    vigencia_limite=settings.RECOMENDACION['VIGENCIA_LIMITE'],
+)
+
+# Cuántas consultas resolvió cada camino de interpretar_consulta
+# (local, cache, gemini, respaldo).
+interpretaciones = Contadores()
+
+# Resultado de la ejecución especulativa de consultas (interpretar_y_consultar):
+# intentos, aciertos, descartes, errores y ms_ahorrados.
+especulacion = Contadores()
+
+# Deja de llamar a Gemini durante un tiempo tras varios fallos seguidos
+# (settings.GEMINI_CIRCUITO); mientras tanto se usan los textos de respaldo.
+circuito_gemini = Circuito(
+    umbral_fallos=settings.GEMINI_CIRCUITO['FALLOS_CONSECUTIVOS'],
+    enfriamiento=settings.GEMINI_CIRCUITO['ENFRIAMIENTO'],
+)
+
+# Resultado de las llamadas a Gemini por etapa: "<etapa>.ok", ".timeout",
+# ".error" y ".rechazadas" (circuito abierto).
+llamadas_gemini = Contadores()
+
+# Uso de Gemini por etapa: "<etapa>.tokens_entrada", ".tokens_salida",
+# ".tokens_cache" (servidos desde la caché implícita de Gemini),
+# ".respuestas" y ".ms_primer_token" (suma; dividir entre respuestas).
+uso_gemini = Contadores()
+
+# Contador de llamadas de la petición en curso (ver contar_llamadas_gemini)
+_llamadas_en_contexto = contextvars.ContextVar('llamadas_gemini_en_contexto', default=None)
+
+# Hilos que ejecutan la consulta especulativa mientras Gemini interpreta
+_ejecutor_especulativo = ThreadPoolExecutor(
+    max_workers=settings.ESPECULACION_HILOS,
+    thread_name_prefix='consulta-especulativa',
+)
+
+
+@contextlib.contextmanager
+def _llamada_gemini(etapa, plazo_total=True):
+    """
+    Envuelve una llamada síncrona a Gemini de la etapa indicada: la rechaza
+    con ``CircuitoAbierto`` si el circuito está abierto y entrega la
+    configuración con el presupuesto de la etapa como timeout de httpx
+    (settings.GEMINI_PRESUPUESTOS). Registra el resultado en el circuito y en
+    ``llamadas_gemini``.
+
+    Con ``plazo_total`` la llamada completa se corta al agotar el presupuesto
+    (``plazo_llamada``), aunque la respuesta siga llegando; en streaming solo
+    se limita cada lectura.
+    """
+    _verificar_circuito(etapa)
+    plazo = plazo_llamada(settings.GEMINI_PRESUPUESTOS[etapa]) if plazo_total else contextlib.nullcontext()
+    try:
+        with plazo:
+            yield _config_etapa(etapa)
+    except Exception as e:
+        _registrar_fallo(etapa, e)
+        raise
+    _registrar_exito(etapa)
+
+
+@contextlib.asynccontextmanager
+async def _llamada_gemini_async(etapa, plazo_total=True):
+    """
+    Versión asíncrona de ``_llamada_gemini``. Con ``plazo_total`` el
+    presupuesto también se aplica a la llamada completa, incluida la espera
+    por un cupo en el pool; en streaming solo se limita cada lectura.
+    """
+    _verificar_circuito(etapa)
+    try:
+        if plazo_total:
+            async with asyncio.timeout(settings.GEMINI_PRESUPUESTOS[etapa]):
+                yield _config_etapa(etapa)
+        else:
+            yield _config_etapa(etapa)
+    except Exception as e:
+        _registrar_fallo(etapa, e)
+        raise
+    _registrar_exito(etapa)
+
+
+def _config_etapa(etapa):
+    """
+    Configuración de la llamada: las instrucciones fijas de la etapa van como
+    system_instruction (el prompt solo lleva la parte variable) y el
+    presupuesto de la etapa como timeout.
+    """
+    milisegundos = int(settings.GEMINI_PRESUPUESTOS[etapa] * 1000)
+    return types.GenerateContentConfig(
+        system_instruction=INSTRUCCIONES_POR_ETAPA[etapa],
+        http_options=types.HttpOptions(timeout=milisegundos),
+    )
+
+
+def _registrar_uso(etapa, uso, segundos_primer_token):
+    """
+    Acumula en ``uso_gemini`` los tokens de la respuesta y el tiempo hasta el
+    primer token (en llamadas sin streaming, el de la respuesta completa).
+    """
+    valores = {'respuestas': 1, 'ms_primer_token': round(segundos_primer_token * 1000)}
+    if uso is not None:
+        valores['tokens_entrada'] = uso.prompt_token_count or 0
+        valores['tokens_salida'] = uso.candidates_token_count or 0
+        valores['tokens_cache'] = uso.cached_content_token_count or 0
+    for nombre, cantidad in valores.items():
+        uso_gemini.incrementar(f'{etapa}.{nombre}', cantidad)
+
+
+def _verificar_circuito(etapa):
+    try:
+        circuito_gemini.verificar()
+    except CircuitoAbierto:
+        llamadas_gemini.incrementar(f'{etapa}.rechazadas')
+        raise
+    
+    contador = _llamadas_en_contexto.get()
+    if contador is not None:
+        contador[etapa] += 1
+
+
+@contextlib.contextmanager
+def contar_llamadas_gemini(contador):
+    """
+    Mientras está activo, cada llamada a Gemini del contexto actual (hilo o
+    tarea) incrementa ``contador[etapa]``. Se usa para saber cuántas llamadas
+    hizo una petición concreta.
+    """
+    token = _llamadas_en_contexto.set(contador)
+    try:
+        yield contador
+    finally:
+        _llamadas_en_contexto.reset(token)
+
+
+def _registrar_exito(etapa):
+    circuito_gemini.registrar_exito()
+    llamadas_gemini.incrementar(f'{etapa}.ok')
+
+
+def _registrar_fallo(etapa, error):
+    if isinstance(error, (TimeoutError, httpx.TimeoutException)):
+        llamadas_gemini.incrementar(f'{etapa}.timeout')
+    else:
+        llamadas_gemini.incrementar(f'{etapa}.error')
+    
+    # Un 4xx indica un problema de la petición, no de disponibilidad de Gemini
+    if isinstance(error, genai_errors.ClientError) and error.code not in (408, 429):
+        return
+    circuito_gemini.registrar_fallo()
+
+
+def _generar_texto(etapa, prompt):
+    """
+    Envía el prompt a Gemini con el cliente compartido y retorna el texto.
+    Lanza una excepción si se agota el presupuesto de la etapa o si el
+    circuito está abierto; los llamadores responden con su texto de respaldo.
+    """
+    inicio = time.perf_counter()
+    with _llamada_gemini(etapa) as config:
+        response = obtener_cliente().models.generate_content(
+            model=MODELO_GEMINI,
+            contents=prompt,
+            config=config,
+        )
+    _registrar_uso(etapa, response.usage_metadata, time.perf_counter() - inicio)
+    return response.text.strip()
+
+
+async def _generar_texto_async(etapa, prompt):
+    """
+    Versión asíncrona de ``_generar_texto``.
+    """
+    inicio = time.perf_counter()
+    async with _llamada_gemini_async(etapa) as config:
+        async with cliente_async() as client:
+            response = await client.models.generate_content(
+                model=MODELO_GEMINI,
+                contents=prompt,
+                config=config,
+            )
+    _registrar_uso(etapa, response.usage_metadata, time.perf_counter() - inicio)
+    return response.text.strip()
+
+
+def _generar_texto_stream(etapa, prompt, respaldo, al_terminar=None):
+    """
+    Envía el prompt a Gemini y produce el texto a medida que llega. Si Gemini
+    falla antes de enviar algo, produce ``respaldo``; si falla a mitad de la
+    respuesta, se queda con lo ya enviado. Si la respuesta termina bien se
+    llama a ``al_terminar`` con el texto completo.
+    
+    El presupuesto de la etapa limita la espera por cada fragmento, empezando
+    por el primero.
+    """
+    partes = []
+    inicio = time.perf_counter()
+    primer_token = uso = None
+    try:
+        with _llamada_gemini(etapa, plazo_total=False) as config:
+            for chunk in obtener_cliente().models.generate_content_stream(
+                model=MODELO_GEMINI,
+                contents=prompt,
+                config=config,
+            ):
+                uso = chunk.usage_metadata or uso
+                if chunk.text:
+                    if primer_token is None:
+                        primer_token = time.perf_counter() - inicio
+                    partes.append(chunk.text)
+                    yield chunk.text
+    except Exception as e:
+        if not partes:
+            yield respaldo
+        return
+
+    _registrar_uso(etapa, uso, primer_token if primer_token is not None else time.perf_counter() - inicio)
+    if al_terminar and partes:
+        al_terminar(''.join(partes).strip())
+
+
+async def _generar_texto_stream_async(etapa, prompt, respaldo, al_terminar=None):
+    """
+    Versión asíncrona de ``_generar_texto_stream``; ``al_terminar`` es
+    síncrona y se ejecuta en un hilo (suele escribir en la caché compartida).
+    """
+    partes = []
+    inicio = time.perf_counter()
+    primer_token = uso = None
+    try:
+        async with _llamada_gemini_async(etapa, plazo_total=False) as config:
+            async with cliente_async() as client:
+                async for chunk in await client.models.generate_content_stream(
+                    model=MODELO_GEMINI,
+                    contents=prompt,
+                    config=config,
+                ):
+                    uso = chunk.usage_metadata or uso
+                    if chunk.text:
+                        if primer_token is None:
+                            primer_token = time.perf_counter() - inicio
+                        partes.append(chunk.text)
+                        yield chunk.text
+    except Exception as e:
+        if not partes:
+            yield respaldo
+        return
+
+    _registrar_uso(etapa, uso, primer_token if primer_token is not None else time.perf_counter() - inicio)
+    if al_terminar and partes:
+        await sync_to_async(al_terminar)(''.join(partes).strip())
+
+
+def estado_gemini():
+    """
+    Estado del circuito de Gemini, resultado de las llamadas y uso (tokens y
+    tiempo hasta el primer token) por etapa, para monitoreo.
+    """
+    return {
+        'circuito': circuito_gemini.estadisticas(),
+        'llamadas': llamadas_gemini.valores(),
+        'uso': uso_gemini.valores(),
+    }
+
+
+def interpretar_consulta(mensaje_usuario, antes_de_gemini=None):
+    """
+    Interpreta el mensaje del usuario probando primero las reglas locales
+    (``interpretar_consulta_local``), luego la caché de intenciones y por
+    último Gemini. ``antes_de_gemini`` se llama justo antes de la petición a
+    Gemini, solo si es necesaria.
+    
+    Retorna una tupla (parametros, origen), donde origen es "local", "cache",
+    "gemini" o "respaldo" (Gemini falló y se usó una búsqueda genérica).
+    """
+    parametros = interpretar_consulta_local(mensaje_usuario)
+    if parametros is not None:
+        origen = 'local'
+    else:
+        parametros, origen = _interpretar_con_gemini(mensaje_usuario, antes_de_gemini)
+    
+    interpretaciones.incrementar(origen)
+    return parametros, origen
+
+
+async def interpretar_consulta_async(mensaje_usuario, antes_de_gemini=None):
+    """
+    Versión asíncrona de ``interpretar_consulta`` que usa el cliente
+    asíncrono de Gemini.
+    """
+    parametros = interpretar_consulta_local(mensaje_usuario)
+    if parametros is not None:
+        origen = 'local'
+    else:
+        parametros, origen = await _interpretar_con_gemini_async(mensaje_usuario, antes_de_gemini)
+    
+    interpretaciones.incrementar(origen)
+    return parametros, origen
+
+
+def interpretar_y_consultar(mensaje_usuario):
+    """
+    Interpreta el mensaje como ``interpretar_consulta``. Si hay que esperar a
+    Gemini y settings.CHAT_ESPECULATIVO está activo, mientras tanto ejecuta en
+    otro hilo la consulta que sugieren las reglas locales
+    (``adivinar_consulta_local``).
+    
+    Retorna (parametros, origen, pagina): pagina es el resultado ya evaluado
+    de ``paginar_eventos`` si Gemini coincidió con la suposición, o None si
+    hay que ejecutar la consulta.
+    """
+    if not settings.CHAT_ESPECULATIVO:
+        return (*interpretar_consulta(mensaje_usuario), None)
+    
+    especulada = []
+    
+    def especular():
+        suposicion = adivinar_consulta_local(mensaje_usuario)
+        if suposicion is not None:
+            especulada.append((suposicion, _ejecutor_especulativo.submit(_consulta_especulativa, suposicion)))
+    
+    parametros, origen = interpretar_consulta(mensaje_usuario, antes_de_gemini=especular)
+    if not especulada:
+        return parametros, origen, None
+    
+    suposicion, futuro = especulada[0]
+    especulacion.incrementar('intentos')
+    if not _coincide_suposicion(parametros, suposicion):
+        futuro.cancel()
+        especulacion.incrementar('descartes')
+        return parametros, origen, None
+    
+    inicio_espera = time.perf_counter()
+    try:
+        pagina, duracion = futuro.result()
+    except Exception as e:
+        especulacion.incrementar('errores')
+        return parametros, origen, None
+    _registrar_acierto(duracion, time.perf_counter() - inicio_espera)
+    return parametros, origen, pagina
+
+
+async def interpretar_y_consultar_async(mensaje_usuario):
+    """
+    Versión asíncrona de ``interpretar_y_consultar``. La consulta especulativa
+    corre en un hilo aparte mientras el event loop espera a Gemini.
+    """
+    if not settings.CHAT_ESPECULATIVO:
+        return (*await interpretar_consulta_async(mensaje_usuario), None)
+    
+    especulada = []
+    
+    def especular():
+        suposicion = adivinar_consulta_local(mensaje_usuario)
+        if suposicion is not None:
+            consulta = sync_to_async(_consulta_especulativa, thread_sensitive=False)
+            especulada.append((suposicion, asyncio.ensure_future(consulta(suposicion))))
+    
+    parametros, origen = await interpretar_consulta_async(mensaje_usuario, antes_de_gemini=especular)
+    if not especulada:
+        return parametros, origen, None
+    
+    suposicion, tarea = especulada[0]
+    especulacion.incrementar('intentos')
+    if not _coincide_suposicion(parametros, suposicion):
+        tarea.cancel()
+        # Si ya había terminado con error, marcarlo como leído
+        tarea.add_done_callback(lambda t: t.cancelled() or t.exception())
+        especulacion.incrementar('descartes')
+        return parametros, origen, None
+    
+    inicio_espera = time.perf_counter()
+    try:
+        pagina, duracion = await tarea
+    except Exception as e:
+        especulacion.incrementar('errores')
+        return parametros, origen, None
+    _registrar_acierto(duracion, time.perf_counter() - inicio_espera)
+    return parametros, origen, pagina
+
+
+def estadisticas_especulacion():
+    """
+    Retorna los contadores de ``especulacion`` junto con la tasa de aciertos.
+    """
+    valores = especulacion.valores()
+    intentos = valores.get('intentos', 0)
+    valores['tasa_aciertos'] = valores.get('aciertos', 0) / intentos if intentos else 0.0
+    return valores
+
+
+def _consulta_especulativa(parametros):
+    """
+    Ejecuta y evalúa la primera página de la consulta en un hilo del
+    ejecutor especulativo. Retorna ((eventos, cursor), segundos que tardó).
+    """
+    close_old_connections()
+    try:
+        inicio = time.perf_counter()
+        pagina = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        return pagina, time.perf_counter() - inicio
+    finally:
+        close_old_connections()
+
+
+def _coincide_suposicion(parametros, suposicion):
+    return parametros.get('es_sobre_eventos', True) and _firma_consulta(parametros) == _firma_consulta(suposicion)
+
+
+def _registrar_acierto(duracion, espera):
+    """
+    La latencia ahorrada es lo que tardó la consulta menos lo que aún hubo
+    que esperarla después de que Gemini respondió.
+    """
+    especulacion.incrementar('aciertos')
+    especulacion.incrementar('ms_ahorrados', max(0, round((duracion - espera) * 1000)))
+
+
+def _firma_consulta(parametros):
+    """
+    Resume los parámetros que realmente leen las ramas de
+    ``ejecutar_consulta_eventos``, para saber si dos interpretaciones
+    producen la misma consulta.
+    """
+    if parametros.get('es_recomendacion', False) or parametros.get('tipo_consulta') == 'recomendacion':
+        return ('recomendacion',)
+    
+    tipo_consulta = parametros.get('tipo_consulta', 'todos')
+    if tipo_consulta == 'por_fecha':
+        claves = ('fecha',) if parametros.get('fecha') else ('fecha_inicio', 'texto_busqueda')
+    elif tipo_consulta == 'por_rango_fechas':
+        claves = ('fecha_inicio', 'fecha_fin')
+    elif tipo_consulta == 'por_categoria':
+        claves = ('categoria',)
+    elif tipo_consulta == 'por_ubicacion':
+        claves = ('ubicacion',)
+    elif tipo_consulta == 'gratuitos' or parametros.get('solo_gratuitos'):
+        tipo_consulta, claves = 'gratuitos', ()
+    elif tipo_consulta == 'proximos':
+        claves = ('dias_proximos',)
+    elif tipo_consulta == 'busqueda':
+        claves = ('texto_busqueda',)
+    else:
+        tipo_consulta, claves = 'todos', ()
+    
+    valores = {'dias_proximos': 7} if tipo_consulta == 'proximos' else {}
+    valores.update((clave, parametros[clave]) for clave in claves if parametros.get(clave))
+    
+    precio_maximo = parametros.get('precio_maximo')
+    if precio_maximo is not None:
+        try:
+            precio_maximo = Decimal(str(precio_maximo)).normalize()
+        except InvalidOperation:
+            precio_maximo = str(precio_maximo)
+    
+    return (
+        tipo_consulta,
+        tuple(sorted((clave, str(valor).strip().lower()) for clave, valor in valores.items())),
+        precio_maximo,
+    )
 
 
 def interpretar_consulta_usuario(mensaje_usuario):
@@ -17,31 +535,66 @@ def interpretar_consulta_usuario(mensaje_usuario):
     Usa Gemini para interpretar el mensaje del usuario y extraer parámetros
     estructurados para las consultas SQL.
     
-    Retorna un diccionario con los parámetros extraídos.
+    Retorna un diccionario con los parámetros extraídos. Los mensajes repetidos
+    se responden desde ``cache_niveles`` (espacio "intenciones", también con
+    lo que interpretaron otros procesos) sin llamar a Gemini.
+    """
+    return _interpretar_con_gemini(mensaje_usuario)[0]
+
+
+def _interpretar_con_gemini(mensaje_usuario, antes_de_gemini=None):
     """
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    Implementación de ``interpretar_consulta_usuario``. Retorna una tupla
+    (parametros, origen) con origen "cache", "gemini" o "respaldo".
+    """
+    ahora = timezone.localtime()
+    clave_cache = _clave_intencion(mensaje_usuario, ahora)
+    parametros = cache_niveles.obtener('intenciones', clave_cache)
+    if parametros is not None:
+        return dict(parametros), 'cache'
     
-    # Obtener fecha y hora actual
-    ahora = timezone.now()
-    fecha_actual = ahora.strftime('%Y-%m-%d')
-    hora_actual = ahora.strftime('%H:%M:%S')
-    dia_semana = ahora.strftime('%A')  # Lunes, Martes, etc.
-    dia_mes = ahora.day
-    mes_actual = ahora.month
-    año_actual = ahora.year
+    if antes_de_gemini:
+        antes_de_gemini()
+    try:
+        texto_respuesta = _generar_texto('interpretacion', _prompt_interpretacion(mensaje_usuario, ahora))
+        return _parsear_y_guardar_intencion(clave_cache, texto_respuesta), 'gemini'
+    except Exception as e:
+        # Si falla, intentar búsqueda genérica
+        return _parametros_respaldo(mensaje_usuario), 'respaldo'
+
+
+async def _interpretar_con_gemini_async(mensaje_usuario, antes_de_gemini=None):
+    """
+    Versión asíncrona de ``_interpretar_con_gemini``.
+    """
+    ahora = timezone.localtime()
+    clave_cache = _clave_intencion(mensaje_usuario, ahora)
+    # L2 puede estar en la base de datos
+    parametros = await sync_to_async(cache_niveles.obtener)('intenciones', clave_cache)
+    if parametros is not None:
+        return dict(parametros), 'cache'
     
-    prompt = f"""Eres un asistente que interpreta consultas sobre eventos en la ciudad de Loja.
-Tu tarea es extraer parámetros estructurados del siguiente mensaje del usuario.
+    if antes_de_gemini:
+        antes_de_gemini()
+    try:
+        texto_respuesta = await _generar_texto_async('interpretacion', _prompt_interpretacion(mensaje_usuario, ahora))
+        return await sync_to_async(_parsear_y_guardar_intencion)(clave_cache, texto_respuesta), 'gemini'
+    except Exception as e:
+        return _parametros_respaldo(mensaje_usuario), 'respaldo'
 
-FECHA Y HORA ACTUAL (usa esta información como referencia):
-- Fecha actual: {fecha_actual}
-- Hora actual: {hora_actual}
-- Día de la semana: {dia_semana}
-- Día del mes: {dia_mes}
-- Mes actual: {mes_actual}
-- Año actual: {año_actual}
 
-Mensaje del usuario: "{mensaje_usuario}"
+def _clave_intencion(mensaje_usuario, ahora):
+    """
+    Clave de ``cache_intenciones``. La fecha de referencia del prompt forma
+    parte de la clave para que una entrada nunca sobreviva a un cambio de día.
+    ``ahora`` es la hora local, así que el día cambia a la misma medianoche en
+    que expiran las entradas (``proxima_medianoche_local``).
+    """
+    return (ahora.strftime('%Y-%m-%d'), normalizar_mensaje(mensaje_usuario))
+
+
+INSTRUCCIONES_INTERPRETACION = """Eres un asistente que interpreta consultas sobre eventos en la ciudad de Loja.
+Tu tarea es extraer parámetros estructurados del mensaje del usuario. Cada mensaje incluye la FECHA Y HORA ACTUAL, que debes usar como referencia.
 
 Debes extraer y retornar SOLO un JSON válido con los siguientes campos posibles:
 - es_sobre_eventos: true si la pregunta es sobre eventos en Loja, false si es sobre otro tema
@@ -58,49 +611,69 @@ Debes extraer y retornar SOLO un JSON válido con los siguientes campos posibles
 - dias_proximos: número de días (si pregunta "próximos eventos" o "esta semana")
 
 IMPORTANTE - USAR FECHA Y HORA ACTUAL COMO REFERENCIA:
-- Si menciona "hoy", usa la fecha actual: {fecha_actual}
-- Si menciona "mañana", calcula la fecha del día siguiente a {fecha_actual}
-- Si menciona días de la semana (lunes, martes, etc.), calcula la fecha correspondiente basándote en que hoy es {dia_semana}
-- Si menciona "3 de noviembre" o "3 de nov", asume año {año_actual} si no se especifica otro año
+- Si menciona "hoy", usa la fecha actual
+- Si menciona "mañana", calcula la fecha del día siguiente a la fecha actual
+- Si menciona días de la semana (lunes, martes, etc.), calcula la fecha correspondiente basándote en el día de la semana actual
+- Si menciona "3 de noviembre" o "3 de nov", asume el año actual si no se especifica otro año
 - Si menciona fechas relativas como "esta semana", "próxima semana", calcula basándote en la fecha actual
 - Si menciona un RANGO de fechas como "entre el 15 y el 20 de noviembre" o "del 15 al 20 de nov", usa tipo_consulta: "por_rango_fechas" y proporciona fecha_inicio y fecha_fin
 - Retorna SOLO el JSON, sin texto adicional, sin markdown, sin explicaciones
 
-Ejemplos de respuesta:
-- Fecha específica: {{"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "por_fecha", "fecha": "{fecha_actual}"}}
-- Rango de fechas: {{"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "por_rango_fechas", "fecha_inicio": "2024-11-15", "fecha_fin": "2024-11-20"}}
-- Recomendación: {{"es_sobre_eventos": true, "es_recomendacion": true, "tipo_consulta": "recomendacion"}}
-- "que evento me recomiendas": {{"es_sobre_eventos": true, "es_recomendacion": true, "tipo_consulta": "recomendacion"}}
-- "me recomiendas algo": {{"es_sobre_eventos": true, "es_recomendacion": true, "tipo_consulta": "recomendacion"}}
-- "eventos de menos de 20 dólares": {{"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "busqueda", "precio_maximo": 20}}
-- "quiero saber eventos que cuesten menos de 20 dolares": {{"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "busqueda", "precio_maximo": 20}}
-- "eventos hasta $15": {{"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "busqueda", "precio_maximo": 15}}
+Ejemplos de respuesta (si la fecha actual fuera 2024-11-10):
+- Fecha específica ("eventos de hoy"): {"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "por_fecha", "fecha": "2024-11-10"}
+- Rango de fechas: {"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "por_rango_fechas", "fecha_inicio": "2024-11-15", "fecha_fin": "2024-11-20"}
+- Recomendación: {"es_sobre_eventos": true, "es_recomendacion": true, "tipo_consulta": "recomendacion"}
+- "que evento me recomiendas": {"es_sobre_eventos": true, "es_recomendacion": true, "tipo_consulta": "recomendacion"}
+- "me recomiendas algo": {"es_sobre_eventos": true, "es_recomendacion": true, "tipo_consulta": "recomendacion"}
+- "eventos de menos de 20 dólares": {"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "busqueda", "precio_maximo": 20}
+- "quiero saber eventos que cuesten menos de 20 dolares": {"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "busqueda", "precio_maximo": 20}
+- "eventos hasta $15": {"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "busqueda", "precio_maximo": 15}
+"""
+
+
+def _prompt_interpretacion(mensaje_usuario, ahora):
+    """
+    Construye la parte variable del prompt de interpretación (fecha de
+    referencia y mensaje); las instrucciones van en INSTRUCCIONES_INTERPRETACION.
+    """
+    return f"""FECHA Y HORA ACTUAL (usa esta información como referencia):
+- Fecha actual: {ahora.strftime('%Y-%m-%d')}
+- Hora actual: {ahora.strftime('%H:%M:%S')}
+- Día de la semana: {ahora.strftime('%A')}
+- Día del mes: {ahora.day}
+- Mes actual: {ahora.month}
+- Año actual: {ahora.year}
+
+Mensaje del usuario: "{mensaje_usuario}"
 """
+
+
+def _parsear_y_guardar_intencion(clave_cache, texto_respuesta):
+    """
+    Extrae el JSON de parámetros de la respuesta de Gemini y lo guarda en
+    ``cache_niveles`` (espacio "intenciones").
+    """
+    # Limpiar si viene con markdown
+    texto_respuesta = re.sub(r'```json\s*', '', texto_respuesta)
+    texto_respuesta = re.sub(r'```\s*', '', texto_respuesta)
+    texto_respuesta = texto_respuesta.strip()
     
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-        )
-        
-        # Extraer JSON de la respuesta
-        texto_respuesta = response.text.strip()
-        
-        # Limpiar si viene con markdown
-        texto_respuesta = re.sub(r'```json\s*', '', texto_respuesta)
-        texto_respuesta = re.sub(r'```\s*', '', texto_respuesta)
-        texto_respuesta = texto_respuesta.strip()
-        
-        # Parsear JSON
-        parametros = json.loads(texto_respuesta)
-        return parametros
-        
-    except Exception as e:
-        # Si falla, intentar búsqueda genérica
-        return {
-            "tipo_consulta": "busqueda",
-            "texto_busqueda": mensaje_usuario
-        }
+    # Parsear JSON
+    parametros = json.loads(texto_respuesta)
+    if isinstance(parametros, dict):
+        cache_niveles.guardar('intenciones', clave_cache, parametros, expira_en=proxima_medianoche_local())
+        return dict(parametros)
+    return parametros
+
+
+def _parametros_respaldo(mensaje_usuario):
+    """
+    Parámetros de búsqueda genérica cuando Gemini no pudo interpretar el mensaje.
+    """
+    return {
+        "tipo_consulta": "busqueda",
+        "texto_busqueda": mensaje_usuario
+    }
 
 
 SPANISH_MONTHS = {
@@ -260,193 +833,765 @@ def _primer_dia_siguiente_mes(fecha):
     return fecha.replace(year=year, month=month, day=1, hour=0, minute=0, second=0, microsecond=0)
 
 
+# Palabras (sin tildes) que identifican una categoría sin ambigüedad. Se
+# completan con las claves y etiquetas de Evento.CATEGORIA_CHOICES.
+SINONIMOS_CATEGORIA = {
+    'musica': ['musical', 'musicales', 'concierto', 'conciertos', 'recital', 'recitales'],
+    'deporte': ['deportes', 'deportivo', 'deportivos', 'deportiva', 'deportivas'],
+    'cultural': ['culturales', 'cultura'],
+    'gastronomia': ['gastronomico', 'gastronomicos', 'gastronomica', 'gastronomicas'],
+    'educativo': ['educativos', 'educativa', 'educativas', 'taller', 'talleres', 'charla', 'charlas'],
+    'religioso': ['religiosos', 'religiosa', 'religiosas', 'misa', 'misas', 'procesion', 'procesiones'],
+    'feria': ['ferias'],
+    'teatro': ['teatros', 'teatral', 'teatrales', 'obra de teatro', 'obras de teatro'],
+    'danza': ['danzas', 'baile', 'bailes'],
+}
+
+# Palabras que pueden quedar en el mensaje sin cambiar su significado.
+# Cualquier otra palabra hace que la consulta se envíe a Gemini.
+PALABRAS_RELLENO = frozenset([
+    'a', 'al', 'algo', 'algun', 'alguna', 'algunas', 'alguno', 'algunos', 'actividad',
+    'actividades', 'buscar', 'busco', 'conocer', 'cuales', 'cuesten', 'cueste', 'dame',
+    'de', 'del', 'dolares', 'el', 'en', 'esta', 'estan', 'evento', 'eventos', 'hay',
+    'la', 'las', 'lista', 'loja', 'los', 'me', 'mijo', 'muestrame', 'para', 'planes',
+    'por', 'porfa', 'pues', 'que', 'quiero', 'saber', 'son', 'tienes', 'ver', 'y',
+])
+
+_PATRON_PRECIO = re.compile(
+    r'\b(?:menos de|menores a|hasta|maximo|por debajo de)\s*\$?\s*(\d+(?:[.,]\d{1,2})?)\s*(?:\$|dolares|dolar|usd)?'
+)
+_PATRON_GRATIS = re.compile(r'\b(?:gratis|gratuitos?|gratuitas?|sin costo)\b')
+_PATRONES_FECHA = [
+    re.compile(r'\b\d{1,2}\s+de\s+[a-z]+(?:\s+(?:de\s+)?\d{4})?\b'),
+    re.compile(r'\b[a-z]+\s+(?:de\s+)?\d{4}\b'),
+    re.compile(r'\b\d{4}-\d{2}(?:-\d{2})?\b'),
+    re.compile(r'\b\d{1,2}/\d{1,2}/\d{4}\b'),
+    re.compile(r'\b(?:' + '|'.join(SPANISH_MONTHS) + r')\b'),
+]
+_PATRONES_PERIODO = [
+    ('hoy', re.compile(r'\bhoy\b')),
+    ('manana', re.compile(r'\bmanana\b')),
+    ('semana', re.compile(r'\b(?:esta|la) semana\b')),
+    ('mes', re.compile(r'\beste mes\b')),
+    ('fin_de_semana', re.compile(r'\b(?:este |el )?(?:fin de semana|finde)\b')),
+    ('proximos', re.compile(r'\bproxim[oa]s\b')),
+    ('todos', re.compile(r'\btodos\b')),
+]
+
+
+def _patrones_categoria():
+    """
+    Construye la lista (categoria, patrón) a partir de los sinónimos y de
+    Evento.CATEGORIA_CHOICES. Los sinónimos largos van primero.
+    """
+    patrones = []
+    for clave, etiqueta in Evento.CATEGORIA_CHOICES:
+        if clave == 'otro':
+            continue
+        palabras = {clave, normalizar_mensaje(etiqueta)} | set(SINONIMOS_CATEGORIA.get(clave, []))
+        for palabra in palabras:
+            patrones.append((clave, palabra))
+    patrones.sort(key=lambda item: len(item[1]), reverse=True)
+    return [(clave, re.compile(r'\b' + re.escape(palabra) + r'\b')) for clave, palabra in patrones]
+
+
+_PATRONES_CATEGORIA = _patrones_categoria()
+
+
+def _consumir(patron, texto):
+    """
+    Busca ``patron`` en ``texto``. Retorna (match, texto_sin_match) o
+    (None, texto) si no hay coincidencia.
+    """
+    match = patron.search(texto)
+    if not match:
+        return None, texto
+    return match, texto[:match.start()] + ' ' + texto[match.end():]
+
+
+def interpretar_consulta_local(mensaje_usuario):
+    """
+    Interpreta sin Gemini los mensajes cuyo significado es inequívoco:
+    categorías y sus sinónimos, "gratis", "menos de $N", "hoy", "mañana",
+    "esta semana", "este mes", "este fin de semana" y fechas que entiende
+    ``detectar_fecha_en_texto``.
+    
+    Retorna el mismo diccionario de parámetros que produciría Gemini, o None
+    si el mensaje contiene algo que estas reglas no cubren.
+    """
+    return _interpretar_local(mensaje_usuario, estricto=True)
+
+
+def adivinar_consulta_local(mensaje_usuario):
+    """
+    Como ``interpretar_consulta_local`` pero ignorando las palabras que las
+    reglas no entienden. El resultado es solo una suposición: se usa para
+    adelantar la consulta mientras Gemini interpreta el mensaje.
+    """
+    return _interpretar_local(mensaje_usuario, estricto=False)
+
+
+def _interpretar_local(mensaje_usuario, estricto):
+    texto = normalizar_mensaje(mensaje_usuario)
+    if not texto:
+        return None
+    
+    parametros = {'es_sobre_eventos': True, 'es_recomendacion': False}
+    
+    match_precio, texto = _consumir(_PATRON_PRECIO, texto)
+    precio_maximo = None
+    if match_precio:
+        precio_maximo = float(match_precio.group(1).replace(',', '.'))
+        if precio_maximo.is_integer():
+            precio_maximo = int(precio_maximo)
+    
+    texto = re.sub(r'[^\w\s/$-]', ' ', texto)
+    
+    # Solo se acepta un criterio de fecha; dos fechas suelen ser un rango
+    periodo = None
+    for nombre, patron in _PATRONES_PERIODO:
+        match, texto_restante = _consumir(patron, texto)
+        if match:
+            if periodo:
+                return None
+            periodo, texto = nombre, texto_restante
+    
+    fecha, granularidad = None, None
+    for patron in _PATRONES_FECHA:
+        match, texto_restante = _consumir(patron, texto)
+        if not match:
+            continue
+        fecha_match, granularidad_match = detectar_fecha_en_texto(match.group(0))
+        if not fecha_match:
+            continue
+        if fecha or periodo:
+            return None
+        fecha, granularidad, texto = fecha_match, granularidad_match, texto_restante
+    
+    categorias = set()
+    for clave, patron in _PATRONES_CATEGORIA:
+        match, texto_restante = _consumir(patron, texto)
+        while match:
+            categorias.add(clave)
+            texto = texto_restante
+            match, texto_restante = _consumir(patron, texto)
+    if len(categorias) > 1:
+        return None
+    
+    match_gratis, texto = _consumir(_PATRON_GRATIS, texto)
+    
+    sobrantes = [palabra for palabra in texto.split() if palabra not in PALABRAS_RELLENO]
+    if sobrantes and estricto:
+        return None
+    
+    # Mismo día local que el prompt de Gemini y la clave de cache_intenciones
+    hoy = timezone.localtime()
+    tipo_consulta = None
+    if fecha:
+        tipo_consulta = 'por_fecha'
+        formato = '%Y-%m' if granularidad == 'mes' else '%Y-%m-%d'
+        parametros['fecha'] = fecha.strftime(formato)
+    elif periodo in ('hoy', 'manana'):
+        tipo_consulta = 'por_fecha'
+        dia = hoy.date() + timedelta(days=1 if periodo == 'manana' else 0)
+        parametros['fecha'] = dia.strftime('%Y-%m-%d')
+    elif periodo == 'mes':
+        tipo_consulta = 'por_fecha'
+        parametros['fecha'] = hoy.strftime('%Y-%m')
+    elif periodo == 'fin_de_semana':
+        tipo_consulta = 'por_rango_fechas'
+        # Sábado y domingo de esta semana (o lo que queda si ya empezó)
+        dia = hoy.date()
+        inicio = dia + timedelta(days=max(0, 5 - dia.weekday()))
+        fin = dia + timedelta(days=6 - dia.weekday())
+        parametros['fecha_inicio'] = inicio.strftime('%Y-%m-%d')
+        parametros['fecha_fin'] = fin.strftime('%Y-%m-%d')
+    elif periodo in ('semana', 'proximos'):
+        tipo_consulta = 'proximos'
+        parametros['dias_proximos'] = 7
+    elif periodo == 'todos':
+        tipo_consulta = 'todos'
+    
+    if categorias:
+        # ejecutar_consulta_eventos aplica un solo criterio principal
+        if tipo_consulta and tipo_consulta != 'todos':
+            return None
+        tipo_consulta = 'por_categoria'
+        parametros['categoria'] = categorias.pop()
+    
+    if match_gratis:
+        if precio_maximo is not None:
+            return None
+        if tipo_consulta and tipo_consulta != 'todos':
+            # solo_gratuitos desplazaría al criterio principal en
+            # ejecutar_consulta_eventos; precio_maximo se aplica a todos
+            parametros['precio_maximo'] = 0
+        else:
+            tipo_consulta = 'gratuitos'
+            parametros['solo_gratuitos'] = True
+    
+    if precio_maximo is not None:
+        parametros['precio_maximo'] = precio_maximo
+        tipo_consulta = tipo_consulta or 'busqueda'
+    
+    if not tipo_consulta:
+        return None
+    
+    parametros['tipo_consulta'] = tipo_consulta
+    return parametros
+
+
 def ejecutar_consulta_eventos(parametros):
     """
     Ejecuta la consulta de eventos basada en los parámetros extraídos.
-    Usa el ORM de Django para seguridad.
+    Usa el ORM de Django para seguridad o, con settings.CATALOGO_EN_MEMORIA,
+    el catálogo en memoria del proceso (mismos eventos y mismo orden). Si
+    alguna serie recurrente cumple los criterios, sus ocurrencias se
+    intercalan al paginar (recurrencia.py).
     """
+    criterios = criterios_consulta(parametros)
     # Si es una recomendación, retornar lista vacía (se maneja en views.py)
-    if parametros.get('es_recomendacion', False) or parametros.get('tipo_consulta') == 'recomendacion':
+    if criterios is None:
         return []
-    
-    # Base query: solo eventos activos
-    query = Evento.objects.filter(activo=True)
-    
+
+    consulta = None
+    if settings.CATALOGO_EN_MEMORIA:
+        consulta = catalogo_memoria.consultar(criterios)
+    if consulta is None:
+        consulta = _consulta_orm(criterios)
+    return series_recurrentes.combinar(consulta, criterios)
+
+
+def criterios_consulta(parametros):
+    """
+    Traduce los parámetros interpretados a los filtros de la consulta, sin
+    tocar la base de datos, para que el ORM y el catálogo en memoria
+    respondan lo mismo. Retorna None para las recomendaciones, o un dict con:
+
+    - vacio: True si los parámetros no permiten buscar (fechas ilegibles)
+    - desde, hasta: límites de fecha_inicio (>= desde, < hasta, o <= hasta
+      si hasta_incluido); None si no hay límite
+    - dias: (primer día, día siguiente al último o None) cuando desde y
+      hasta son días completos; entonces se buscan los eventos en curso en
+      esos días en el calendario (calendario.py), también los que empezaron
+      antes de ``desde``, en lugar de filtrar por fecha_inicio
+    - categoria, ubicacion, texto: None si no se filtra por ellos
+    - solo_gratuitos: bool
+    - precio_maximo: Decimal, o None (se aplica a cualquier tipo de consulta)
+    """
+    if parametros.get('es_recomendacion', False) or parametros.get('tipo_consulta') == 'recomendacion':
+        return None
+
+    criterios = {
+        'vacio': False,
+        'desde': None,
+        'hasta': None,
+        'hasta_incluido': False,
+        'dias': None,
+        'categoria': None,
+        'ubicacion': None,
+        'texto': None,
+        'solo_gratuitos': False,
+        'precio_maximo': None,
+    }
     tipo_consulta = parametros.get('tipo_consulta', 'todos')
-    
+
     if tipo_consulta == 'por_fecha':
+        # La fecha, o si no fecha_inicio, o si no una fecha en el texto de búsqueda
         fecha, granularidad = formatear_fecha(parametros.get('fecha'))
+        if not fecha:
+            fecha, granularidad = formatear_fecha(parametros.get('fecha_inicio'))
+        if not fecha:
+            fecha, granularidad = detectar_fecha_en_texto(parametros.get('texto_busqueda', ''))
         if fecha:
-            if granularidad == "mes":
-                fecha_fin = _primer_dia_siguiente_mes(fecha)
-            else:
-                fecha_fin = fecha + timedelta(days=1)
-            query = query.filter(fecha_inicio__gte=fecha, fecha_inicio__lt=fecha_fin)
+            criterios['desde'] = fecha
+            criterios['hasta'] = _fin_periodo(fecha, granularidad)
         else:
-            # Intentar con fecha_inicio o fecha_fin proporcionados
-            fecha_inicio_aux, granularidad_inicio = formatear_fecha(parametros.get('fecha_inicio'))
-            if fecha_inicio_aux:
-                if granularidad_inicio == "mes":
-                    fecha_fin_aux = _primer_dia_siguiente_mes(fecha_inicio_aux)
-                else:
-                    fecha_fin_aux = fecha_inicio_aux + timedelta(days=1)
-                query = query.filter(fecha_inicio__gte=fecha_inicio_aux, fecha_inicio__lt=fecha_fin_aux)
-            else:
-                # Intentar detectar una fecha desde texto de búsqueda si existe
-                texto = parametros.get('texto_busqueda', '')
-                fecha_texto, granularidad_texto = detectar_fecha_en_texto(texto)
-                if fecha_texto:
-                    if granularidad_texto == "mes":
-                        fecha_fin_texto = _primer_dia_siguiente_mes(fecha_texto)
-                    else:
-                        fecha_fin_texto = fecha_texto + timedelta(days=1)
-                    query = query.filter(fecha_inicio__gte=fecha_texto, fecha_inicio__lt=fecha_fin_texto)
-                else:
-                    return Evento.objects.none()
-    
+            criterios['vacio'] = True
+
     elif tipo_consulta == 'por_rango_fechas':
         fecha_inicio, granularidad_inicio = formatear_fecha(parametros.get('fecha_inicio'))
         fecha_fin, granularidad_fin = formatear_fecha(parametros.get('fecha_fin'))
-        
+
         if fecha_inicio and fecha_fin:
-            if granularidad_inicio == "mes":
-                fecha_inicio = fecha_inicio  # ya es primer día del mes
-            if granularidad_fin == "mes":
-                fecha_fin_dia = _primer_dia_siguiente_mes(fecha_fin)
-            else:
-                fecha_fin_dia = fecha_fin + timedelta(days=1)
-            query = query.filter(
-                fecha_inicio__gte=fecha_inicio,
-                fecha_inicio__lt=fecha_fin_dia
-            )
+            criterios['desde'] = fecha_inicio
+            criterios['hasta'] = _fin_periodo(fecha_fin, granularidad_fin)
         elif fecha_inicio:
+            # Un mes completo, o si es un día, desde esa fecha en adelante
+            criterios['desde'] = fecha_inicio
             if granularidad_inicio == "mes":
-                fecha_fin_dia = _primer_dia_siguiente_mes(fecha_inicio)
-                query = query.filter(
-                    fecha_inicio__gte=fecha_inicio,
-                    fecha_inicio__lt=fecha_fin_dia
-                )
-            else:
-                # Si solo hay fecha_inicio, buscar desde esa fecha
-                query = query.filter(fecha_inicio__gte=fecha_inicio)
+                criterios['hasta'] = _fin_periodo(fecha_inicio, granularidad_inicio)
         elif fecha_fin:
-            if granularidad_fin == "mes":
-                fecha_fin_dia = _primer_dia_siguiente_mes(fecha_fin)
-            else:
-                # Si solo hay fecha_fin, buscar hasta esa fecha
-                fecha_fin_dia = fecha_fin + timedelta(days=1)
-            query = query.filter(fecha_inicio__lt=fecha_fin_dia)
+            criterios['hasta'] = _fin_periodo(fecha_fin, granularidad_fin)
         else:
             # Si no se pudieron parsear las fechas, retornar vacío
-            return Evento.objects.none()
-    
+            criterios['vacio'] = True
+
     elif tipo_consulta == 'por_categoria':
-        categoria = parametros.get('categoria')
-        if categoria:
-            query = query.filter(categoria=categoria)
-    
+        criterios['categoria'] = parametros.get('categoria') or None
+
     elif tipo_consulta == 'por_ubicacion':
-        ubicacion = parametros.get('ubicacion', '')
-        if ubicacion:
-            query = query.filter(
-                Q(ubicacion__icontains=ubicacion) | 
-                Q(direccion__icontains=ubicacion)
-            )
-    
+        criterios['ubicacion'] = parametros.get('ubicacion', '') or None
+
     elif tipo_consulta == 'gratuitos' or parametros.get('solo_gratuitos'):
-        query = query.filter(precio=0)
-    
+        criterios['solo_gratuitos'] = True
+
     elif tipo_consulta == 'proximos':
-        dias = parametros.get('dias_proximos', 7)
-        fecha_limite = timezone.now() + timedelta(days=dias)
-        query = query.filter(
-            fecha_inicio__gte=timezone.now(),
-            fecha_inicio__lte=fecha_limite
-        )
-    
+        ahora = timezone.now()
+        criterios['desde'] = ahora
+        criterios['hasta'] = ahora + timedelta(days=parametros.get('dias_proximos', 7))
+        criterios['hasta_incluido'] = True
+
     elif tipo_consulta == 'busqueda':
         texto = parametros.get('texto_busqueda', '')
         fecha_detectada, granularidad_detectada = detectar_fecha_en_texto(texto)
         if fecha_detectada:
-            if granularidad_detectada == "mes":
-                fecha_fin_detectada = _primer_dia_siguiente_mes(fecha_detectada)
-            else:
-                fecha_fin_detectada = fecha_detectada + timedelta(days=1)
-            query = query.filter(
-                fecha_inicio__gte=fecha_detectada,
-                fecha_inicio__lt=fecha_fin_detectada
-            )
+            criterios['desde'] = fecha_detectada
+            criterios['hasta'] = _fin_periodo(fecha_detectada, granularidad_detectada)
         elif texto:
+            criterios['texto'] = texto
+
+    # Las fechas que pide el usuario son días o meses completos; los
+    # "próximos" son un rango de horas desde ahora
+    if criterios['desde'] is not None and not criterios['hasta_incluido']:
+        primer_dia = _dia_local(criterios['desde'])
+        siguiente_dia = _dia_local(criterios['hasta']) if criterios['hasta'] is not None else None
+        if primer_dia and (criterios['hasta'] is None or siguiente_dia):
+            criterios['dias'] = (primer_dia, siguiente_dia)
+
+    # Filtrar por precio máximo (incluye eventos gratuitos) - se aplica a cualquier tipo de consulta
+    precio_maximo = parametros.get('precio_maximo')
+    if precio_maximo is not None:
+        criterios['precio_maximo'] = Decimal(str(precio_maximo))
+
+    return criterios
+
+
+def _dia_local(fecha):
+    """
+    El día local que empieza en ``fecha``, o None si no es una medianoche local.
+    """
+    local = timezone.localtime(fecha)
+    if local != local.replace(hour=0, minute=0, second=0, microsecond=0):
+        return None
+    return local.date()
+
+
+def _fin_periodo(fecha, granularidad):
+    """
+    Inicio del periodo siguiente al que empieza en ``fecha``: el primer día
+    del mes siguiente, o el día siguiente.
+    """
+    if granularidad == "mes":
+        return _primer_dia_siguiente_mes(fecha)
+    return fecha + timedelta(days=1)
+
+
+def _consulta_orm(criterios):
+    """
+    Consulta de Django para los criterios de ``criterios_consulta``.
+    """
+    # Base query: solo eventos activos
+    query = Evento.objects.filter(activo=True)
+    if criterios['vacio']:
+        query = query.none()
+
+    if criterios['dias'] is not None:
+        # Ya ordenada por (fecha_inicio, id) desde el índice del calendario
+        query = filtrar_por_dias(query, *criterios['dias'])
+    else:
+        if criterios['desde'] is not None:
+            query = query.filter(fecha_inicio__gte=criterios['desde'])
+        if criterios['hasta'] is not None:
+            if criterios['hasta_incluido']:
+                query = query.filter(fecha_inicio__lte=criterios['hasta'])
+            else:
+                query = query.filter(fecha_inicio__lt=criterios['hasta'])
+
+    if criterios['categoria']:
+        query = query.filter(categoria=criterios['categoria'])
+
+    if criterios['ubicacion']:
+        query = query.filter(
+            Q(ubicacion__icontains=criterios['ubicacion']) |
+            Q(direccion__icontains=criterios['ubicacion'])
+        )
+
+    if criterios['solo_gratuitos']:
+        query = query.filter(precio=0)
+
+    texto = criterios['texto']
+    if texto:
+        # Índice de texto completo (por relevancia) o, si el motor no lo
+        # tiene, icontains sobre los mismos campos
+        por_relevancia = filtrar_por_texto(query, texto)
+        if por_relevancia is not None:
+            query = por_relevancia
+        else:
             query = query.filter(
                 Q(titulo__icontains=texto) |
                 Q(descripcion__icontains=texto) |
                 Q(ubicacion__icontains=texto)
             )
-    
-    # Filtrar por precio máximo (incluye eventos gratuitos) - se aplica a cualquier tipo de consulta
-    precio_maximo = parametros.get('precio_maximo')
-    if precio_maximo is not None:
-        from decimal import Decimal
-        precio_max_decimal = Decimal(str(precio_maximo))
+
+    if criterios['precio_maximo'] is not None:
         # Incluir eventos gratuitos (precio=0) y eventos con precio <= precio_maximo
         query = query.filter(
-            Q(precio=0) | Q(precio__lte=precio_max_decimal)
+            Q(precio=0) | Q(precio__lte=criterios['precio_maximo'])
         )
+
+    # Ordenar por relevancia en las búsquedas de texto y si no por fecha de
+    # inicio; el id desempata para poder paginar por cursor
+    if 'relevancia' in query.query.annotations:
+        query = query.order_by('relevancia', 'id')
+    elif criterios['dias'] is None:
+        query = query.order_by('fecha_inicio', 'id')
+
+    return proyeccion_tarjetas(query)
+
+
+# Columnas que leen las tarjetas (_info_evento), la firma de cache_resumenes y
+# el cursor de paginación. La descripción se recorta en SQL (descripcion_corta).
+CAMPOS_TARJETA = (
+    'id', 'titulo', 'fecha_inicio', 'ubicacion', 'precio', 'categoria', 'fecha_actualizacion', 'imagen_derivados',
+)
+LARGO_DESCRIPCION_TARJETA = 200
+
+
+def proyeccion_tarjetas(query):
+    """
+    Limita la consulta a las columnas de las tarjetas, para no traer la
+    descripción completa ni el resto del modelo de cada evento.
+    """
+    return query.only(*CAMPOS_TARJETA).annotate(
+        descripcion_corta=Left('descripcion', LARGO_DESCRIPCION_TARJETA)
+    )
+
+
+# Eventos activos en memoria para ejecutar_consulta_eventos con
+# settings.CATALOGO_EN_MEMORIA; se actualiza al guardar o eliminar un evento
+# (signals.py).
+catalogo_memoria = CatalogoMemoria(CAMPOS_TARJETA, LARGO_DESCRIPCION_TARJETA)
+
+# Series de eventos recurrentes activas, leídas una vez por proceso; se
+# descartan al guardar o eliminar una serie (signals.py).
+series_recurrentes = CatalogoSeries(LARGO_DESCRIPCION_TARJETA)
+
+# Versión del catálogo en la base de datos (version_catalogo.py): cuando otro
+# proceso cambia los eventos se descartan las cachés que dependen de ellos.
+# La de intenciones no se toca: guarda parámetros interpretados del mensaje,
+# no datos de eventos.
+vigilante_catalogo = VigilanteVersion(intervalo=settings.CATALOGO_VERSION_INTERVALO)
+vigilante_catalogo.al_cambiar(cache_resumenes.limpiar)
+vigilante_catalogo.al_cambiar(catalogo_memoria.descartar)
+vigilante_catalogo.al_cambiar(muestreador_recomendaciones.invalidar)
+vigilante_catalogo.al_cambiar(series_recurrentes.descartar)
+
+
+# Sal de signing para los cursores de paginación de eventos
+SAL_CURSOR = 'chatbot.eventos.cursor'
+
+
+def paginar_eventos(eventos, parametros, posicion=None):
+    """
+    Evalúa solo una página de la consulta de ``ejecutar_consulta_eventos``:
+    los settings.EVENTOS_POR_PAGINA eventos siguientes a ``posicion``
+    (valor del primer campo de orden e id del último evento ya mostrado), o
+    los primeros si no se indica.
     
-    # Ordenar por fecha de inicio
-    query = query.order_by('fecha_inicio')
-    
-    return query
+    Retorna (eventos, cursor): cursor permite pedir la página siguiente con
+    ``siguiente_pagina`` sin volver a interpretar el mensaje, o es None si
+    no hay más eventos.
+    """
+    if isinstance(eventos, ConsultaConSeries):
+        pagina = eventos.pagina(_pagina_eventos(eventos.eventos, posicion), posicion, settings.EVENTOS_POR_PAGINA + 1)
+        return _cortar_pagina(pagina, parametros, eventos.campo_orden)
+    if not isinstance(eventos, ConsultaMemoria) and not hasattr(eventos, 'filter'):
+        # ejecutar_consulta_eventos retorna una lista vacía para recomendaciones
+        return list(eventos), None
+    return _cortar_pagina(_pagina_eventos(eventos, posicion), parametros, _campo_orden(eventos))
+
+
+async def paginar_eventos_async(eventos, parametros, posicion=None):
+    """
+    Versión asíncrona de ``paginar_eventos``.
+    """
+    consulta = eventos.eventos if isinstance(eventos, ConsultaConSeries) else eventos
+    if isinstance(consulta, ConsultaMemoria) or not hasattr(consulta, 'filter'):
+        # El catálogo en memoria (y las series) no esperan a la base de datos
+        return paginar_eventos(eventos, parametros, posicion)
+    pagina = [evento async for evento in _desde_posicion(consulta, posicion)]
+    if isinstance(eventos, ConsultaConSeries):
+        pagina = eventos.pagina(pagina, posicion, settings.EVENTOS_POR_PAGINA + 1)
+    return _cortar_pagina(pagina, parametros, _campo_orden(eventos))
+
+
+def _pagina_eventos(eventos, posicion):
+    # Los eventos (sin series) que siguen a ``posicion``, uno de más para
+    # saber si hay otra página
+    if isinstance(eventos, ConsultaMemoria):
+        return eventos.pagina(posicion, settings.EVENTOS_POR_PAGINA + 1)
+    return list(_desde_posicion(eventos, posicion))
+
+
+def _campo_orden(eventos):
+    # 'fecha_inicio', o 'relevancia' en las búsquedas de texto
+    if isinstance(eventos, (ConsultaMemoria, ConsultaConSeries)):
+        return eventos.campo_orden
+    if es_consulta_por_dias(eventos):
+        # El orden del calendario equivale a (fecha_inicio, id)
+        return 'fecha_inicio'
+    return eventos.query.order_by[0]
+
+
+def _desde_posicion(eventos, posicion):
+    """
+    Filtro por clave (keyset) sobre el orden (campo, id): a diferencia de
+    OFFSET, no recorre las páginas anteriores. Pide un evento de más para
+    saber si hay otra página.
+    """
+    if posicion is not None:
+        campo = _campo_orden(eventos)
+        valor, pk = posicion
+        # El >= redundante permite buscar en los índices (..., fecha_inicio, id)
+        # por rango en lugar de recorrerlos
+        eventos = eventos.filter(
+            Q(**{f'{campo}__gte': valor}),
+            Q(**{f'{campo}__gt': valor}) | Q(id__gt=pk),
+        )
+    return eventos[:settings.EVENTOS_POR_PAGINA + 1]
+
+
+def _cortar_pagina(eventos, parametros, campo):
+    if len(eventos) <= settings.EVENTOS_POR_PAGINA:
+        return eventos, None
+    eventos = eventos[:settings.EVENTOS_POR_PAGINA]
+    return eventos, _crear_cursor(parametros, getattr(eventos[-1], campo), eventos[-1].pk)
+
+
+def _crear_cursor(parametros, valor, pk):
+    """
+    El cursor lleva los parámetros ya interpretados y la posición del último
+    evento, firmado para que el cliente no pueda alterarlo.
+    """
+    return signing.dumps(
+        {
+            'parametros': parametros,
+            'valor': valor.isoformat() if isinstance(valor, datetime) else valor,
+            'id': pk,
+        },
+        salt=SAL_CURSOR,
+        compress=True,
+    )
+
+
+def siguiente_pagina(cursor):
+    """
+    Retorna (eventos_info, cursor) de la página que sigue a ``cursor``, sin
+    llamar a Gemini. Lanza ``signing.BadSignature`` si el cursor no es válido.
+    """
+    datos = signing.loads(cursor, salt=SAL_CURSOR)
+    parametros = datos['parametros']
+    eventos = ejecutar_consulta_eventos(parametros)
+    valor = datos['valor']
+    if _campo_orden(eventos) == 'fecha_inicio':
+        valor = datetime.fromisoformat(valor)
+    eventos, cursor = paginar_eventos(eventos, parametros, (valor, datos['id']))
+    return [_info_evento(evento) for evento in eventos], cursor
+
+
+RESPUESTA_SIN_EVENTOS = "No encontré eventos que coincidan con tu búsqueda. ¿Podrías intentar con otros criterios?"
 
 
 def formatear_respuesta_eventos(eventos, parametros):
     """
     Formatea los eventos encontrados en una respuesta amigable usando Gemini.
+    Si la misma lista ya se presentó con los mismos criterios, reutiliza uno
+    de los textos guardados en ``cache_resumenes``.
     """
-    if not eventos.exists():
-        return "No encontré eventos que coincidan con tu búsqueda. ¿Podrías intentar con otros criterios?", []
-    
-    # Preparar información de eventos para Gemini
-    eventos_info = []
-    for evento in eventos:
-        eventos_info.append({
-            'titulo': evento.titulo,
-            'descripcion': evento.descripcion[:200],  # Limitar descripción
-            'fecha': evento.fecha_inicio.strftime('%d/%m/%Y %H:%M'),
-            'ubicacion': evento.ubicacion,
-            'precio': 'Gratis' if evento.es_gratuito else f'${evento.precio}',
-            'categoria': evento.get_categoria_display()
-        })
-    
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-    
-    # Detectar si hay criterios específicos para hacer la respuesta más bromista
-    tiene_criterios = any([
-        parametros.get('fecha'),
-        parametros.get('fecha_inicio'),
-        parametros.get('fecha_fin'),
-        parametros.get('categoria'),
-        parametros.get('ubicacion'),
-        parametros.get('solo_gratuitos'),
-        parametros.get('precio_maximo'),
-        parametros.get('dias_proximos'),
-        parametros.get('texto_busqueda')
-    ])
+    eventos_info, firma = _eventos_info(eventos)
+    if not eventos_info:
+        return RESPUESTA_SIN_EVENTOS, []
     
-    criterio_contexto = ""
-    if parametros.get('precio_maximo'):
-        criterio_contexto = f"El usuario buscó eventos de menos de ${parametros.get('precio_maximo')} dólares (los eventos gratuitos también cuentan)."
-    elif parametros.get('solo_gratuitos'):
-        criterio_contexto = "El usuario buscó eventos gratuitos."
-    elif parametros.get('categoria'):
-        criterio_contexto = f"El usuario buscó eventos de {parametros.get('categoria')}."
+    clave = _clave_resumen(firma, parametros)
+    resumen = _resumen_guardado(clave, firma)
+    if resumen is not None:
+        return resumen, eventos_info
+
+    try:
+        resumen = _generar_texto('formateo', _prompt_formateo(eventos_info, parametros))
+    except Exception as e:
+        # Fallback: respuesta simple si Gemini falla
+        return _respuesta_formateo_respaldo(eventos_info), eventos_info
+
+    _guardar_resumen(clave, firma, resumen)
+    return resumen, eventos_info
+
+
+async def formatear_respuesta_eventos_async(eventos, parametros):
+    """
+    Versión asíncrona de ``formatear_respuesta_eventos``. La consulta se
+    evalúa con la API asíncrona de querysets.
+    """
+    eventos_info, firma = await _eventos_info_async(eventos)
+    if not eventos_info:
+        return RESPUESTA_SIN_EVENTOS, []
     
-    prompt = f"""Eres un asistente amigable que informa sobre eventos en la ciudad de Loja, Ecuador.
-El usuario hizo la siguiente consulta y encontré {len(eventos_info)} evento(s).
-{criterio_contexto if criterio_contexto else ""}
+    clave = _clave_resumen(firma, parametros)
+    resumen = await sync_to_async(_resumen_guardado)(clave, firma)
+    if resumen is not None:
+        return resumen, eventos_info
 
-Información de los eventos:
-{json.dumps(eventos_info, ensure_ascii=False, indent=2)}
+    try:
+        resumen = await _generar_texto_async('formateo', _prompt_formateo(eventos_info, parametros))
+    except Exception as e:
+        return _respuesta_formateo_respaldo(eventos_info), eventos_info
+
+    await sync_to_async(_guardar_resumen)(clave, firma, resumen)
+    return resumen, eventos_info
+
+
+def formatear_respuesta_eventos_stream(eventos, parametros):
+    """
+    Variante en streaming de ``formatear_respuesta_eventos``: retorna
+    (eventos_info, fragmentos), donde eventos_info está listo de inmediato y
+    fragmentos es un iterador con el texto de Gemini a medida que llega.
+    """
+    eventos_info, firma = _eventos_info(eventos)
+    if not eventos_info:
+        return [], iter([RESPUESTA_SIN_EVENTOS])
+    
+    clave = _clave_resumen(firma, parametros)
+    resumen = _resumen_guardado(clave, firma)
+    if resumen is not None:
+        return eventos_info, iter([resumen])
+
+    return eventos_info, _generar_texto_stream(
+        'formateo',
+        _prompt_formateo(eventos_info, parametros),
+        _respuesta_formateo_respaldo(eventos_info),
+        al_terminar=functools.partial(_guardar_resumen, clave, firma),
+    )
+
+
+async def formatear_respuesta_eventos_stream_async(eventos, parametros):
+    """
+    Versión asíncrona de ``formatear_respuesta_eventos_stream``; los
+    fragmentos son un iterador asíncrono.
+    """
+    eventos_info, firma = await _eventos_info_async(eventos)
+    if not eventos_info:
+        return [], _iterador_async([RESPUESTA_SIN_EVENTOS])
+    
+    clave = _clave_resumen(firma, parametros)
+    resumen = await sync_to_async(_resumen_guardado)(clave, firma)
+    if resumen is not None:
+        return eventos_info, _iterador_async([resumen])
+
+    return eventos_info, _generar_texto_stream_async(
+        'formateo',
+        _prompt_formateo(eventos_info, parametros),
+        _respuesta_formateo_respaldo(eventos_info),
+        al_terminar=functools.partial(_guardar_resumen, clave, firma),
+    )
+
+
+async def _iterador_async(valores):
+    for valor in valores:
+        yield valor
+
+
+def _info_evento(evento):
+    """
+    Información de un evento para Gemini y para las tarjetas del frontend.
+    Espera un evento cargado con ``proyeccion_tarjetas``.
+    """
+    return {
+        'titulo': evento.titulo,
+        'descripcion': evento.descripcion_corta or '',
+        'fecha': evento.fecha_inicio.strftime('%d/%m/%Y %H:%M'),
+        'ubicacion': evento.ubicacion,
+        'precio': 'Gratis' if evento.es_gratuito else f'${evento.precio}',
+        'categoria': evento.get_categoria_display(),
+        'imagen': info_imagen(evento.imagen_derivados),
+    }
+
+
+def _eventos_info(eventos):
+    """
+    Evalúa la consulta una sola vez y retorna (eventos_info, firma): la
+    información de cada evento y la tupla ordenada de (id,
+    fecha_actualizacion, fecha_inicio) que identifica la lista en
+    ``cache_resumenes``.
+    """
+    return _info_y_firma(list(eventos))
+
+
+async def _eventos_info_async(eventos):
+    """
+    Versión asíncrona de ``_eventos_info`` usando la API asíncrona de querysets.
+    """
+    if hasattr(eventos, 'aiterator'):
+        return _info_y_firma([evento async for evento in eventos])
+    # ejecutar_consulta_eventos retorna una lista vacía para recomendaciones
+    return _eventos_info(eventos)
+
+
+def _info_y_firma(eventos):
+    eventos_info = [_info_evento(evento) for evento in eventos]
+    # Las ocurrencias de una serie comparten id (el de la serie en negativo,
+    # ver recurrencia.py): la fecha de inicio las distingue
+    firma = tuple(
+        (evento.pk, evento.fecha_actualizacion.timestamp(), evento.fecha_inicio.timestamp()) for evento in eventos
+    )
+    return eventos_info, firma
+
+
+def _clave_resumen(firma, parametros):
+    """
+    Clave de ``cache_resumenes``: la lista de eventos más los criterios que
+    cambian el texto del prompt (ver criterio_contexto en _prompt_formateo).
+    """
+    return (
+        firma,
+        str(parametros.get('precio_maximo') or ''),
+        bool(parametros.get('solo_gratuitos')),
+        str(parametros.get('categoria') or ''),
+    )
+
+
+def _resumen_guardado(clave, firma):
+    """
+    Una de las variantes guardadas para la lista, o None si hay que generar
+    otra. El L1 es ``cache_resumenes``; si le faltan variantes se buscan en L2
+    las que guardaron otros procesos.
+    """
+    resumen = cache_resumenes.obtener_variante(clave)
+    if resumen is not None:
+        cache_niveles.registrar_acierto_l1('resumenes')
+        return resumen
+
+    variantes = cache_niveles.obtener_l2('resumenes', clave, ())
+    if len(variantes) < cache_resumenes.variantes:
+        return None
+    etiquetas = [pk for pk, *_ in firma]
+    for variante in variantes:
+        cache_resumenes.agregar_variante(clave, variante, etiquetas=etiquetas)
+    return random.choice(variantes)
+
+
+def _guardar_resumen(clave, firma, resumen):
+    """
+    Agrega ``resumen`` a las variantes de la lista en L1 y copia todas las
+    variantes del proceso a L2.
+    """
+    if resumen:
+        cache_resumenes.agregar_variante(clave, resumen, etiquetas=[pk for pk, *_ in firma])
+        cache_niveles.guardar_l2('resumenes', clave, cache_resumenes.variantes_de(clave))
+
+
+INSTRUCCIONES_FORMATEO = """Eres un asistente amigable que informa sobre eventos en la ciudad de Loja, Ecuador.
+Cada mensaje indica cuántos eventos se encontraron para la consulta del usuario, el criterio de búsqueda si lo hubo y la información de los eventos.
 
 Genera una respuesta CORTA, PERSONAL, DESCRIPTIVA y con un toque de broma cuando hay criterios específicos:
 1. Si hay 1 evento: Di algo como "Mmm, te recomiendo este evento, se ve que va a estar chevere" o "Este evento se ve interesante, te lo recomiendo"
@@ -482,20 +1627,42 @@ Ejemplos de buenas respuestas:
 - Con precio máximo: "Mmm, encontré una lista de eventos que van a hacer que no te quede chiro daño. Revisa las tarjetas."
 - Con varios eventos: "Encontré varios eventos que se ven interesantes, pues. Te muestro las tarjetas."
 """
+
+
+def _prompt_formateo(eventos_info, parametros):
+    """
+    Construye la parte variable del prompt con el que Gemini presenta la
+    lista de eventos; las instrucciones van en INSTRUCCIONES_FORMATEO.
+    """
+    criterio_contexto = ""
+    if parametros.get('precio_maximo'):
+        criterio_contexto = f"El usuario buscó eventos de menos de ${parametros.get('precio_maximo')} dólares (los eventos gratuitos también cuentan)."
+    elif parametros.get('solo_gratuitos'):
+        criterio_contexto = "El usuario buscó eventos gratuitos."
+    elif parametros.get('categoria'):
+        criterio_contexto = f"El usuario buscó eventos de {parametros.get('categoria')}."
     
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-        )
-        return response.text.strip(), eventos_info
-    except Exception as e:
-        # Fallback: respuesta simple si Gemini falla
-        respuesta = (
-            f"Encontré {len(eventos_info)} evento(s). "
-            "Te muestro las tarjetas con los detalles; dime si quieres que profundice en alguno."
-        )
-        return respuesta, eventos_info
+    return f"""El usuario hizo una consulta y encontré {len(eventos_info)} evento(s).
+{criterio_contexto if criterio_contexto else ""}
+
+Información de los eventos:
+{json.dumps(eventos_info, ensure_ascii=False, indent=2)}
+"""
+
+
+def _respuesta_formateo_respaldo(eventos_info):
+    return (
+        f"Encontré {len(eventos_info)} evento(s). "
+        "Te muestro las tarjetas con los detalles; dime si quieres que profundice en alguno."
+    )
+
+
+def es_respuesta_respaldo(respuesta, eventos_info):
+    """
+    True si ``respuesta`` es el texto de respaldo de una lista de eventos
+    (Gemini no respondió), que no conviene guardar como respuesta final.
+    """
+    return respuesta == _respuesta_formateo_respaldo(eventos_info)
 
 
 def generar_respuesta_recomendacion(evento, mensaje_usuario):
@@ -503,22 +1670,47 @@ def generar_respuesta_recomendacion(evento, mensaje_usuario):
     Genera una respuesta personalizada para recomendaciones de eventos,
     tomando en cuenta el contexto del mensaje del usuario.
     """
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-    
-    fecha_inicio = timezone.localtime(evento.fecha_inicio)
-    precio_texto = "Gratis" if evento.es_gratuito else f"${evento.precio}"
-    ubicacion_texto = evento.ubicacion or "Ubicación por confirmar"
-    
-    prompt = f"""Eres un asistente amigable que recomienda eventos en la ciudad de Loja, Ecuador.
-El usuario dijo: "{mensaje_usuario}"
+    try:
+        return _generar_texto('recomendacion', _prompt_recomendacion(evento, mensaje_usuario))
+    except Exception as e:
+        # Fallback: respuesta simple si Gemini falla
+        return _respuesta_recomendacion_respaldo(evento)
 
-Y le vas a recomendar este evento:
-- Título: {evento.titulo}
-- Categoría: {evento.get_categoria_display()}
-- Descripción: {evento.descripcion or 'Sin descripción'}
-- Fecha: {fecha_inicio.strftime('%d/%m/%Y a las %H:%M')}
-- Ubicación: {ubicacion_texto}
-- Precio: {precio_texto}
+
+async def generar_respuesta_recomendacion_async(evento, mensaje_usuario):
+    """
+    Versión asíncrona de ``generar_respuesta_recomendacion``.
+    """
+    try:
+        return await _generar_texto_async('recomendacion', _prompt_recomendacion(evento, mensaje_usuario))
+    except Exception as e:
+        return _respuesta_recomendacion_respaldo(evento)
+
+
+def generar_respuesta_recomendacion_stream(evento, mensaje_usuario):
+    """
+    Variante en streaming de ``generar_respuesta_recomendacion``.
+    """
+    return _generar_texto_stream(
+        'recomendacion',
+        _prompt_recomendacion(evento, mensaje_usuario),
+        _respuesta_recomendacion_respaldo(evento),
+    )
+
+
+def generar_respuesta_recomendacion_stream_async(evento, mensaje_usuario):
+    """
+    Variante en streaming de ``generar_respuesta_recomendacion_async``.
+    """
+    return _generar_texto_stream_async(
+        'recomendacion',
+        _prompt_recomendacion(evento, mensaje_usuario),
+        _respuesta_recomendacion_respaldo(evento),
+    )
+
+
+INSTRUCCIONES_RECOMENDACION = """Eres un asistente amigable que recomienda eventos en la ciudad de Loja, Ecuador.
+Cada mensaje trae lo que dijo el usuario y el evento que le vas a recomendar.
 
 Genera una respuesta CORTA, PERSONAL y RELEVANTE (máximo 2 frases) que:
 1. Tome en cuenta el contexto del mensaje del usuario (si dice que está aburrida, menciona que el evento la ayudará a no aburrirse; si dice que busca algo divertido, menciona que será divertido, etc.)
@@ -548,16 +1740,34 @@ Ejemplos de buenas respuestas según contexto:
 
 Responde SOLO con el texto, sin explicaciones adicionales.
 """
+
+
+def _prompt_recomendacion(evento, mensaje_usuario):
+    """
+    Construye la parte variable del prompt con el que Gemini recomienda un
+    evento; las instrucciones van en INSTRUCCIONES_RECOMENDACION.
+    """
+    fecha_inicio = timezone.localtime(evento.fecha_inicio)
+    precio_texto = "Gratis" if evento.es_gratuito else f"${evento.precio}"
+    ubicacion_texto = evento.ubicacion or "Ubicación por confirmar"
     
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-        )
-        return response.text.strip()
-    except Exception as e:
-        # Fallback: respuesta simple si Gemini falla
-        return f"¡Claro mijo! Te recomiendo el {evento.titulo}. Se ve que va a estar chevere. Revisa la tarjeta para más detalles."
+    return f"""El usuario dijo: "{mensaje_usuario}"
+
+Y le vas a recomendar este evento:
+- Título: {evento.titulo}
+- Categoría: {evento.get_categoria_display()}
+- Descripción: {evento.descripcion or 'Sin descripción'}
+- Fecha: {fecha_inicio.strftime('%d/%m/%Y a las %H:%M')}
+- Ubicación: {ubicacion_texto}
+- Precio: {precio_texto}
+"""
+
+
+def _respuesta_recomendacion_respaldo(evento):
+    return f"¡Claro mijo! Te recomiendo el {evento.titulo}. Se ve que va a estar chevere. Revisa la tarjeta para más detalles."
+
+
+RESPUESTA_FUERA_DE_TEMA = "No puedo ayudarte con eso, pero puedo contarte sobre eventos en Loja. ¿Qué eventos te interesan?"
 
 
 def generar_respuesta_fallback(mensaje_usuario):
@@ -565,11 +1775,38 @@ def generar_respuesta_fallback(mensaje_usuario):
     Genera una respuesta corta (máximo una línea) para preguntas fuera de tema,
     siempre redirigiendo a preguntar sobre eventos.
     """
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-    
-    prompt = f"""Eres un asistente de eventos en la ciudad de Loja, Ecuador. El usuario hizo una pregunta que NO es sobre eventos.
+    try:
+        return _generar_texto('fallback', _prompt_fallback(mensaje_usuario))
+    except Exception as e:
+        # Fallback si Gemini falla
+        return RESPUESTA_FUERA_DE_TEMA
+
+
+async def generar_respuesta_fallback_async(mensaje_usuario):
+    """
+    Versión asíncrona de ``generar_respuesta_fallback``.
+    """
+    try:
+        return await _generar_texto_async('fallback', _prompt_fallback(mensaje_usuario))
+    except Exception as e:
+        return RESPUESTA_FUERA_DE_TEMA
 
-Pregunta del usuario: "{mensaje_usuario}"
+
+def generar_respuesta_fallback_stream(mensaje_usuario):
+    """
+    Variante en streaming de ``generar_respuesta_fallback``.
+    """
+    return _generar_texto_stream('fallback', _prompt_fallback(mensaje_usuario), RESPUESTA_FUERA_DE_TEMA)
+
+
+def generar_respuesta_fallback_stream_async(mensaje_usuario):
+    """
+    Variante en streaming de ``generar_respuesta_fallback_async``.
+    """
+    return _generar_texto_stream_async('fallback', _prompt_fallback(mensaje_usuario), RESPUESTA_FUERA_DE_TEMA)
+
+
+INSTRUCCIONES_FALLBACK = """Eres un asistente de eventos en la ciudad de Loja, Ecuador. Cada mensaje es una pregunta del usuario que NO es sobre eventos.
 
 Tu tarea es:
 1. Responder brevemente a la pregunta (máximo una línea, muy corto)
@@ -590,14 +1827,22 @@ Ejemplos de respuestas:
 
 Responde SOLO con el texto, sin explicaciones adicionales.
 """
-    
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-        )
-        return response.text.strip()
-    except Exception as e:
-        # Fallback si Gemini falla
-        return "No puedo ayudarte con eso, pero puedo contarte sobre eventos en Loja. ¿Qué eventos te interesan?"
 
+
+def _prompt_fallback(mensaje_usuario):
+    """
+    Construye la parte variable del prompt para preguntas que no son sobre
+    eventos; las instrucciones van en INSTRUCCIONES_FALLBACK.
+    """
+    return f"""Pregunta del usuario: "{mensaje_usuario}"
+"""
+
+
+# Instrucciones fijas de cada etapa; se construyen una vez al importar el
+# módulo y se envían como system_instruction (ver _config_etapa).
+INSTRUCCIONES_POR_ETAPA = {
+    'interpretacion': INSTRUCCIONES_INTERPRETACION,
+    'formateo': INSTRUCCIONES_FORMATEO,
+    'recomendacion': INSTRUCCIONES_RECOMENDACION,
+    'fallback': INSTRUCCIONES_FALLBACK,
+}
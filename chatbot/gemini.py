@@ -0,0 +1,259 @@
+"""
+Cliente compartido de Gemini.
+
+Crear un ``genai.Client`` por llamada obliga a construir el cliente y a abrir
+una conexión TLS nueva en cada mensaje. Este módulo mantiene un único cliente
+por proceso, con un pool de conexiones keep-alive y timeouts explícitos
+configurados en ``settings.GEMINI_HTTP``.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+import ssl
+import threading
+import time
+import weakref
+
+import certifi
+import httpx
+from django.conf import settings
+from google import genai
+from google.genai import types
+
+
+class _TimeoutDelClienteMixin:
+    """
+    genai pasa ``timeout=None`` en cada petición cuando ``HttpOptions.timeout``
+    no está definido, y httpx interpreta eso como "sin límite". Aquí se
+    sustituye por el timeout configurado en el propio cliente httpx, de forma
+    que se respeten por separado los límites de conexión y de lectura.
+    """
+
+    def build_request(self, *args, timeout=httpx.USE_CLIENT_DEFAULT, **kwargs):
+        if timeout is None:
+            timeout = httpx.USE_CLIENT_DEFAULT
+        return super().build_request(*args, timeout=timeout, **kwargs)
+
+
+class _ClienteHttp(_TimeoutDelClienteMixin, httpx.Client):
+    pass
+
+
+class _ClienteHttpAsync(_TimeoutDelClienteMixin, httpx.AsyncClient):
+    pass
+
+
+# Instante (time.monotonic) en que vence la llamada síncrona en curso, ver
+# ``plazo_llamada``
+_plazo = contextvars.ContextVar('plazo_gemini', default=None)
+
+
+@contextlib.contextmanager
+def plazo_llamada(segundos):
+    """
+    Mientras está activo, las peticiones del cliente síncrono del contexto
+    actual se cortan con ``httpx.ReadTimeout`` a los ``segundos`` de haber
+    entrado, aunque el servidor siga enviando bytes. El timeout de httpx es
+    por operación: una respuesta que llega de a poco nunca lo agota.
+    """
+    token = _plazo.set(time.monotonic() + segundos)
+    try:
+        yield
+    finally:
+        _plazo.reset(token)
+
+
+class _FlujoConPlazo(httpx.SyncByteStream):
+    """Cuerpo de una respuesta que se corta al vencer el plazo de la llamada."""
+
+    def __init__(self, flujo, plazo, request):
+        self._flujo = flujo
+        self._plazo = plazo
+        self._request = request
+
+    def __iter__(self):
+        for fragmento in self._flujo:
+            if time.monotonic() > self._plazo:
+                raise httpx.ReadTimeout('Se agotó el plazo de la llamada', request=self._request)
+            yield fragmento
+
+    def close(self):
+        self._flujo.close()
+
+
+class _TransportePlazo(httpx.HTTPTransport):
+    """
+    Transporte del cliente síncrono que respeta ``plazo_llamada``: ninguna
+    espera (conexión, escritura o lectura) dura más que lo que le queda a la
+    llamada, y el cuerpo se corta si el plazo vence mientras se lee.
+    """
+
+    def handle_request(self, request):
+        plazo = _plazo.get()
+        if plazo is None:
+            return super().handle_request(request)
+
+        restante = plazo - time.monotonic()
+        if restante <= 0:
+            raise httpx.ConnectTimeout('Se agotó el plazo de la llamada', request=request)
+        request.extensions['timeout'] = {
+            operacion: restante if limite is None else min(limite, restante)
+            for operacion, limite in request.extensions.get('timeout', {}).items()
+        }
+        response = super().handle_request(request)
+        response.stream = _FlujoConPlazo(response.stream, plazo, request)
+        return response
+
+
+_cliente = None
+_cliente_pid = None
+_lock = threading.Lock()
+
+# Clientes asíncronos por event loop: las conexiones de httpx.AsyncClient
+# pertenecen al loop que las abrió (ver ``cliente_async``).
+_clientes_async = weakref.WeakKeyDictionary()
+
+
+@functools.lru_cache(maxsize=None)
+def _contexto_ssl():
+    """
+    Contexto SSL compartido por todos los clientes del proceso. Cargar los
+    certificados cuesta decenas de milisegundos, y genai y httpx crearían uno
+    por cliente.
+    """
+    return ssl.create_default_context(
+        cafile=os.environ.get('SSL_CERT_FILE', certifi.where()),
+        capath=os.environ.get('SSL_CERT_DIR'),
+    )
+
+
+def _opciones_http():
+    """
+    Construye los argumentos comunes de httpx a partir de ``settings.GEMINI_HTTP``.
+    """
+    config = settings.GEMINI_HTTP
+    timeout = httpx.Timeout(
+        config['TIMEOUT_LECTURA'],
+        connect=config['TIMEOUT_CONEXION'],
+    )
+    limites = httpx.Limits(
+        max_connections=config['MAX_CONEXIONES'],
+        max_keepalive_connections=config['MAX_CONEXIONES_KEEPALIVE'],
+        keepalive_expiry=config['KEEPALIVE_EXPIRY'],
+    )
+    return {'timeout': timeout, 'limits': limites, 'verify': _contexto_ssl()}
+
+
+def crear_cliente():
+    """
+    Crea un cliente de Gemini nuevo con su propio pool de conexiones.
+    Normalmente se usa ``obtener_cliente()``; esta función existe para
+    los benchmarks y para los casos que necesiten un cliente aislado.
+    """
+    opciones = _opciones_http()
+    http_options = types.HttpOptions(
+        base_url=settings.GEMINI_BASE_URL or None,
+        client_args={'verify': opciones['verify']},
+        async_client_args={'verify': opciones['verify']},
+        httpx_client=_ClienteHttp(
+            transport=_TransportePlazo(verify=opciones['verify'], limits=opciones['limits']),
+            **opciones,
+        ),
+        httpx_async_client=_ClienteHttpAsync(**opciones),
+    )
+    return genai.Client(api_key=settings.GEMINI_API_KEY, http_options=http_options)
+
+
+def obtener_cliente():
+    """
+    Retorna el cliente de Gemini del proceso actual, creándolo la primera vez.
+
+    Se vuelve a crear si el proceso cambió (por ejemplo, después del fork de
+    un worker de gunicorn con ``--preload``), porque las conexiones abiertas
+    no se pueden compartir entre procesos.
+    """
+    global _cliente, _cliente_pid
+
+    pid = os.getpid()
+    if _cliente is not None and _cliente_pid == pid:
+        return _cliente
+
+    with _lock:
+        if _cliente is None or _cliente_pid != pid:
+            _cliente = crear_cliente()
+            _cliente_pid = pid
+        return _cliente
+
+
+class _PoolsAsync:
+    """
+    Varios clientes asíncronos pequeños en lugar de uno grande.
+
+    httpcore revisa todas las conexiones de su pool (en tiempo cuadrático)
+    cada vez que entra o sale una petición, así que un pool de cientos de
+    conexiones satura el event loop. Repartir las llamadas entre varios pools
+    de ``MAX_CONEXIONES`` mantiene ese costo bajo; cada pool tiene además un
+    semáforo para que las peticiones esperen fuera de httpcore.
+    """
+
+    def __init__(self, cantidad, tamano):
+        self.clientes = [crear_cliente().aio for _ in range(cantidad)]
+        self.semaforos = [asyncio.Semaphore(tamano) for _ in range(cantidad)]
+        self.en_vuelo = [0] * cantidad
+
+    def menos_ocupado(self):
+        return min(range(len(self.clientes)), key=self.en_vuelo.__getitem__)
+
+
+def _pools_del_loop():
+    loop = asyncio.get_running_loop()
+    pools = _clientes_async.get(loop)
+    if pools is None:
+        config = settings.GEMINI_HTTP
+        pools = _PoolsAsync(config['POOLS_ASYNC'], config['MAX_CONEXIONES'])
+        _clientes_async[loop] = pools
+    return pools
+
+
+@contextlib.asynccontextmanager
+async def cliente_async():
+    """
+    Entrega un cliente asíncrono de Gemini (``client.aio``) del event loop
+    actual, reservando un cupo en el pool menos ocupado:
+
+        async with cliente_async() as client:
+            response = await client.models.generate_content(...)
+
+    Con ASGI hay un solo loop por proceso, así que los pools se comparten
+    entre todas las conversaciones del worker.
+    """
+    pools = _pools_del_loop()
+    indice = pools.menos_ocupado()
+    pools.en_vuelo[indice] += 1
+    try:
+        async with pools.semaforos[indice]:
+            yield pools.clientes[indice]
+    finally:
+        pools.en_vuelo[indice] -= 1
+
+
+def reiniciar_cliente():
+    """
+    Descarta el cliente actual. La siguiente llamada a ``obtener_cliente()``
+    creará uno nuevo con la configuración vigente.
+    """
+    global _cliente, _cliente_pid
+
+    with _lock:
+        cliente = _cliente
+        _cliente = None
+        _cliente_pid = None
+        _clientes_async.clear()
+
+    if cliente is not None:
+        try:
+            cliente.close()
+        except Exception:
+            pass
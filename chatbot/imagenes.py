@@ -0,0 +1,158 @@
+"""
+Derivados de Evento.imagen para las tarjetas del chat.
+
+El admin guarda la imagen tal como se sube (a veces varios megabytes); las
+tarjetas muestran versiones reducidas a los anchos de
+settings.IMAGENES_DERIVADOS, en WebP y en JPEG para los navegadores que no lo
+leen. Cada derivado se nombra con el hash de su contenido
+(``eventos/derivados/<hash>.webp``), así una URL nunca cambia de contenido y
+se puede guardar en caché sin fecha de expiración; subir la misma imagen dos
+veces no duplica archivos.
+
+Se generan en un hilo aparte cuando se confirma el guardado de un evento con
+una imagen nueva (signals.py), no dentro de la petición del admin. El
+resultado queda en ``Evento.imagen_derivados``, que se guarda con ``save``
+para que las cachés de eventos lo vean como cualquier otro cambio. Los
+eventos con imágenes anteriores a los derivados se procesan con
+``python manage.py generar_imagenes``.
+"""
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from .models import Evento
+
+CARPETA = 'eventos/derivados'
+
+# (formato en imagen_derivados y extensión, formato de Pillow)
+FORMATOS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+
+_ejecutor = ThreadPoolExecutor(
+    max_workers=settings.IMAGENES_DERIVADOS['HILOS'],
+    thread_name_prefix='derivados-imagen',
+)
+
+
+def necesita_derivados(evento):
+    """
+    True si los derivados guardados no son los de la imagen actual del
+    evento (o si se quitó la imagen y quedan derivados).
+    """
+    return (evento.imagen.name or '') != evento.imagen_derivados.get('origen', '')
+
+
+def programar(pk):
+    """
+    Genera los derivados del evento ``pk`` en el hilo de imágenes o, con
+    SEGUNDO_PLANO=False, en el hilo actual.
+    """
+    if settings.IMAGENES_DERIVADOS['SEGUNDO_PLANO']:
+        return _ejecutor.submit(_generar_en_hilo, pk)
+    generar_derivados(pk)
+
+
+def _generar_en_hilo(pk):
+    close_old_connections()
+    try:
+        generar_derivados(pk)
+    finally:
+        close_old_connections()
+
+
+def generar_derivados(pk):
+    """
+    Genera los derivados de la imagen actual del evento ``pk`` y los guarda
+    en ``imagen_derivados``. Una imagen que Pillow no puede leer queda
+    registrada con su error, para no reintentarla en cada guardado.
+    Retorna los derivados, o None si el evento ya no existe.
+    """
+    evento = Evento.objects.filter(pk=pk).only('id', 'imagen', 'imagen_derivados').first()
+    if evento is None:
+        return None
+
+    nombre = evento.imagen.name or ''
+    derivados = {}
+    if nombre:
+        try:
+            with evento.imagen.open('rb') as archivo, Image.open(archivo) as imagen:
+                derivados = crear_derivados(imagen)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            derivados = {'error': str(e)}
+        derivados['origen'] = nombre
+
+    # Si la imagen cambió mientras tanto, su propio guardado ya programó otros
+    if evento.imagen_derivados != derivados and Evento.objects.filter(pk=pk, imagen=nombre).exists():
+        evento.imagen_derivados = derivados
+        evento.save(update_fields=['imagen_derivados'])
+    return derivados
+
+
+def crear_derivados(imagen):
+    """
+    Escribe en el almacenamiento los derivados de la imagen de Pillow
+    ``imagen`` y retorna su descripción: el tamaño original y, por formato,
+    una lista de [ancho, alto, nombre] de menor a mayor. No amplía imágenes
+    más angostas que los anchos pedidos.
+    """
+    ajustes = settings.IMAGENES_DERIVADOS
+    # Las fotos de celular guardan la rotación en EXIF
+    imagen = ImageOps.exif_transpose(imagen)
+    if imagen.mode != 'RGB':
+        # JPEG no tiene transparencia: se aplana sobre blanco
+        fondo = Image.new('RGB', imagen.size, 'white')
+        fondo.paste(imagen, mask=imagen.convert('RGBA').getchannel('A'))
+        imagen = fondo
+    ancho_original, alto_original = imagen.size
+
+    derivados = {'ancho': ancho_original, 'alto': alto_original}
+    for clave, _ in FORMATOS:
+        derivados[clave] = []
+    for ancho in sorted({min(ancho, ancho_original) for ancho in ajustes['ANCHOS']}):
+        alto = max(1, round(alto_original * ancho / ancho_original))
+        reducida = imagen.resize((ancho, alto), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for clave, formato in FORMATOS:
+            datos = _codificar(reducida, formato, ajustes)
+            derivados[clave].append([ancho, alto, _guardar(datos, clave)])
+    return derivados
+
+
+def _codificar(imagen, formato, ajustes):
+    salida = io.BytesIO()
+    if formato == 'WEBP':
+        imagen.save(salida, 'WEBP', quality=ajustes['CALIDAD_WEBP'], method=4)
+    else:
+        imagen.save(salida, 'JPEG', quality=ajustes['CALIDAD_JPEG'], optimize=True, progressive=True)
+    return salida.getvalue()
+
+
+def _guardar(datos, extension):
+    nombre = f'{CARPETA}/{hashlib.sha256(datos).hexdigest()[:20]}.{extension}'
+    if not default_storage.exists(nombre):
+        nombre = default_storage.save(nombre, ContentFile(datos))
+    return nombre
+
+
+def info_imagen(derivados):
+    """
+    Imagen de una tarjeta para el frontend: la URL del JPEG más chico, los
+    srcset de cada formato y el tamaño del más chico (para reservar el
+    espacio antes de que cargue), o None si el evento no tiene derivados.
+    """
+    if not derivados or not derivados.get('jpeg'):
+        return None
+    ancho, alto, nombre = derivados['jpeg'][0]
+    return {
+        'src': default_storage.url(nombre),
+        'srcset': {
+            clave: ', '.join(f'{default_storage.url(nombre)} {ancho}w' for ancho, _, nombre in derivados[clave])
+            for clave, _ in FORMATOS
+        },
+        'ancho': ancho,
+        'alto': alto,
+    }
@@ -0,0 +1,517 @@
+"""
+Importación de eventos desde archivos CSV, JSON Lines e iCalendar.
+
+Los archivos se leen fila por fila y los eventos se guardan en lotes con
+INSERT ... ON CONFLICT DO UPDATE, una transacción por lote: la memoria no
+depende del tamaño del archivo y volver a importar un archivo actualiza sus
+eventos en lugar de duplicarlos.
+
+Cada evento se identifica por ``clave_importacion``: el hash del uid que trae
+la fuente (columna ``uid`` o ``id``, propiedad UID en iCalendar) o, si no
+trae, del título normalizado, la fecha de inicio y la ubicación.
+"""
+import contextlib
+import csv
+import functools
+import hashlib
+import json
+import re
+import time
+from datetime import date, datetime, time as hora, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import connection, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .busqueda import carga_masiva
+from .calendario import indexar_dias
+from .evento_queries import vigilante_catalogo
+from .models import Evento, normalizar_titulo
+
+FORMATOS_POR_EXTENSION = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.ics': 'ics',
+    '.ical': 'ics',
+}
+
+CAMPOS_IMPORTADOS = (
+    'titulo', 'descripcion', 'categoria', 'fecha_inicio', 'fecha_fin',
+    'ubicacion', 'direccion', 'precio', 'contacto', 'enlace', 'activo',
+)
+# Lo que se sobrescribe cuando el evento ya existe (no la imagen ni la fecha
+# de creación)
+CAMPOS_ACTUALIZADOS = CAMPOS_IMPORTADOS + ('titulo_normalizado', 'fecha_actualizacion')
+CAMPOS_INSERTADOS = CAMPOS_ACTUALIZADOS + ('clave_importacion', 'fecha_creacion', 'imagen_derivados')
+
+LARGOS = {
+    nombre: Evento._meta.get_field(nombre).max_length
+    for nombre in CAMPOS_IMPORTADOS
+    if Evento._meta.get_field(nombre).max_length
+}
+
+# Categoría por clave o por nombre ("Gastronomía", "gastronomia"); las demás
+# quedan como "otro"
+CATEGORIAS = {
+    **{clave: clave for clave, _ in Evento.CATEGORIA_CHOICES},
+    **{normalizar_titulo(nombre): clave for clave, nombre in Evento.CATEGORIA_CHOICES},
+}
+
+FORMATOS_FECHA = ('%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y')
+PRECIO_MAXIMO = Decimal(10) ** 8
+GRATIS = {'gratis', 'gratuito', 'libre', 'free'}
+VERDADEROS = {'1', 'true', 'si', 'yes', 'verdadero', 'activo'}
+FALSOS = {'0', 'false', 'no', 'falso', 'inactivo'}
+
+_validar_url = URLValidator()
+_ESCAPE_ICS = re.compile(r'\\([\\;,nN])')
+
+
+class FilaInvalida(ValueError):
+    """
+    Fila que no se puede importar; el mensaje dice por qué.
+    """
+
+
+class ResultadoImportacion:
+    """
+    Contadores de una importación y las primeras ``max_errores`` filas
+    inválidas como (número de línea, motivo).
+    """
+
+    def __init__(self, max_errores=100):
+        self.max_errores = max_errores
+        self.leidas = 0
+        self.guardadas = 0
+        self.duplicadas = 0
+        self.invalidas = 0
+        self.errores = []
+        self.segundos = 0.0
+
+    def registrar_error(self, linea, error):
+        self.invalidas += 1
+        if len(self.errores) < self.max_errores:
+            self.errores.append((linea, str(error)))
+
+    @property
+    def filas_por_segundo(self):
+        return self.leidas / self.segundos if self.segundos else 0.0
+
+
+def formato_de(ruta):
+    for extension, formato in FORMATOS_POR_EXTENSION.items():
+        if str(ruta).lower().endswith(extension):
+            return formato
+    return None
+
+
+def leer_archivo(archivo, formato):
+    """
+    Retorna un iterador de (número de línea, datos) para ``archivo`` (abierto
+    en modo texto) según ``formato`` ('csv', 'jsonl' o 'ics'). Si una línea
+    no se puede leer, datos es una ``FilaInvalida``.
+    """
+    lectores = {'csv': leer_csv, 'jsonl': leer_jsonl, 'ics': leer_ics}
+    return lectores[formato](archivo)
+
+
+def leer_csv(archivo):
+    """
+    Filas de un CSV con encabezado; las columnas son los campos del evento
+    (más ``uid`` o ``id``, opcional).
+    """
+    lector = csv.DictReader(archivo)
+    for fila in lector:
+        yield lector.line_num, fila
+
+
+def leer_jsonl(archivo):
+    """
+    Un objeto JSON por línea con los campos del evento.
+    """
+    for numero, linea in enumerate(archivo, start=1):
+        if not linea.strip():
+            continue
+        try:
+            datos = json.loads(linea)
+        except ValueError as e:
+            yield numero, FilaInvalida(f'JSON inválido: {e}')
+            continue
+        if not isinstance(datos, dict):
+            yield numero, FilaInvalida('se esperaba un objeto JSON')
+            continue
+        yield numero, datos
+
+
+def leer_ics(archivo):
+    """
+    Los VEVENT de un archivo iCalendar, con SUMMARY, DESCRIPTION, DTSTART,
+    DTEND, LOCATION, UID, URL, CATEGORIES, CONTACT, STATUS (CANCELLED los
+    deja inactivos) y X-PRECIO. Se ignoran los componentes anidados (VALARM).
+    """
+    propiedades = None
+    anidados = 0
+    inicio = 0
+    for numero, nombre, parametros, valor in _lineas_ics(archivo):
+        if nombre == 'BEGIN':
+            if valor.upper() == 'VEVENT':
+                propiedades, anidados, inicio = {}, 0, numero
+            elif propiedades is not None:
+                anidados += 1
+        elif nombre == 'END' and propiedades is not None:
+            if anidados:
+                anidados -= 1
+            elif valor.upper() == 'VEVENT':
+                yield inicio, _fila_ics(propiedades)
+                propiedades = None
+        elif propiedades is not None and not anidados:
+            propiedades.setdefault(nombre, (parametros, valor))
+
+
+def _lineas_ics(archivo):
+    """
+    (número de línea, nombre, parámetros, valor) de cada propiedad, con las
+    líneas plegadas (las que empiezan con espacio o tabulador) ya unidas.
+    """
+    actual, numero_actual = None, 0
+    for numero, linea in enumerate(archivo, start=1):
+        linea = linea.rstrip('\r\n')
+        if linea[:1] in (' ', '\t') and actual is not None:
+            actual += linea[1:]
+            continue
+        if actual:
+            yield (numero_actual, *_propiedad_ics(actual))
+        actual, numero_actual = linea, numero
+    if actual:
+        yield (numero_actual, *_propiedad_ics(actual))
+
+
+def _propiedad_ics(linea):
+    # NOMBRE;PARAM=VALOR;PARAM="CON:DOS PUNTOS":valor
+    entre_comillas = False
+    for posicion, caracter in enumerate(linea):
+        if caracter == '"':
+            entre_comillas = not entre_comillas
+        elif caracter == ':' and not entre_comillas:
+            cabecera, valor = linea[:posicion], linea[posicion + 1:]
+            break
+    else:
+        cabecera, valor = linea, ''
+
+    nombre, *resto = cabecera.split(';')
+    parametros = {}
+    for parametro in resto:
+        clave, _, dato = parametro.partition('=')
+        parametros[clave.upper()] = dato.strip('"')
+    return nombre.upper(), parametros, valor
+
+
+def _texto_ics(valor):
+    # \n es salto de línea; \\, \; y \, son el carácter escapado
+    return _ESCAPE_ICS.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), valor)
+
+
+def _fecha_ics(propiedad):
+    if propiedad is None:
+        return None
+    parametros, valor = propiedad
+    valor = valor.strip()
+    try:
+        if parametros.get('VALUE') == 'DATE' or len(valor) == 8:
+            return datetime.strptime(valor, '%Y%m%d').date()
+        if valor.endswith('Z'):
+            return datetime.strptime(valor, '%Y%m%dT%H%M%SZ').replace(tzinfo=dt_timezone.utc)
+        fecha = datetime.strptime(valor, '%Y%m%dT%H%M%S')
+    except ValueError:
+        raise FilaInvalida(f'fecha iCalendar inválida: {valor!r}')
+    if 'TZID' in parametros:
+        try:
+            return fecha.replace(tzinfo=ZoneInfo(parametros['TZID']))
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return fecha
+
+
+def _fila_ics(propiedades):
+    def texto(nombre):
+        propiedad = propiedades.get(nombre)
+        return _texto_ics(propiedad[1]) if propiedad else ''
+
+    try:
+        fecha_inicio = _fecha_ics(propiedades.get('DTSTART'))
+        fecha_fin = _fecha_ics(propiedades.get('DTEND'))
+    except FilaInvalida as e:
+        return e
+    return {
+        'uid': texto('UID'),
+        'titulo': texto('SUMMARY'),
+        'descripcion': texto('DESCRIPTION'),
+        'categoria': texto('CATEGORIES').split(',')[0],
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'ubicacion': texto('LOCATION'),
+        'enlace': texto('URL'),
+        'contacto': texto('CONTACT'),
+        'precio': texto('X-PRECIO'),
+        'activo': texto('STATUS').upper() != 'CANCELLED',
+    }
+
+
+def convertir_fila(datos, zona=None):
+    """
+    Valida ``datos`` (texto o valores ya convertidos) y retorna (valores, uid)
+    con los valores de los campos del evento, ``titulo_normalizado``
+    incluido. Las fechas sin zona horaria se toman en ``zona`` (por defecto
+    la actual). Lanza ``FilaInvalida``.
+    """
+    zona = zona or timezone.get_current_timezone()
+    valores = {
+        'titulo': _texto(datos, 'titulo', obligatorio=True),
+        'descripcion': _texto(datos, 'descripcion'),
+        'categoria': _categoria(str(datos.get('categoria') or '')),
+        'fecha_inicio': _fecha(datos.get('fecha_inicio'), 'fecha_inicio', zona),
+        'fecha_fin': _fecha(datos.get('fecha_fin'), 'fecha_fin', zona),
+        'ubicacion': _texto(datos, 'ubicacion'),
+        'direccion': _texto(datos, 'direccion'),
+        'precio': _precio(datos.get('precio')),
+        'contacto': _texto(datos, 'contacto'),
+        'enlace': _texto(datos, 'enlace'),
+        'activo': _booleano(datos.get('activo')),
+    }
+    if valores['fecha_inicio'] is None:
+        raise FilaInvalida('falta fecha_inicio')
+    if valores['fecha_fin'] is not None and valores['fecha_fin'] < valores['fecha_inicio']:
+        raise FilaInvalida('fecha_fin es anterior a fecha_inicio')
+    if valores['enlace']:
+        try:
+            _validar_url(valores['enlace'])
+        except ValidationError:
+            raise FilaInvalida(f"enlace inválido: {valores['enlace']!r}")
+    valores['titulo_normalizado'] = normalizar_titulo(valores['titulo'])
+    uid = str(datos.get('uid') or datos.get('id') or '').strip()
+    return valores, uid
+
+
+def clave_importacion(valores, uid='', origen=''):
+    """
+    Hash (40 caracteres) que identifica el evento entre importaciones: del
+    uid de la fuente, con ``origen`` para separar fuentes, o del contenido.
+    """
+    if uid:
+        base = f'uid\x1f{origen}\x1f{uid}'
+    else:
+        base = '\x1f'.join((
+            'contenido',
+            valores['titulo_normalizado'],
+            valores['fecha_inicio'].astimezone(dt_timezone.utc).isoformat(),
+            normalizar_titulo(valores['ubicacion']),
+        ))
+    return hashlib.sha1(base.encode()).hexdigest()
+
+
+def importar_eventos(filas, lote=2000, origen='', zona=None, simular=False, max_errores=100, al_guardar=None):
+    """
+    Importa las (número de línea, datos) de ``filas`` (ver ``leer_archivo``)
+    y retorna un ``ResultadoImportacion``. Las filas repetidas dentro de un
+    lote se guardan una vez (la última); entre lotes, la última sobrescribe a
+    las anteriores. Con ``simular`` solo valida. ``al_guardar`` se llama con
+    el resultado parcial después de cada lote.
+    """
+    resultado = ResultadoImportacion(max_errores=max_errores)
+    zona = zona or timezone.get_current_timezone()
+    inicio = time.perf_counter()
+    pendientes = {}
+
+    def guardar():
+        if not simular:
+            _guardar_lote(list(pendientes.values()))
+        resultado.guardadas += len(pendientes)
+        pendientes.clear()
+        resultado.segundos = time.perf_counter() - inicio
+        if al_guardar:
+            al_guardar(resultado)
+
+    with contextlib.nullcontext() if simular else carga_masiva():
+        for linea, datos in filas:
+            resultado.leidas += 1
+            try:
+                if isinstance(datos, FilaInvalida):
+                    raise datos
+                valores, uid = convertir_fila(datos, zona)
+            except FilaInvalida as e:
+                resultado.registrar_error(linea, e)
+                continue
+
+            valores['clave_importacion'] = clave = clave_importacion(valores, uid, origen)
+            if clave in pendientes:
+                resultado.duplicadas += 1
+            pendientes[clave] = valores
+            if len(pendientes) >= lote:
+                guardar()
+        if pendientes:
+            guardar()
+
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def _guardar_lote(filas):
+    """
+    Inserta o actualiza los eventos (valores de ``convertir_fila`` con su
+    clave) en una transacción, rehace sus días del calendario y sube la
+    versión del catálogo, porque las inserciones en bloque no envían señales.
+
+    En SQLite y PostgreSQL es una sentencia preparada INSERT ... ON CONFLICT
+    con executemany, como en catalogo_sintetico.py: armar el INSERT de
+    ``bulk_create`` fila por fila cuesta varias veces más que ejecutarlo.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        if connection.vendor in ('sqlite', 'postgresql'):
+            sql, preparar = _upsert_preparado(ahora)
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, [preparar(valores) for valores in filas])
+        else:
+            for valores in filas:
+                valores['fecha_creacion'] = valores['fecha_actualizacion'] = ahora
+            Evento.objects.bulk_create(
+                [Evento(**valores) for valores in filas],
+                update_conflicts=True,
+                unique_fields=['clave_importacion'],
+                update_fields=CAMPOS_ACTUALIZADOS,
+            )
+        claves = [valores['clave_importacion'] for valores in filas]
+        indexar_dias(Evento.objects.filter(clave_importacion__in=claves))
+        vigilante_catalogo.incrementar(descartar_locales=True)
+
+
+def _upsert_preparado(ahora):
+    """
+    Retorna (sql, preparar): el INSERT ... ON CONFLICT (clave_importacion) DO
+    UPDATE y la función que arma sus parámetros a partir de los valores de
+    una fila, con ``ahora`` como fecha de creación y de actualización. Solo
+    las fechas y los precios se adaptan con el campo del modelo (adaptar
+    cuesta más que insertar); el resto va tal cual.
+    """
+    campos = [Evento._meta.get_field(nombre) for nombre in CAMPOS_INSERTADOS]
+    ahora_adaptado = Evento._meta.get_field('fecha_creacion').get_db_prep_save(ahora, connection)
+    registro = {'fecha_creacion', 'fecha_actualizacion'}
+    # Un evento nuevo llega sin imagen: sin derivados
+    sin_derivados = Evento._meta.get_field('imagen_derivados').get_db_prep_save({}, connection)
+    adaptados = [
+        (campo.name, functools.partial(campo.get_db_prep_save, connection=connection))
+        for campo in campos
+        if isinstance(campo, (models.DateTimeField, models.DecimalField)) and campo.name not in registro
+    ]
+    posiciones = {nombre: indice for indice, nombre in enumerate(CAMPOS_INSERTADOS)}
+
+    def preparar(valores):
+        fila = [valores.get(nombre) for nombre in CAMPOS_INSERTADOS]
+        for nombre, adaptar in adaptados:
+            if fila[posiciones[nombre]] is not None:
+                fila[posiciones[nombre]] = adaptar(fila[posiciones[nombre]])
+        for nombre in registro:
+            fila[posiciones[nombre]] = ahora_adaptado
+        fila[posiciones['imagen_derivados']] = sin_derivados
+        return fila
+
+    columna = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) DO UPDATE SET {}'.format(
+        columna(Evento._meta.db_table),
+        ', '.join(columna(campo.column) for campo in campos),
+        ', '.join(['%s'] * len(campos)),
+        columna(Evento._meta.get_field('clave_importacion').column),
+        ', '.join(
+            f'{columna(campo.column)} = excluded.{columna(campo.column)}'
+            for campo in campos if campo.name in CAMPOS_ACTUALIZADOS
+        ),
+    )
+    return sql, preparar
+
+
+@functools.lru_cache(maxsize=1024)
+def _categoria(valor):
+    # Las fuentes repiten unas pocas categorías
+    return CATEGORIAS.get(normalizar_titulo(valor), 'otro')
+
+
+def _texto(datos, nombre, obligatorio=False):
+    valor = datos.get(nombre)
+    valor = '' if valor is None else str(valor).strip()
+    if obligatorio and not valor:
+        raise FilaInvalida(f'falta {nombre}')
+    largo = LARGOS.get(nombre)
+    if largo and len(valor) > largo:
+        raise FilaInvalida(f'{nombre} tiene más de {largo} caracteres')
+    return valor
+
+
+def _fecha(valor, nombre, zona):
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, datetime):
+        fecha = valor
+    elif isinstance(valor, date):
+        fecha = datetime.combine(valor, hora.min)
+    else:
+        fecha = _parsear_fecha(str(valor).strip())
+        if fecha is None:
+            raise FilaInvalida(f'{nombre} no es una fecha válida: {valor!r}')
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha, zona)
+    return fecha
+
+
+def _parsear_fecha(texto):
+    try:
+        fecha = parse_datetime(texto)
+        if fecha is not None:
+            return fecha
+        dia = parse_date(texto)
+        if dia is not None:
+            return datetime.combine(dia, hora.min)
+    except ValueError:
+        return None
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            pass
+    return None
+
+
+def _precio(valor):
+    if valor is None or valor == '':
+        return Decimal('0.00')
+    texto = str(valor).strip().lower().replace('$', '').replace('usd', '').strip()
+    if texto in GRATIS:
+        return Decimal('0.00')
+    try:
+        precio = Decimal(texto.replace(',', '.'))
+    except InvalidOperation:
+        raise FilaInvalida(f'precio inválido: {valor!r}')
+    # "nan" e "inf" son Decimal válidos, pero no se pueden comparar ni guardar
+    if not precio.is_finite():
+        raise FilaInvalida(f'precio inválido: {valor!r}')
+    precio = precio.quantize(Decimal('0.01'))
+    if precio < 0 or precio >= PRECIO_MAXIMO:
+        raise FilaInvalida(f'precio fuera de rango: {valor!r}')
+    return precio
+
+
+def _booleano(valor):
+    if valor is None or valor == '':
+        return True
+    if isinstance(valor, bool):
+        return valor
+    texto = normalizar_titulo(str(valor))
+    if texto in VERDADEROS:
+        return True
+    if texto in FALSOS:
+        return False
+    raise FilaInvalida(f'activo inválido: {valor!r}')
@@ -0,0 +1,156 @@
+"""
+Limpieza de eventos pasados por lotes (comando eliminar_eventos_pasados y
+acciones del admin).
+
+Cada lote toma hasta ``lote`` ids por el índice de fecha_inicio y, en su
+propia transacción corta, los copia al archivo si se pidió y los elimina; una
+pausa entre lotes deja lugar a las consultas del chat. La memoria no depende
+de cuántos eventos se eliminen: nunca se carga más de un lote.
+
+Los eventos se eliminan con SQL, sin cargarlos como objetos ni enviar
+post_delete por cada uno; cada lote sube una vez la versión del catálogo con
+``descartar_locales``, así todos los procesos (el propio incluido) descartan
+sus cachés de eventos.
+
+Las acciones del admin no limpian dentro de la petición (con muchos eventos
+pasaría del timeout del servidor y dejaría la limpieza a medias): la
+programan con ``programar_limpieza`` en un hilo aparte.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection, transaction
+
+from .evento_queries import vigilante_catalogo
+from .models import DiaEvento, Evento, EventoArchivado
+
+logger = logging.getLogger(__name__)
+
+# Un solo hilo: dos limpiezas programadas seguidas se hacen una tras otra
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='limpieza-eventos')
+
+
+class ResultadoLimpieza:
+    """
+    Eventos eliminados (y archivados, si se pidió), lotes y tiempo.
+    """
+
+    def __init__(self):
+        self.eliminados = 0
+        self.lotes = 0
+        self.segundos = 0.0
+
+    @property
+    def eventos_por_segundo(self):
+        return self.eliminados / self.segundos if self.segundos else 0.0
+
+
+def limpiar_eventos(eventos, lote=1000, pausa=0.0, archivar=False, archivo=None, al_eliminar=None):
+    """
+    Elimina los eventos de la QuerySet ``eventos`` por lotes y retorna un
+    ``ResultadoLimpieza``.
+
+    Con ``archivar`` cada evento se copia antes a la tabla EventoArchivado;
+    con ``archivo`` (abierto en modo texto, por ejemplo con gzip.open) se
+    escribe como una línea JSON. La línea se escribe antes de confirmar la
+    eliminación: si el proceso se corta en ese momento, el evento puede
+    quedar dos veces en el archivo, pero nunca se pierde. ``pausa`` son los
+    segundos de espera entre lotes y ``al_eliminar`` se llama con el
+    resultado parcial después de cada uno.
+    """
+    resultado = ResultadoLimpieza()
+    inicio = time.perf_counter()
+    ids_lote = eventos.order_by('fecha_inicio', 'pk').values_list('pk', flat=True)
+
+    while True:
+        with transaction.atomic():
+            ids = list(ids_lote[:lote])
+            if not ids:
+                break
+            if archivar or archivo is not None:
+                _archivar_lote(ids, archivar, archivo)
+            _eliminar_lote(ids)
+            vigilante_catalogo.incrementar(descartar_locales=True)
+
+        resultado.eliminados += len(ids)
+        resultado.lotes += 1
+        resultado.segundos = time.perf_counter() - inicio
+        if al_eliminar:
+            al_eliminar(resultado)
+        if len(ids) < lote:
+            break
+        if pausa:
+            time.sleep(pausa)
+
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def _archivar_lote(ids, archivar, archivo):
+    filas = list(Evento.objects.filter(pk__in=ids).order_by().values())
+    if archivar:
+        EventoArchivado.objects.bulk_create([
+            EventoArchivado(
+                evento_id=datos['id'],
+                titulo=datos['titulo'],
+                categoria=datos['categoria'],
+                fecha_inicio=datos['fecha_inicio'],
+                datos=datos,
+            )
+            for datos in filas
+        ])
+    if archivo is not None:
+        archivo.writelines(
+            json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+            for datos in filas
+        )
+        archivo.flush()
+
+
+def _eliminar_lote(ids):
+    # Sin pasar por QuerySet.delete, que carga los eventos para enviar
+    # post_delete por cada uno; en SQLite, el trigger de la tabla FTS5 los saca
+    # del índice. Los días del calendario van antes por la clave foránea.
+    nombre = connection.ops.quote_name
+    marcas = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {nombre(DiaEvento._meta.db_table)} WHERE evento_id IN ({marcas})', ids)
+        cursor.execute(f'DELETE FROM {nombre(Evento._meta.db_table)} WHERE id IN ({marcas})', ids)
+
+
+def programar_limpieza(eventos, archivar=False):
+    """
+    Limpia los eventos de la QuerySet ``eventos`` (con LIMPIEZA_LOTE y
+    LIMPIEZA_PAUSA) en el hilo de limpieza o, con
+    LIMPIEZA_SEGUNDO_PLANO=False, en el hilo actual. Retorna el Future, o el
+    ResultadoLimpieza si no fue en segundo plano.
+    """
+    if settings.LIMPIEZA_SEGUNDO_PLANO:
+        return _ejecutor.submit(_limpiar_en_hilo, eventos, archivar)
+    return _limpiar(eventos, archivar)
+
+
+def _limpiar_en_hilo(eventos, archivar):
+    close_old_connections()
+    try:
+        return _limpiar(eventos, archivar)
+    except Exception:
+        logger.exception('Falló la limpieza de eventos pasados')
+        raise
+    finally:
+        close_old_connections()
+
+
+def _limpiar(eventos, archivar):
+    resultado = limpiar_eventos(
+        eventos, lote=settings.LIMPIEZA_LOTE, pausa=settings.LIMPIEZA_PAUSA, archivar=archivar,
+    )
+    logger.info(
+        'Limpieza de eventos pasados: %d eliminado(s) en %d lote(s), %.2f s',
+        resultado.eliminados, resultado.lotes, resultado.segundos,
+    )
+    return resultado
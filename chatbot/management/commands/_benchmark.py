@@ -0,0 +1,13 @@
+"""
+Utilidades compartidas por los comandos de benchmark.
+"""
+import statistics
+
+
+def resumen_tiempos(tiempos):
+    """
+    Retorna (media, p50, p95) en milisegundos para una lista de duraciones en segundos.
+    """
+    ordenados = sorted(tiempos)
+    p95 = ordenados[max(int(len(ordenados) * 0.95) - 1, 0)]
+    return statistics.mean(ordenados) * 1000, statistics.median(ordenados) * 1000, p95 * 1000
@@ -0,0 +1,90 @@
+"""
+Comando de Django para comparar la búsqueda de texto completo con icontains.
+
+Crea una base de datos de pruebas (no toca la configurada), la llena con el
+catálogo sintético hasta cada tamaño pedido y mide la primera página de
+resultados de varias búsquedas por los dos caminos: ``icontains`` sobre
+título, descripción y ubicación (el comportamiento anterior) y el índice de
+texto completo de chatbot/busqueda.py.
+Uso: python manage.py benchmark_busqueda --tamanos 10000 100000 1000000
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from chatbot.catalogo_sintetico import sembrar_eventos
+from chatbot.evento_queries import ejecutar_consulta_eventos, paginar_eventos, proyeccion_tarjetas
+from chatbot.models import Evento
+
+from ._benchmark import resumen_tiempos
+
+
+# Términos comunes, con y sin tilde, de varias palabras, raros y sin resultados
+BUSQUEDAS = ['música', 'musica', 'teatro bolívar', 'ajedrez', 'jipiro jazz', 'xilófono']
+
+
+def _pagina_icontains(texto):
+    query = Evento.objects.filter(activo=True).filter(
+        Q(titulo__icontains=texto) |
+        Q(descripcion__icontains=texto) |
+        Q(ubicacion__icontains=texto)
+    )
+    return paginar_eventos(proyeccion_tarjetas(query).order_by('fecha_inicio', 'id'), {})[0]
+
+
+def _pagina_texto_completo(texto):
+    parametros = {'tipo_consulta': 'busqueda', 'texto_busqueda': texto}
+    return paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)[0]
+
+
+class Command(BaseCommand):
+    help = 'Compara la búsqueda de texto completo con icontains en catálogos de distinto tamaño'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanos',
+            type=int,
+            nargs='+',
+            default=[10_000, 100_000, 1_000_000],
+            help='Número de eventos del catálogo en cada medición (por defecto 10000 100000 1000000)',
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=20,
+            help='Veces que se ejecuta cada búsqueda por camino (por defecto 20)',
+        )
+
+    def _medir(self, buscar, texto, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            eventos = buscar(texto)
+            tiempos.append(time.perf_counter() - inicio)
+        return tiempos, len(eventos)
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            sembrados = 0
+            for tamano in sorted(options['tamanos']):
+                inicio = time.perf_counter()
+                sembrar_eventos(tamano, desde=sembrados)
+                sembrados = tamano
+                self.stdout.write(self.style.SUCCESS(
+                    f'\n{tamano} eventos ({connection.vendor}, sembrados en {time.perf_counter() - inicio:.1f} s)'
+                ))
+                for texto in BUSQUEDAS:
+                    for camino, buscar in (('icontains', _pagina_icontains), ('texto completo', _pagina_texto_completo)):
+                        tiempos, encontrados = self._medir(buscar, texto, repeticiones)
+                        media, mediana, p95 = resumen_tiempos(tiempos)
+                        self.stdout.write(
+                            f'  {texto!r:<16} {camino:<15} p50 {mediana:8.2f} ms | '
+                            f'p95 {p95:8.2f} ms | resultados en la página: {encontrados}'
+                        )
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
@@ -0,0 +1,120 @@
+"""
+Comando de Django para comparar las consultas por fecha con el calendario por
+día (chatbot/calendario.py) contra los filtros sobre fecha_inicio.
+
+Crea una base de datos de pruebas (no toca la configurada), la llena con el
+catálogo sintético hasta cada tamaño pedido (un 10% de eventos de varios días)
+y mide la primera página de "hoy", "mañana", "este fin de semana" y "este mes"
+por tres caminos: el rango sobre fecha_inicio (el comportamiento anterior, que
+no ve los eventos ya en curso), el solapamiento de fecha_inicio y fecha_fin
+(que sí los ve, pero recorre todo lo que empezó antes) y el calendario.
+Uso: python manage.py benchmark_calendario --tamanos 10000 100000 1000000
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import override_settings
+
+from chatbot.catalogo_sintetico import sembrar_eventos
+from chatbot.evento_queries import (
+    criterios_consulta,
+    ejecutar_consulta_eventos,
+    interpretar_consulta_local,
+    paginar_eventos,
+    proyeccion_tarjetas,
+)
+from chatbot.models import Evento
+
+from ._benchmark import resumen_tiempos
+
+
+CONSULTAS = ['hoy', 'mañana', 'este fin de semana', 'este mes']
+
+
+def _consulta_fecha_inicio(parametros):
+    criterios = criterios_consulta(parametros)
+    return Evento.objects.filter(
+        activo=True, fecha_inicio__gte=criterios['desde'], fecha_inicio__lt=criterios['hasta'],
+    )
+
+
+def _consulta_solapamiento(parametros):
+    criterios = criterios_consulta(parametros)
+    return Evento.objects.filter(activo=True, fecha_inicio__lt=criterios['hasta']).filter(
+        Q(fecha_fin__gt=criterios['desde']) |
+        Q(fecha_fin__isnull=True, fecha_inicio__gte=criterios['desde'])
+    )
+
+
+def _ordenada(consulta):
+    def pagina(parametros):
+        query = proyeccion_tarjetas(consulta(parametros)).order_by('fecha_inicio', 'id')
+        return query, paginar_eventos(query, parametros)[0]
+    return pagina
+
+
+def _pagina_calendario(parametros):
+    query = ejecutar_consulta_eventos(parametros)
+    return query, paginar_eventos(query, parametros)[0]
+
+
+CAMINOS = [
+    ('fecha_inicio', _ordenada(_consulta_fecha_inicio)),
+    ('solapamiento', _ordenada(_consulta_solapamiento)),
+    ('calendario', _pagina_calendario),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compara las consultas por fecha con el calendario por día contra los filtros sobre fecha_inicio'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanos',
+            type=int,
+            nargs='+',
+            default=[10_000, 100_000, 1_000_000],
+            help='Número de eventos del catálogo en cada medición (por defecto 10000 100000 1000000)',
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=20,
+            help='Veces que se ejecuta cada consulta por camino (por defecto 20)',
+        )
+
+    def _medir(self, pagina, parametros, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            query, eventos = pagina(parametros)
+            tiempos.append(time.perf_counter() - inicio)
+        return tiempos, len(eventos), query.count()
+
+    @override_settings(CATALOGO_EN_MEMORIA=False)
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            sembrados = 0
+            for tamano in sorted(options['tamanos']):
+                inicio = time.perf_counter()
+                sembrar_eventos(tamano, desde=sembrados)
+                sembrados = tamano
+                self.stdout.write(self.style.SUCCESS(
+                    f'\n{tamano} eventos ({connection.vendor}, sembrados en {time.perf_counter() - inicio:.1f} s)'
+                ))
+                for texto in CONSULTAS:
+                    parametros = interpretar_consulta_local(texto)
+                    for camino, pagina in CAMINOS:
+                        tiempos, en_pagina, total = self._medir(pagina, parametros, repeticiones)
+                        media, mediana, p95 = resumen_tiempos(tiempos)
+                        self.stdout.write(
+                            f'  {texto!r:<22} {camino:<13} p50 {mediana:8.2f} ms | '
+                            f'p95 {p95:8.2f} ms | en la página: {en_pagina} | en total: {total}'
+                        )
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
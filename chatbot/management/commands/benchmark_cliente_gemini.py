@@ -0,0 +1,87 @@
+"""
+Comando de Django para medir el costo por petición del cliente de Gemini.
+Compara crear un genai.Client nuevo en cada llamada (comportamiento anterior)
+con el cliente compartido por proceso, contra un servidor stub local.
+Uso: python manage.py benchmark_cliente_gemini --peticiones 200
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from google import genai
+from google.genai import types
+
+from chatbot import gemini
+from chatbot.servidor_stub import ServidorStubGemini
+
+from ._benchmark import resumen_tiempos
+
+
+class Command(BaseCommand):
+    help = 'Compara el costo por petición de un cliente de Gemini nuevo contra el cliente compartido'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--peticiones',
+            type=int,
+            default=200,
+            help='Número de peticiones por escenario (por defecto 200)',
+        )
+        parser.add_argument(
+            '--latencia',
+            type=float,
+            default=0.0,
+            help='Latencia fija en segundos que agrega el servidor stub (por defecto 0)',
+        )
+
+    def _medir(self, obtener, peticiones):
+        tiempos = []
+        for _ in range(peticiones):
+            inicio = time.perf_counter()
+            client = obtener()
+            client.models.generate_content(model="gemini-2.5-flash", contents="eventos de hoy")
+            tiempos.append(time.perf_counter() - inicio)
+        return tiempos
+
+    def handle(self, *args, **options):
+        peticiones = options['peticiones']
+
+        with ServidorStubGemini(latencia=options['latencia']) as servidor:
+            with override_settings(GEMINI_BASE_URL=servidor.url):
+                def cliente_nuevo():
+                    return genai.Client(
+                        api_key='stub',
+                        http_options=types.HttpOptions(base_url=servidor.url),
+                    )
+
+                gemini.reiniciar_cliente()
+                escenarios = [
+                    ('Cliente nuevo por petición', cliente_nuevo),
+                    ('Cliente compartido', gemini.obtener_cliente),
+                ]
+
+                resultados = []
+                for nombre, obtener in escenarios:
+                    conexiones_antes = servidor.conexiones
+                    tiempos = self._medir(obtener, peticiones)
+                    conexiones = servidor.conexiones - conexiones_antes
+                    resultados.append((nombre, tiempos, conexiones))
+
+                gemini.reiniciar_cliente()
+
+        self.stdout.write(self.style.SUCCESS(f'Peticiones por escenario: {peticiones}'))
+        for nombre, tiempos, conexiones in resultados:
+            media, mediana, p95 = resumen_tiempos(tiempos)
+            self.stdout.write(
+                f'  {nombre:<28} media {media:7.2f} ms | p50 {mediana:7.2f} ms | '
+                f'p95 {p95:7.2f} ms | conexiones abiertas: {conexiones}'
+            )
+
+        media_nuevo = statistics.mean(resultados[0][1])
+        media_compartido = statistics.mean(resultados[1][1])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nSobrecarga evitada por petición: {(media_nuevo - media_compartido) * 1000:.2f} ms'
+            )
+        )
@@ -0,0 +1,108 @@
+"""
+Comando de Django para comparar la concurrencia del chat en WSGI y ASGI.
+
+WSGI se simula con un pool de hilos del tamaño de los workers (cada hilo
+atiende una petición a la vez con la vista síncrona). ASGI usa un único event
+loop con la vista asíncrona. Ambos pasan por el handler completo de Django y
+llaman a un servidor stub de Gemini que agrega una latencia fija.
+Uso: python manage.py benchmark_concurrencia --peticiones 200 --latencia 0.5
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from chatbot import gemini
+from chatbot.evento_queries import cache_intenciones
+from chatbot.servidor_stub import ServidorStubGemini
+
+from ._benchmark import resumen_tiempos
+
+
+def _cuerpo(indice):
+    # Mensajes distintos para que ni las reglas locales ni la caché de
+    # intenciones eviten la llamada a Gemini
+    return json.dumps({'message': f'eventos de rock {indice}'})
+
+
+class Command(BaseCommand):
+    help = 'Compara el chat síncrono (pool de hilos, WSGI) con el asíncrono (ASGI) contra un LLM stub con latencia fija'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--peticiones',
+            type=int,
+            default=200,
+            help='Peticiones concurrentes por escenario (por defecto 200)',
+        )
+        parser.add_argument(
+            '--latencia',
+            type=float,
+            default=0.5,
+            help='Latencia en segundos de cada llamada al LLM stub (por defecto 0.5)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Hilos disponibles en el escenario WSGI (por defecto 8)',
+        )
+
+    # Cada escenario retorna (instante_fin, estado) por petición; la latencia
+    # se mide desde que se enviaron todas, incluyendo la espera por un worker.
+
+    def _wsgi(self, peticiones, workers):
+        def enviar(indice):
+            respuesta = Client().post('/api/chat/', _cuerpo(indice), content_type='application/json')
+            return time.perf_counter(), respuesta.status_code
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(enviar, range(peticiones)))
+
+    def _asgi(self, peticiones):
+        async def enviar(client, indice):
+            respuesta = await client.post('/api/chat/async/', _cuerpo(indice), content_type='application/json')
+            return time.perf_counter(), respuesta.status_code
+
+        async def ejecutar():
+            client = AsyncClient()
+            return await asyncio.gather(*(enviar(client, i) for i in range(peticiones)))
+
+        return asyncio.run(ejecutar())
+
+    def handle(self, *args, **options):
+        peticiones = options['peticiones']
+        latencia = options['latencia']
+        workers = options['workers']
+
+        with ServidorStubGemini(latencia=latencia) as servidor:
+            with override_settings(GEMINI_BASE_URL=servidor.url, ALLOWED_HOSTS=['*']):
+                escenarios = [
+                    (f'WSGI ({workers} hilos)', lambda: self._wsgi(peticiones, workers)),
+                    ('ASGI (1 event loop)', lambda: self._asgi(peticiones)),
+                ]
+                resultados = []
+                for nombre, ejecutar in escenarios:
+                    gemini.reiniciar_cliente()
+                    cache_intenciones.limpiar()
+                    inicio = time.perf_counter()
+                    mediciones = ejecutar()
+                    total = time.perf_counter() - inicio
+                    tiempos = [fin - inicio for fin, _ in mediciones]
+                    errores = sum(1 for _, estado in mediciones if estado != 200)
+                    resultados.append((nombre, total, tiempos, errores))
+                gemini.reiniciar_cliente()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{peticiones} peticiones concurrentes, LLM stub con {latencia:.2f} s de latencia por llamada'
+        ))
+        for nombre, total, tiempos, errores in resultados:
+            media, mediana, p95 = resumen_tiempos(tiempos)
+            self.stdout.write(
+                f'  {nombre:<22} total {total:7.2f} s | {peticiones / total:7.1f} req/s | '
+                f'p50 {mediana / 1000:6.2f} s | p95 {p95 / 1000:6.2f} s | errores: {errores}'
+            )
@@ -0,0 +1,67 @@
+"""
+Comando de Django para construir los archivos estáticos de producción (ver
+chatbot/estaticos.py): collectstatic con nombres con hash, GIF animados
+convertidos a WebP y CSS/JS precomprimidos, más un reporte de los bytes que
+se ahorran por archivo.
+Uso: python manage.py construir_estaticos [--limpiar] [--todos]
+"""
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from chatbot import estaticos
+
+# Sin --todos solo se listan los archivos desde este tamaño (el total sí
+# incluye a todos)
+TAMANO_REPORTADO = 32 * 1024
+
+
+def _tamano(octetos):
+    if octetos >= 1024 * 1024:
+        return f'{octetos / (1024 * 1024):.1f} MB'
+    return f'{octetos / 1024:.0f} KB' if octetos >= 1024 else f'{octetos} B'
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta collectstatic con las optimizaciones de chatbot/estaticos.py y reporta el ahorro'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limpiar',
+            action='store_true',
+            help=f'Borra {settings.STATIC_ROOT} antes de copiar (quedan solo los archivos actuales)',
+        )
+        parser.add_argument(
+            '--todos',
+            action='store_true',
+            help='Lista todos los archivos, también los de menos de 32 KB',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        call_command('collectstatic', interactive=False, clear=options['limpiar'], verbosity=0)
+        if estaticos.brotli is None:
+            self.stdout.write(self.style.WARNING('  Sin el paquete brotli: solo se generan las versiones .gz'))
+
+        total_original = total_servido = 0
+        for nombre, original, optimizado, formato in estaticos.informe_estaticos(staticfiles_storage):
+            total_original += original
+            total_servido += optimizado or original
+            if not options['todos'] and original < TAMANO_REPORTADO:
+                continue
+            if optimizado is not None:
+                ahorro = 100 * (original - optimizado) / original
+                self.stdout.write(
+                    f'  {nombre}: {_tamano(original)} → {_tamano(optimizado)} ({formato}, -{ahorro:.0f}%)'
+                )
+            else:
+                self.stdout.write(f'  {nombre}: {_tamano(original)} (sin cambios)')
+
+        ahorro = 100 * (total_original - total_servido) / total_original if total_original else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Estáticos en {settings.STATIC_ROOT}: {_tamano(total_original)} → {_tamano(total_servido)} '
+            f'(-{ahorro:.0f}%) en {time.perf_counter() - inicio:.2f} s.'
+        ))
@@ -1,13 +1,20 @@
 """
 Comando de Django para eliminar eventos cuya fecha de inicio ya haya pasado.
+Elimina por lotes, cada uno en su transacción (ver chatbot/limpieza.py), y
+opcionalmente los archiva en la tabla de eventos archivados o en un archivo
+JSON Lines comprimido.
 """
-from django.core.management.base import BaseCommand
+import gzip
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
+from chatbot.limpieza import limpiar_eventos
 from chatbot.models import Evento
 
 
 class Command(BaseCommand):
-    help = 'Elimina eventos cuya fecha de inicio ya haya pasado'
+    help = 'Elimina (o archiva) eventos cuya fecha de inicio ya haya pasado'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -21,12 +28,36 @@ class Command(BaseCommand):
             default=0,
             help='Eliminar eventos pasados hace más de X días (por defecto 0, elimina todos los pasados)',
         )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=settings.LIMPIEZA_LOTE,
+            help=f'Eventos por transacción (por defecto {settings.LIMPIEZA_LOTE})',
+        )
+        parser.add_argument(
+            '--pausa',
+            type=float,
+            default=settings.LIMPIEZA_PAUSA,
+            help=f'Segundos de espera entre lotes (por defecto {settings.LIMPIEZA_PAUSA})',
+        )
+        archivo = parser.add_mutually_exclusive_group()
+        archivo.add_argument(
+            '--archivar',
+            action='store_true',
+            help='Mueve los eventos a la tabla de eventos archivados en lugar de solo eliminarlos',
+        )
+        archivo.add_argument(
+            '--archivo',
+            help='Agrega los eventos a este archivo JSON Lines comprimido (.jsonl.gz) antes de eliminarlos',
+        )
 
     def handle(self, *args, **options):
         ahora = timezone.now()
         dry_run = options['dry_run']
         dias = options['dias']
-        
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
         # Calcular la fecha límite
         if dias > 0:
             fecha_limite = ahora - timezone.timedelta(days=dias)
@@ -35,48 +66,73 @@ class Command(BaseCommand):
         else:
             eventos_pasados = Evento.objects.filter(fecha_inicio__lt=ahora)
             mensaje_fecha = "ya pasaron"
-        
+
         cantidad = eventos_pasados.count()
-        
+
         if cantidad == 0:
             self.stdout.write(
                 self.style.SUCCESS('No hay eventos pasados para eliminar.')
             )
             return
-        
+
         if dry_run:
             self.stdout.write(
                 self.style.WARNING(
                     f'[DRY RUN] Se eliminarían {cantidad} evento(s) que {mensaje_fecha}:'
                 )
             )
-            for evento in eventos_pasados:
+            # iterator: la lista puede ser larga y no hace falta tenerla en memoria
+            for titulo, fecha_inicio in eventos_pasados.values_list('titulo', 'fecha_inicio').iterator(
+                chunk_size=options['lote']
+            ):
                 self.stdout.write(
-                    f'  - {evento.titulo} ({evento.fecha_inicio.strftime("%d/%m/%Y %H:%M")})'
+                    f'  - {titulo} ({fecha_inicio.strftime("%d/%m/%Y %H:%M")})'
                 )
             self.stdout.write(
                 self.style.WARNING(
                     '\nEjecuta sin --dry-run para eliminar realmente estos eventos.'
                 )
             )
-        else:
-            # Mostrar los eventos que se van a eliminar
-            self.stdout.write(
-                self.style.WARNING(
-                    f'Eliminando {cantidad} evento(s) que {mensaje_fecha}:'
-                )
+            return
+
+        accion = 'Archivando' if options['archivar'] or options['archivo'] else 'Eliminando'
+        self.stdout.write(
+            self.style.WARNING(
+                f'{accion} {cantidad} evento(s) que {mensaje_fecha}, '
+                f'en lotes de {options["lote"]}:'
             )
-            for evento in eventos_pasados:
-                self.stdout.write(
-                    f'  - {evento.titulo} ({evento.fecha_inicio.strftime("%d/%m/%Y %H:%M")})'
-                )
-            
-            # Eliminar los eventos
-            eventos_pasados.delete()
-            
+        )
+
+        def progreso(resultado):
             self.stdout.write(
-                self.style.SUCCESS(
-                    f'\n✓ Se eliminaron {cantidad} evento(s) exitosamente.'
-                )
+                f'  {resultado.eliminados}/{cantidad} '
+                f'({resultado.eventos_por_segundo:,.0f} eventos/s)'
             )
 
+        parametros = {
+            'lote': options['lote'],
+            'pausa': options['pausa'],
+            'archivar': options['archivar'],
+            'al_eliminar': progreso,
+        }
+        if options['archivo']:
+            try:
+                # Modo "at": las limpiezas sucesivas se agregan al mismo archivo
+                with gzip.open(options['archivo'], 'at', encoding='utf-8') as archivo:
+                    resultado = limpiar_eventos(eventos_pasados, archivo=archivo, **parametros)
+            except OSError as e:
+                raise CommandError(f'No se pudo escribir {options["archivo"]}: {e}')
+        else:
+            resultado = limpiar_eventos(eventos_pasados, **parametros)
+
+        destino = ''
+        if options['archivar']:
+            destino = ' (copiados a eventos archivados)'
+        elif options['archivo']:
+            destino = f' (copiados a {options["archivo"]})'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✓ Se eliminaron {resultado.eliminados} evento(s) exitosamente{destino}, '
+                f'en {resultado.lotes} lote(s) y {resultado.segundos:.2f} s.'
+            )
+        )
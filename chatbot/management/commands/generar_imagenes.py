@@ -0,0 +1,45 @@
+"""
+Comando de Django para generar los derivados de las imágenes de los eventos
+(ver chatbot/imagenes.py) que aún no los tienen: las subidas antes de existir
+los derivados, o las de un proceso que terminó antes de procesarlas.
+Uso: python manage.py generar_imagenes [--todas]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from chatbot.imagenes import generar_derivados, necesita_derivados
+from chatbot.models import Evento
+
+
+class Command(BaseCommand):
+    help = 'Genera los derivados WebP y JPEG de las imágenes de los eventos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todas',
+            action='store_true',
+            help='Vuelve a generar también los de las imágenes que ya los tienen '
+                 '(después de cambiar IMAGENES_DERIVADOS; los que no cambian no se reescriben)',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        # Con imagen, o sin imagen pero con derivados de una anterior
+        eventos = Evento.objects.filter(~Q(imagen='') & Q(imagen__isnull=False) | ~Q(imagen_derivados={}))
+        generados = errores = 0
+        for evento in eventos.only('id', 'imagen', 'imagen_derivados').iterator(chunk_size=500):
+            if not options['todas'] and not necesita_derivados(evento):
+                continue
+            derivados = generar_derivados(evento.pk)
+            if derivados and 'error' in derivados:
+                errores += 1
+                self.stdout.write(self.style.WARNING(f'  ✗ {evento.imagen.name}: {derivados["error"]}'))
+            else:
+                generados += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Derivados de {generados} imagen(es) en {time.perf_counter() - inicio:.2f} s'
+            + (f', {errores} con error.' if errores else '.')
+        ))
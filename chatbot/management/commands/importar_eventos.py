@@ -0,0 +1,104 @@
+"""
+Comando de Django para importar eventos desde archivos CSV, JSON Lines o
+iCalendar (ver chatbot/importacion.py).
+Uso: python manage.py importar_eventos eventos.csv agenda.ics --origen municipio
+"""
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot.importacion import formato_de, importar_eventos, leer_archivo
+
+
+class Command(BaseCommand):
+    help = 'Importa (o actualiza) eventos desde archivos CSV, JSON Lines o iCalendar en lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivos', nargs='+', help='Archivos .csv, .jsonl o .ics')
+        parser.add_argument(
+            '--formato',
+            choices=['csv', 'jsonl', 'ics'],
+            help='Formato de los archivos (por defecto, según la extensión)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=2000,
+            help='Eventos por INSERT y por transacción (por defecto 2000)',
+        )
+        parser.add_argument(
+            '--origen',
+            default='',
+            help='Nombre de la fuente, para que sus uid no choquen con los de otras fuentes',
+        )
+        parser.add_argument(
+            '--zona-horaria',
+            help='Zona horaria de las fechas sin zona (por defecto TIME_ZONE)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Valida los archivos sin guardar nada',
+        )
+        parser.add_argument(
+            '--max-errores',
+            type=int,
+            default=20,
+            help='Filas inválidas que se muestran por archivo (por defecto 20)',
+        )
+
+    def handle(self, *args, **options):
+        zona = None
+        if options['zona_horaria']:
+            try:
+                zona = ZoneInfo(options['zona_horaria'])
+            except (ZoneInfoNotFoundError, ValueError):
+                raise CommandError(f"Zona horaria desconocida: {options['zona_horaria']}")
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
+        for ruta in options['archivos']:
+            formato = options['formato'] or formato_de(ruta)
+            if formato is None:
+                raise CommandError(f'No se reconoce el formato de {ruta}; usa --formato')
+            self._importar(ruta, formato, zona, options)
+
+    def _importar(self, ruta, formato, zona, options):
+        prefijo = '[DRY RUN] ' if options['dry_run'] else ''
+        self.stdout.write(f'{prefijo}Importando {ruta} ({formato})...')
+
+        def progreso(resultado):
+            self.stdout.write(
+                f'  {resultado.leidas} filas leídas ({resultado.filas_por_segundo:,.0f} filas/s)'
+            )
+
+        try:
+            # newline='' para que el módulo csv maneje los saltos de línea dentro de comillas
+            with open(ruta, encoding='utf-8-sig', newline='') as archivo:
+                resultado = importar_eventos(
+                    leer_archivo(archivo, formato),
+                    lote=options['lote'],
+                    origen=options['origen'],
+                    zona=zona,
+                    simular=options['dry_run'],
+                    max_errores=options['max_errores'],
+                    al_guardar=progreso if options['verbosity'] > 1 else None,
+                )
+        except OSError as e:
+            raise CommandError(f'No se pudo leer {ruta}: {e}')
+        except UnicodeDecodeError as e:
+            raise CommandError(f'{ruta} no está en UTF-8: {e}')
+
+        for linea, motivo in resultado.errores:
+            self.stdout.write(self.style.WARNING(f'  ⊘ Línea {linea}: {motivo}'))
+        if resultado.invalidas > len(resultado.errores):
+            self.stdout.write(self.style.WARNING(
+                f'  ... y {resultado.invalidas - len(resultado.errores)} filas inválidas más'
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefijo}{ruta}: {resultado.guardadas} eventos '
+            f'{"válidos" if options["dry_run"] else "guardados"} de {resultado.leidas} filas '
+            f'({resultado.duplicadas} repetidas, {resultado.invalidas} inválidas) '
+            f'en {resultado.segundos:.2f} s: {resultado.filas_por_segundo:,.0f} filas/s'
+        ))
@@ -0,0 +1,24 @@
+"""
+Comando de Django para rehacer el calendario por día de todos los eventos
+(ver chatbot/calendario.py): después de cambiar TIME_ZONE o de cargar eventos
+con SQL directo.
+Uso: python manage.py indexar_calendario
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.calendario import indexar_dias
+from chatbot.models import DiaEvento, Evento
+
+
+class Command(BaseCommand):
+    help = 'Rehace el calendario por día (días en curso) de todos los eventos'
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        indexar_dias(Evento.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {DiaEvento.objects.count()} días de {Evento.objects.count()} eventos '
+            f'en {time.perf_counter() - inicio:.2f} s.'
+        ))
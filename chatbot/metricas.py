@@ -0,0 +1,30 @@
+"""
+Contadores en memoria del proceso para medir el pipeline del chatbot.
+"""
+import threading
+from collections import Counter
+
+
+class Contadores:
+    """
+    Conjunto de contadores con nombre, seguro entre hilos.
+    """
+
+    def __init__(self):
+        self._valores = Counter()
+        self._lock = threading.Lock()
+
+    def incrementar(self, nombre, cantidad=1):
+        with self._lock:
+            self._valores[nombre] += cantidad
+
+    def valores(self):
+        """
+        Retorna una copia de los contadores como diccionario.
+        """
+        with self._lock:
+            return dict(self._valores)
+
+    def reiniciar(self):
+        with self._lock:
+            self._valores.clear()
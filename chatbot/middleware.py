@@ -0,0 +1,28 @@
+"""
+Middleware del chatbot.
+"""
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.utils.decorators import sync_and_async_middleware
+
+from .evento_queries import vigilante_catalogo
+
+
+@sync_and_async_middleware
+def version_catalogo_middleware(get_response):
+    """
+    Antes de cada petición comprueba si otro proceso cambió los eventos y, en
+    ese caso, descarta las cachés de eventos del proceso (ver
+    version_catalogo.py). La lectura de la versión se hace como mucho una vez
+    cada settings.CATALOGO_VERSION_INTERVALO segundos.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if vigilante_catalogo.toca_verificar():
+                await sync_to_async(vigilante_catalogo.verificar)()
+            return await get_response(request)
+    else:
+        def middleware(request):
+            if vigilante_catalogo.toca_verificar():
+                vigilante_catalogo.verificar()
+            return get_response(request)
+    return middleware
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='evento',
+            name='chatbot_eve_categor_81f9a2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='evento',
+            name='chatbot_eve_activo_6a28e1_idx',
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_inicio', 'id'], name='evento_activo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'fecha_inicio', 'id'], name='evento_activo_cat_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['precio', 'fecha_inicio', 'id'], name='evento_activo_precio_idx'),
+        ),
+    ]
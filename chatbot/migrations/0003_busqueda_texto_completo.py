@@ -0,0 +1,14 @@
+from django.db import migrations
+
+from chatbot.busqueda import crear_indice_busqueda, eliminar_indice_busqueda
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_indices_consultas_chat'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
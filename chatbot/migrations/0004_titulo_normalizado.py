@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+from chatbot.busqueda import crear_indice_busqueda, crear_indice_titulos, eliminar_indice_titulos
+from chatbot.models import normalizar_titulo
+
+
+def rellenar_titulo_normalizado(apps, schema_editor):
+    Evento = apps.get_model('chatbot', 'Evento')
+    eventos = []
+    for evento in Evento.objects.only('id', 'titulo').iterator(chunk_size=2000):
+        evento.titulo_normalizado = normalizar_titulo(evento.titulo)
+        eventos.append(evento)
+    Evento.objects.bulk_update(eventos, ['titulo_normalizado'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_busqueda_texto_completo'),
+    ]
+
+    operations = [
+        # En SQLite, agregar (o quitar) la columna reconstruye la tabla de
+        # eventos y se pierden los triggers de la búsqueda de texto completo
+        migrations.RunPython(migrations.RunPython.noop, crear_indice_busqueda),
+        migrations.AddField(
+            model_name='evento',
+            name='titulo_normalizado',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['titulo_normalizado'], name='evento_titulo_norm_idx'),
+        ),
+        migrations.RunPython(crear_indice_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(rellenar_titulo_normalizado, migrations.RunPython.noop),
+        migrations.RunPython(crear_indice_titulos, eliminar_indice_titulos),
+    ]
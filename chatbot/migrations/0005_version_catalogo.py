@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+def crear_fila_version(apps, schema_editor):
+    VersionCatalogo = apps.get_model('chatbot', 'VersionCatalogo')
+    VersionCatalogo.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_titulo_normalizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Versión')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+            ],
+            options={
+                'verbose_name': 'Versión del catálogo',
+                'verbose_name_plural': 'Versión del catálogo',
+            },
+        ),
+        migrations.RunPython(crear_fila_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+from chatbot.busqueda import crear_indice_busqueda
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_version_catalogo'),
+    ]
+
+    operations = [
+        # En SQLite, agregar (o quitar) la columna reconstruye la tabla de
+        # eventos y se pierden los triggers de la búsqueda de texto completo
+        migrations.RunPython(migrations.RunPython.noop, crear_indice_busqueda),
+        migrations.AddField(
+            model_name='evento',
+            name='clave_importacion',
+            field=models.CharField(editable=False, max_length=40, null=True, unique=True),
+        ),
+        migrations.RunPython(crear_indice_busqueda, migrations.RunPython.noop),
+    ]
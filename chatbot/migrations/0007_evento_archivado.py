@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:37
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_clave_importacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoArchivado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evento_id', models.BigIntegerField(verbose_name='ID del evento')),
+                ('titulo', models.CharField(max_length=200, verbose_name='Título')),
+                ('categoria', models.CharField(max_length=20, verbose_name='Categoría')),
+                ('fecha_inicio', models.DateTimeField(verbose_name='Fecha y hora de inicio')),
+                ('datos', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Datos del evento')),
+                ('fecha_archivado', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de archivado')),
+            ],
+            options={
+                'verbose_name': 'Evento archivado',
+                'verbose_name_plural': 'Eventos archivados',
+                'ordering': ['-fecha_inicio'],
+                'indexes': [models.Index(fields=['fecha_inicio'], name='chatbot_eve_fecha_i_4356f2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:57
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from chatbot.calendario import dias_del_evento
+
+
+def llenar_calendario(apps, schema_editor):
+    Evento = apps.get_model('chatbot', 'Evento')
+    DiaEvento = apps.get_model('chatbot', 'DiaEvento')
+    filas = []
+    for pk, fecha_inicio, fecha_fin in Evento.objects.values_list('pk', 'fecha_inicio', 'fecha_fin').iterator():
+        primero, ultimo = dias_del_evento(fecha_inicio, fecha_fin)
+        filas.extend(
+            DiaEvento(evento_id=pk, dia=primero + timedelta(days=numero), primer_dia=primero, fecha_inicio=fecha_inicio)
+            for numero in range((ultimo - primero).days + 1)
+        )
+    DiaEvento.objects.bulk_create(filas, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_evento_archivado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaEvento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('primer_dia', models.DateField()),
+                ('fecha_inicio', models.DateTimeField()),
+                ('evento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dias', to='chatbot.evento')),
+            ],
+            options={
+                'verbose_name': 'Día de evento',
+                'verbose_name_plural': 'Días de eventos',
+                'indexes': [models.Index(fields=['dia', 'fecha_inicio', 'evento'], name='dia_evento_orden_idx')],
+            },
+        ),
+        migrations.RunPython(llenar_calendario, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:04
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0008_calendario_dias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerieEvento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('titulo', models.CharField(max_length=200, verbose_name='Título')),
+                ('titulo_normalizado', models.CharField(default='', editable=False, max_length=200)),
+                ('descripcion', models.TextField(verbose_name='Descripción')),
+                ('categoria', models.CharField(choices=[('musica', 'Música'), ('deporte', 'Deporte'), ('cultural', 'Cultural'), ('gastronomia', 'Gastronomía'), ('educativo', 'Educativo'), ('religioso', 'Religioso'), ('feria', 'Feria'), ('teatro', 'Teatro'), ('danza', 'Danza'), ('otro', 'Otro')], default='otro', max_length=20, verbose_name='Categoría')),
+                ('fecha_inicio', models.DateTimeField(help_text='Fecha y hora local de la primera ocurrencia; las demás toman la misma hora', verbose_name='Primera fecha y hora')),
+                ('duracion', models.DurationField(blank=True, help_text='Por ejemplo 01:30:00 para una hora y media', null=True, verbose_name='Duración (opcional)')),
+                ('regla', models.CharField(help_text='Al estilo RRULE: FREQ=WEEKLY;BYDAY=SA, FREQ=MONTHLY;BYDAY=1FR;COUNT=6, FREQ=DAILY;INTERVAL=2;UNTIL=20261231', max_length=200, verbose_name='Regla de recurrencia')),
+                ('excepciones', models.JSONField(blank=True, default=list, help_text='Lista de días locales sin ocurrencia, por ejemplo ["2026-12-25"]', verbose_name='Días exceptuados')),
+                ('fecha_ultima', models.DateTimeField(editable=False, null=True)),
+                ('ubicacion', models.CharField(max_length=200, verbose_name='Ubicación')),
+                ('direccion', models.TextField(blank=True, verbose_name='Dirección completa (opcional)')),
+                ('precio', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='0.00 para eventos gratuitos', max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))], verbose_name='Precio')),
+                ('contacto', models.CharField(blank=True, max_length=100, verbose_name='Contacto (teléfono, email, etc.)')),
+                ('enlace', models.URLField(blank=True, verbose_name='Enlace adicional (opcional)')),
+                ('activo', models.BooleanField(default=True, help_text='Desmarcar para ocultar todas las ocurrencias', verbose_name='Activo')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+            ],
+            options={
+                'verbose_name': 'Serie de eventos',
+                'verbose_name_plural': 'Series de eventos',
+                'ordering': ['fecha_inicio'],
+            },
+        ),
+    ]
@@ -1,7 +1,25 @@
+import re
+import unicodedata
+from datetime import date
+
 from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
 
+
+def normalizar_titulo(texto):
+    """
+    Clave de búsqueda de un título: minúsculas, sin tildes ni signos y con
+    los espacios colapsados ("Obra de Teatro: \"El Quijote\"" queda
+    "obra de teatro el quijote").
+    """
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', sin_tildes.lower()))
+
 # Create your models here.
 
 class Evento(models.Model):
@@ -21,6 +39,13 @@ class Evento(models.Model):
     ]
     
     titulo = models.CharField(max_length=200, verbose_name='Título')
+    # Se calcula al guardar (ver save); las inserciones masivas que no pasan
+    # por save deben llenarlo con normalizar_titulo
+    titulo_normalizado = models.CharField(max_length=200, editable=False, default='')
+    # Identifica el evento en las importaciones (importacion.py): hash del uid
+    # de la fuente o, si no trae, del título, la fecha y la ubicación. Vacío en
+    # los eventos creados desde el admin.
+    clave_importacion = models.CharField(max_length=40, unique=True, null=True, editable=False)
     descripcion = models.TextField(verbose_name='Descripción')
     categoria = models.CharField(
         max_length=20, 
@@ -53,6 +78,9 @@ class Evento(models.Model):
         blank=True,
         verbose_name='Imagen del evento'
     )
+    # Versiones reducidas de la imagen para las tarjetas, en WebP y JPEG, que
+    # se generan en segundo plano al guardar (ver imagenes.py)
+    imagen_derivados = models.JSONField(default=dict, blank=True, editable=False)
     contacto = models.CharField(
         max_length=100, 
         blank=True,
@@ -82,10 +110,36 @@ class Evento(models.Model):
         ordering = ['fecha_inicio']
         indexes = [
             models.Index(fields=['fecha_inicio']),
-            models.Index(fields=['categoria']),
-            models.Index(fields=['activo']),
+            # El chat solo consulta eventos activos y ordena por (fecha_inicio, id)
+            # para paginar por cursor (ver evento_queries.ejecutar_consulta_eventos).
+            # Índices parciales que siguen esa forma: rango de fechas, categoría o
+            # precio, y el orden ya resuelto por el propio índice.
+            models.Index(
+                fields=['fecha_inicio', 'id'],
+                condition=models.Q(activo=True),
+                name='evento_activo_fecha_idx',
+            ),
+            models.Index(
+                fields=['categoria', 'fecha_inicio', 'id'],
+                condition=models.Q(activo=True),
+                name='evento_activo_cat_fecha_idx',
+            ),
+            models.Index(
+                fields=['precio', 'fecha_inicio', 'id'],
+                condition=models.Q(activo=True),
+                name='evento_activo_precio_idx',
+            ),
+            # Detalle por título ("Dame más información sobre ...")
+            models.Index(fields=['titulo_normalizado'], name='evento_titulo_norm_idx'),
         ]
     
+    def save(self, *args, **kwargs):
+        self.titulo_normalizado = normalizar_titulo(self.titulo)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'titulo' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'titulo_normalizado'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.titulo} - {self.fecha_inicio.strftime('%d/%m/%Y')}"
     
@@ -93,3 +147,199 @@ class Evento(models.Model):
     def es_gratuito(self):
         """Retorna True si el evento es gratuito"""
         return self.precio == Decimal('0.00')
+
+
+class SerieEvento(models.Model):
+    """
+    Evento que se repite (una clase cada sábado, una feria cada domingo):
+    una sola fila con la primera fecha y la regla de recurrencia. Las
+    ocurrencias no se guardan; las consultas del chat las generan dentro
+    del rango de fechas que piden (ver recurrencia.py).
+    """
+    titulo = models.CharField(max_length=200, verbose_name='Título')
+    titulo_normalizado = models.CharField(max_length=200, editable=False, default='')
+    descripcion = models.TextField(verbose_name='Descripción')
+    categoria = models.CharField(
+        max_length=20,
+        choices=Evento.CATEGORIA_CHOICES,
+        default='otro',
+        verbose_name='Categoría'
+    )
+    fecha_inicio = models.DateTimeField(
+        verbose_name='Primera fecha y hora',
+        help_text='Fecha y hora local de la primera ocurrencia; las demás toman la misma hora'
+    )
+    duracion = models.DurationField(
+        null=True,
+        blank=True,
+        verbose_name='Duración (opcional)',
+        help_text='Por ejemplo 01:30:00 para una hora y media'
+    )
+    regla = models.CharField(
+        max_length=200,
+        verbose_name='Regla de recurrencia',
+        help_text='Al estilo RRULE: FREQ=WEEKLY;BYDAY=SA, FREQ=MONTHLY;BYDAY=1FR;COUNT=6, '
+                  'FREQ=DAILY;INTERVAL=2;UNTIL=20261231'
+    )
+    excepciones = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='Días exceptuados',
+        help_text='Lista de días locales sin ocurrencia, por ejemplo ["2026-12-25"]'
+    )
+    # Última ocurrencia según COUNT o UNTIL, calculada al guardar; None si la
+    # serie no termina
+    fecha_ultima = models.DateTimeField(null=True, editable=False)
+    ubicacion = models.CharField(max_length=200, verbose_name='Ubicación')
+    direccion = models.TextField(
+        blank=True,
+        verbose_name='Dirección completa (opcional)'
+    )
+    precio = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        validators=[MinValueValidator(Decimal('0.00'))],
+        verbose_name='Precio',
+        help_text='0.00 para eventos gratuitos'
+    )
+    contacto = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Contacto (teléfono, email, etc.)'
+    )
+    enlace = models.URLField(
+        blank=True,
+        verbose_name='Enlace adicional (opcional)'
+    )
+    activo = models.BooleanField(
+        default=True,
+        verbose_name='Activo',
+        help_text='Desmarcar para ocultar todas las ocurrencias'
+    )
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Fecha de creación'
+    )
+    fecha_actualizacion = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Fecha de actualización'
+    )
+
+    class Meta:
+        verbose_name = 'Serie de eventos'
+        verbose_name_plural = 'Series de eventos'
+        ordering = ['fecha_inicio']
+
+    def clean(self):
+        # Importado aquí: recurrencia.py importa este módulo
+        from .recurrencia import interpretar_regla
+
+        errores = {}
+        try:
+            interpretar_regla(self.regla)
+        except ValueError as e:
+            errores['regla'] = str(e)
+        try:
+            if not isinstance(self.excepciones, list):
+                raise ValueError
+            for dia in self.excepciones:
+                date.fromisoformat(dia)
+        except (TypeError, ValueError):
+            errores['excepciones'] = 'Debe ser una lista de días AAAA-MM-DD'
+        if errores:
+            raise ValidationError(errores)
+
+    def save(self, *args, **kwargs):
+        from .recurrencia import interpretar_regla, ultima_fecha
+
+        self.titulo_normalizado = normalizar_titulo(self.titulo)
+        ultima = ultima_fecha(
+            interpretar_regla(self.regla), timezone.localtime(self.fecha_inicio).replace(tzinfo=None)
+        )
+        self.fecha_ultima = timezone.make_aware(ultima) if ultima is not None else None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'titulo_normalizado', 'fecha_ultima'}
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.titulo} ({self.regla})"
+
+    @property
+    def es_gratuito(self):
+        """Retorna True si la serie es gratuita"""
+        return self.precio == Decimal('0.00')
+
+
+class DiaEvento(models.Model):
+    """
+    Un día local (settings.TIME_ZONE) en que el evento está en curso: una
+    fila por cada día desde el de su inicio hasta el de su fin (ver
+    calendario.py). Las consultas por fecha buscan aquí, así los eventos de
+    varios días aparecen también en los días posteriores al de inicio.
+    """
+    evento = models.ForeignKey(Evento, on_delete=models.CASCADE, related_name='dias')
+    dia = models.DateField()
+    # Día de inicio del evento y copia de su fecha_inicio: la consulta elige
+    # una fila por evento y la ordena sin ir a la tabla de eventos
+    primer_dia = models.DateField()
+    fecha_inicio = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Día de evento'
+        verbose_name_plural = 'Días de eventos'
+        indexes = [
+            models.Index(fields=['dia', 'fecha_inicio', 'evento'], name='dia_evento_orden_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.evento_id} - {self.dia.strftime('%d/%m/%Y')}"
+
+
+class VersionCatalogo(models.Model):
+    """
+    Contador que sube con cada cambio en los eventos (una sola fila). Cada
+    proceso compara el valor con el último que vio para descartar sus cachés
+    de eventos cuando otro proceso los modificó (ver version_catalogo.py).
+    """
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Versión')
+    fecha_actualizacion = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Fecha de actualización'
+    )
+
+    class Meta:
+        verbose_name = 'Versión del catálogo'
+        verbose_name_plural = 'Versión del catálogo'
+
+    def __str__(self):
+        return f"Catálogo v{self.version}"
+
+
+class EventoArchivado(models.Model):
+    """
+    Evento pasado que se sacó de la tabla de eventos (ver limpieza.py). Las
+    columnas que sirven para buscarlo se copian; el evento completo queda en
+    ``datos``, así el archivo no depende de los cambios del modelo Evento.
+    """
+    evento_id = models.BigIntegerField(verbose_name='ID del evento')
+    titulo = models.CharField(max_length=200, verbose_name='Título')
+    categoria = models.CharField(max_length=20, verbose_name='Categoría')
+    fecha_inicio = models.DateTimeField(verbose_name='Fecha y hora de inicio')
+    datos = models.JSONField(encoder=DjangoJSONEncoder, verbose_name='Datos del evento')
+    fecha_archivado = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Fecha de archivado'
+    )
+
+    class Meta:
+        verbose_name = 'Evento archivado'
+        verbose_name_plural = 'Eventos archivados'
+        ordering = ['-fecha_inicio']
+        indexes = [
+            models.Index(fields=['fecha_inicio']),
+        ]
+
+    def __str__(self):
+        return f"{self.titulo} - {self.fecha_inicio.strftime('%d/%m/%Y')}"
@@ -0,0 +1,126 @@
+"""
+Elección al azar del evento que se recomienda, sin cargar el catálogo.
+
+En lugar de ordenar todos los eventos activos al azar, se cuentan los eventos
+activos de cada día del horizonte (una sola consulta sobre el índice parcial
+(fecha_inicio, id), que se guarda en memoria), se sortea un día con peso
+``cantidad de eventos × peso del día`` y dentro de él una posición, y se lee
+el evento de esa posición con un OFFSET acotado a ese día. La memoria no
+depende del tamaño del catálogo y cada elección es una consulta.
+
+Así cada evento sale con probabilidad proporcional al peso de su día: los de
+un mismo día (también los que empiezan a la misma hora) salen igual de
+seguido, y un día con muchos eventos no pierde frente a un evento solitario
+más adelante.
+"""
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.db.models import Count, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Evento
+
+DIA = timedelta(days=1)
+
+
+class MuestreadorEventos:
+    """
+    Elige eventos activos próximos al azar, con más peso para los que
+    empiezan antes.
+
+    Guarda cuántos eventos activos empiezan en cada día del horizonte;
+    ``invalidar`` descarta los conteos (se llama al guardar o eliminar un
+    evento, ver signals.py) y de todos modos se vuelven a leer cada
+    ``vigencia_limite`` segundos, por los cambios que no pasan por las
+    señales.
+    """
+
+    def __init__(self, horizonte_dias=30, vida_media_dias=3, vigencia_limite=300):
+        self.horizonte_dias = horizonte_dias
+        self.vida_media_dias = vida_media_dias
+        self.vigencia_limite = vigencia_limite
+        self._lock = threading.Lock()
+        self._conteos = None
+        self._expira_en = 0.0
+
+    def invalidar(self):
+        with self._lock:
+            self._conteos = None
+            self._expira_en = 0.0
+
+    def elegir(self, campos=None):
+        """
+        Retorna un evento activo que aún no empieza, elegido al azar (con
+        solo ``campos`` cargados si se indican), o None si no hay ninguno.
+        """
+        ahora = timezone.now()
+        desde, conteos = self._conteos_por_dia(ahora)
+        proximos = (
+            Evento.objects.filter(activo=True, fecha_inicio__gte=ahora)
+            .order_by('fecha_inicio', 'id')
+            .values('id')
+        )
+        dia = self.dia_al_azar(conteos)
+        if dia is None:
+            # Nada en el horizonte: el próximo evento, si hay alguno después
+            elegido = Subquery(proximos[:1])
+        else:
+            inicio_dia = desde + dia * DIA
+            posicion = random.randrange(conteos[dia])
+            del_dia = proximos.filter(fecha_inicio__gte=max(inicio_dia, ahora), fecha_inicio__lt=inicio_dia + DIA)
+            # Si los conteos guardados están desactualizados y la posición ya
+            # no existe, el próximo evento
+            elegido = Coalesce(
+                Subquery(del_dia[posicion:posicion + 1]),
+                Subquery(proximos[:1]),
+            )
+        query = Evento.objects.filter(id=elegido)
+        if campos:
+            query = query.only(*campos)
+        return query.first()
+
+    def dia_al_azar(self, conteos):
+        """
+        Sortea el índice de un día de ``conteos`` con peso proporcional a su
+        cantidad de eventos por el peso del día, que se reduce a la mitad cada
+        ``vida_media_dias`` días (sin vida media, todos pesan igual). Retorna
+        None si no hay eventos.
+        """
+        pesos = [
+            cantidad * (0.5 ** (dia / self.vida_media_dias) if self.vida_media_dias else 1)
+            for dia, cantidad in enumerate(conteos)
+        ]
+        if not any(pesos):
+            return None
+        return random.choices(range(len(conteos)), weights=pesos)[0]
+
+    def _conteos_por_dia(self, ahora):
+        """
+        (desde, conteos): la cantidad de eventos activos que empiezan en cada
+        tramo de 24 horas desde ``desde`` hasta el horizonte, en una sola
+        consulta.
+        """
+        with self._lock:
+            if self._conteos is not None and self._expira_en > time.time():
+                return self._conteos
+
+        tramos = {
+            f'dia_{dia}': Count('id', filter=Q(
+                fecha_inicio__gte=ahora + dia * DIA, fecha_inicio__lt=ahora + (dia + 1) * DIA,
+            ))
+            for dia in range(self.horizonte_dias)
+        }
+        totales = Evento.objects.filter(
+            activo=True, fecha_inicio__gte=ahora, fecha_inicio__lt=ahora + self.horizonte_dias * DIA,
+        ).aggregate(**tramos)
+        conteos = (ahora, [totales[f'dia_{dia}'] for dia in range(self.horizonte_dias)])
+        # Sin eventos no se guarda nada: las cargas masivas no avisan con señales
+        if any(conteos[1]):
+            with self._lock:
+                self._conteos = conteos
+                self._expira_en = time.time() + self.vigencia_limite
+        return conteos
@@ -0,0 +1,437 @@
+"""
+Series de eventos recurrentes (modelo SerieEvento): una clase de yoga cada
+sábado, una feria cada domingo, un concierto el primer viernes del mes.
+
+Cada serie guarda su primera fecha, una regla al estilo RRULE (RFC 5545) y
+los días exceptuados; sus ocurrencias nunca se escriben en la base de datos.
+``ejecutar_consulta_eventos`` las genera al paginar, solo dentro del rango de
+fechas de la consulta y solo hasta llenar la página, y las intercala con los
+eventos en el mismo orden (fecha_inicio, id). Cada ocurrencia es un Evento
+sin guardar cuyo id es el de la serie en negativo: (fecha_inicio, id) sigue
+siendo único y sirve para el cursor de paginación.
+
+De la regla se entiende FREQ (DAILY, WEEKLY o MONTHLY), INTERVAL, COUNT,
+UNTIL, BYDAY (con ordinal en las mensuales: 1SA, -1FR) y BYMONTHDAY. Las
+horas son locales (settings.TIME_ZONE), como las escribe quien carga la
+serie.
+
+Las series activas se leen una vez por proceso (``CatalogoSeries``) y se
+descartan cuando cambian (signals.py) o cuando otro proceso sube la versión
+del catálogo: lo que cuesta una consulta crece con el número de series, no
+con el de ocurrencias. Las búsquedas de texto, ordenadas por relevancia, solo
+incluyen eventos.
+"""
+import calendar
+import heapq
+import itertools
+import threading
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .calendario import dias_del_evento
+from .catalogo_memoria import _plegar
+from .models import Evento, SerieEvento
+
+FRECUENCIAS = ('DAILY', 'WEEKLY', 'MONTHLY')
+DIAS_SEMANA = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+NOMBRES_DIAS = ('lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo')
+ORDINALES = {1: 'primer', 2: 'segundo', 3: 'tercer', 4: 'cuarto', 5: 'quinto', -1: 'último'}
+
+# Periodos seguidos sin ninguna fecha tras los que se deja de expandir: una
+# regla que ya no produce fechas (BYMONTHDAY=31 cada 12 meses desde abril)
+# no debe dejar una consulta en un ciclo sin fin
+MAX_PERIODOS_VACIOS = 1000
+
+
+class Regla:
+    """
+    Regla de recurrencia interpretada por ``interpretar_regla``.
+    ``dias_semana`` es una lista de (ordinal o None, día de la semana 0-6).
+    """
+
+    def __init__(self, frecuencia, intervalo=1, cantidad=None, hasta=None, dias_semana=(), dias_mes=()):
+        self.frecuencia = frecuencia
+        self.intervalo = intervalo
+        self.cantidad = cantidad
+        self.hasta = hasta
+        self.dias_semana = list(dias_semana)
+        self.dias_mes = list(dias_mes)
+
+
+def interpretar_regla(texto):
+    """
+    Interpreta una regla como "FREQ=WEEKLY;BYDAY=SA,SU;UNTIL=20261231".
+    Lanza ValueError con un mensaje para el admin si no es válida.
+    """
+    partes = {}
+    for parte in (texto or '').upper().replace('RRULE:', '').split(';'):
+        if not parte.strip():
+            continue
+        nombre, igual, valor = parte.partition('=')
+        if not igual or not valor.strip():
+            raise ValueError(f'Parte de la regla sin valor: "{parte}"')
+        partes[nombre.strip()] = valor.strip()
+
+    frecuencia = partes.pop('FREQ', None)
+    if frecuencia not in FRECUENCIAS:
+        raise ValueError(f'FREQ debe ser uno de: {", ".join(FRECUENCIAS)}')
+    try:
+        intervalo = int(partes.pop('INTERVAL', 1))
+        cantidad = int(partes.pop('COUNT')) if 'COUNT' in partes else None
+        dias_mes = [int(dia) for dia in partes.pop('BYMONTHDAY', '').split(',') if dia]
+    except ValueError:
+        raise ValueError('INTERVAL, COUNT y BYMONTHDAY deben ser números enteros')
+    if intervalo < 1 or (cantidad is not None and cantidad < 1):
+        raise ValueError('INTERVAL y COUNT deben ser mayores que 0')
+    if any(not 1 <= abs(dia) <= 31 for dia in dias_mes):
+        raise ValueError('BYMONTHDAY debe estar entre 1 y 31 (o -1 y -31)')
+
+    hasta = None
+    if 'UNTIL' in partes:
+        hasta = _interpretar_hasta(partes.pop('UNTIL'))
+        if cantidad is not None:
+            raise ValueError('La regla no puede tener COUNT y UNTIL a la vez')
+
+    dias_semana = []
+    for dia in partes.pop('BYDAY', '').split(','):
+        if not dia:
+            continue
+        ordinal, codigo = dia[:-2], dia[-2:]
+        if codigo not in DIAS_SEMANA:
+            raise ValueError(f'Día de la semana desconocido en BYDAY: "{dia}"')
+        try:
+            ordinal = int(ordinal) if ordinal else None
+        except ValueError:
+            raise ValueError(f'Ordinal inválido en BYDAY: "{dia}"')
+        if ordinal is not None and (frecuencia != 'MONTHLY' or not 1 <= abs(ordinal) <= 5):
+            raise ValueError('Los ordinales de BYDAY (1SA, -1FR) van de 1 a 5 y solo en reglas mensuales')
+        dias_semana.append((ordinal, DIAS_SEMANA.index(codigo)))
+
+    if dias_mes and frecuencia != 'MONTHLY':
+        raise ValueError('BYMONTHDAY solo se admite en reglas mensuales')
+    if partes:
+        raise ValueError(f'Partes de la regla no admitidas: {", ".join(sorted(partes))}')
+    return Regla(frecuencia, intervalo, cantidad, hasta, dias_semana, dias_mes)
+
+
+def _interpretar_hasta(valor):
+    # UNTIL es una fecha (hasta ese día incluido) o una fecha y hora, local
+    # o en UTC si termina en Z
+    try:
+        if len(valor) == 8:
+            return datetime.strptime(valor, '%Y%m%d').replace(hour=23, minute=59, second=59)
+        hasta = datetime.strptime(valor.rstrip('Z'), '%Y%m%dT%H%M%S')
+    except ValueError:
+        raise ValueError('UNTIL debe ser AAAAMMDD o AAAAMMDDTHHMMSS')
+    if valor.endswith('Z'):
+        hasta = timezone.localtime(hasta.replace(tzinfo=dt_timezone.utc)).replace(tzinfo=None)
+    return hasta
+
+
+def describir_regla(regla):
+    """
+    La regla en palabras, para el detalle de una serie ("cada semana: sábado").
+    """
+    nombres = ', '.join(
+        ' '.join(filter(None, [ORDINALES.get(ordinal), NOMBRES_DIAS[dia]])) for ordinal, dia in regla.dias_semana
+    )
+    if regla.frecuencia == 'DAILY':
+        texto = 'todos los días' if regla.intervalo == 1 else f'cada {regla.intervalo} días'
+    elif regla.frecuencia == 'WEEKLY':
+        texto = 'cada semana' if regla.intervalo == 1 else f'cada {regla.intervalo} semanas'
+    else:
+        texto = 'cada mes' if regla.intervalo == 1 else f'cada {regla.intervalo} meses'
+        if regla.dias_mes:
+            nombres = ', '.join(f'día {dia}' if dia > 0 else 'último día' for dia in regla.dias_mes)
+    if nombres:
+        texto += f': {nombres}'
+    if regla.hasta is not None:
+        texto += f', hasta el {regla.hasta.strftime("%d/%m/%Y")}'
+    return texto
+
+
+def fechas_serie(regla, inicio, desde=None, excepciones=()):
+    """
+    Genera en orden las fechas de la serie que empieza en ``inicio`` (fecha
+    y hora local, sin zona), desde el día local ``desde`` si se indica. Salta
+    directo al periodo de ``desde``, sin recorrer los anteriores; con COUNT
+    sí cuenta desde el principio (``SerieEvento.save`` guarda la última
+    fecha, así las consultas no lo necesitan). Los días de ``excepciones``
+    no se generan pero, como en RFC 5545, cuentan para COUNT.
+    """
+    hora = inicio.time()
+    primer_dia = inicio.date()
+    desde = max(desde, primer_dia) if desde is not None and regla.cantidad is None else primer_dia
+    periodo = _periodo_de(regla, primer_dia, desde)
+    generadas = vacios = 0
+    while vacios < MAX_PERIODOS_VACIOS:
+        vacios += 1
+        for dia in _dias_del_periodo(regla, primer_dia, periodo):
+            if dia < desde:
+                continue
+            fecha = datetime.combine(dia, hora)
+            if regla.hasta is not None and fecha > regla.hasta:
+                return
+            vacios = 0
+            generadas += 1
+            if dia not in excepciones:
+                yield fecha
+            if regla.cantidad is not None and generadas >= regla.cantidad:
+                return
+        periodo += 1
+
+
+def _periodo_de(regla, primer_dia, dia):
+    # Número del periodo (día, semana o mes, según FREQ e INTERVAL) que contiene ``dia``
+    if regla.frecuencia == 'DAILY':
+        return (dia - primer_dia).days // regla.intervalo
+    if regla.frecuencia == 'WEEKLY':
+        return (dia - primer_dia + timedelta(days=primer_dia.weekday())).days // 7 // regla.intervalo
+    meses = (dia.year - primer_dia.year) * 12 + dia.month - primer_dia.month
+    return meses // regla.intervalo
+
+
+def _dias_del_periodo(regla, primer_dia, periodo):
+    if regla.frecuencia == 'DAILY':
+        dia = primer_dia + timedelta(days=periodo * regla.intervalo)
+        semana = {dia_semana for _, dia_semana in regla.dias_semana}
+        return [dia] if not semana or dia.weekday() in semana else []
+
+    if regla.frecuencia == 'WEEKLY':
+        lunes = primer_dia - timedelta(days=primer_dia.weekday()) + timedelta(weeks=periodo * regla.intervalo)
+        semana = sorted({dia_semana for _, dia_semana in regla.dias_semana}) or [primer_dia.weekday()]
+        return [lunes + timedelta(days=dia_semana) for dia_semana in semana]
+
+    meses = primer_dia.month - 1 + periodo * regla.intervalo
+    anio, mes = primer_dia.year + meses // 12, meses % 12 + 1
+    largo = calendar.monthrange(anio, mes)[1]
+    numeros = set()
+    for dia in regla.dias_mes or ([] if regla.dias_semana else [primer_dia.day]):
+        numero = dia if dia > 0 else largo + dia + 1
+        if 1 <= numero <= largo:
+            numeros.add(numero)
+    for ordinal, dia_semana in regla.dias_semana:
+        primero = (dia_semana - date(anio, mes, 1).weekday()) % 7 + 1
+        del_mes = list(range(primero, largo + 1, 7))
+        if ordinal is None:
+            numeros.update(del_mes)
+        elif ordinal <= len(del_mes) and -ordinal <= len(del_mes):
+            numeros.add(del_mes[ordinal - 1 if ordinal > 0 else ordinal])
+    return [date(anio, mes, numero) for numero in sorted(numeros)]
+
+
+def ultima_fecha(regla, inicio):
+    """
+    Última fecha local de la serie, o None si no termina.
+    """
+    if regla.cantidad is None and regla.hasta is None:
+        return None
+    ultima = None
+    for ultima in fechas_serie(regla, inicio):
+        pass
+    return ultima
+
+
+class CatalogoSeries:
+    """
+    Las series activas en la memoria del proceso. Se leen completas la
+    primera vez que se usan y se vuelven a leer después de ``descartar``.
+    """
+
+    def __init__(self, largo_descripcion):
+        self.largo_descripcion = largo_descripcion
+        self._lock = threading.Lock()
+        self._series = None
+
+    @property
+    def cargado(self):
+        return self._series is not None
+
+    def cargar(self):
+        with self._lock:
+            if self._series is None:
+                series = []
+                for serie in SerieEvento.objects.filter(activo=True).order_by('pk'):
+                    serie.regla_interpretada = _regla_de_consulta(serie)
+                    serie.dias_exceptuados = frozenset(date.fromisoformat(dia) for dia in serie.excepciones)
+                    serie.ubicacion_plegada = _plegar(serie.ubicacion or '')
+                    serie.direccion_plegada = _plegar(serie.direccion or '')
+                    series.append(serie)
+                self._series = series
+            return self._series
+
+    def descartar(self):
+        with self._lock:
+            self._series = None
+
+    def combinar(self, consulta, criterios):
+        """
+        ``consulta`` con las ocurrencias de las series que cumplen
+        ``criterios``, o la misma ``consulta`` si ninguna los cumple.
+        """
+        if criterios['vacio'] or criterios['texto']:
+            return consulta
+        series = [serie for serie in self.cargar() if _cumple(serie, criterios)]
+        if not series:
+            return consulta
+        return ConsultaConSeries(consulta, series, criterios, self.largo_descripcion)
+
+    def buscar_por_titulo(self, titulo_normalizado):
+        for serie in self.cargar():
+            if serie.titulo_normalizado == titulo_normalizado:
+                return serie
+        return None
+
+    def proxima_ocurrencia(self, serie, despues_de=None):
+        """
+        La primera ocurrencia de ``serie`` que empieza desde ``despues_de``
+        (por defecto ahora) o, si la serie ya terminó, la última.
+        """
+        despues_de = despues_de or timezone.now()
+        zona = timezone.get_current_timezone()
+        ultima = None
+        for fecha in _fechas_utc(serie, timezone.localdate(despues_de, zona), zona):
+            if fecha >= despues_de:
+                return _ocurrencia(serie, fecha, self.largo_descripcion)
+            ultima = fecha
+        if ultima is None and serie.fecha_ultima is not None:
+            ultima = next(_fechas_utc(serie, timezone.localdate(serie.fecha_ultima, zona), zona), None)
+        return _ocurrencia(serie, ultima, self.largo_descripcion) if ultima is not None else None
+
+
+def _regla_de_consulta(serie):
+    # COUNT obliga a contar desde la primera fecha; con la última ya guardada
+    # se vuelve un UNTIL y cada consulta puede saltar al periodo que pide
+    regla = interpretar_regla(serie.regla)
+    if regla.cantidad is not None and serie.fecha_ultima is not None:
+        regla.cantidad = None
+        regla.hasta = timezone.localtime(serie.fecha_ultima).replace(tzinfo=None)
+    return regla
+
+
+def _cumple(serie, criterios):
+    """
+    Los filtros de ``_consulta_orm`` que no dependen de la fecha, más un
+    descarte rápido de las series que terminan antes del rango.
+    """
+    if criterios['categoria'] and serie.categoria != criterios['categoria']:
+        return False
+    if criterios['solo_gratuitos'] and serie.precio != 0:
+        return False
+    if criterios['precio_maximo'] is not None and not (serie.precio == 0 or serie.precio <= criterios['precio_maximo']):
+        return False
+    if criterios['ubicacion']:
+        buscada = _plegar(criterios['ubicacion'])
+        if buscada not in serie.ubicacion_plegada and buscada not in serie.direccion_plegada:
+            return False
+    if criterios['desde'] is not None and serie.fecha_ultima is not None:
+        # Una ocurrencia en curso puede haber empezado hasta un día de duración antes
+        margen = (serie.duracion or timedelta()) + timedelta(days=1)
+        if serie.fecha_ultima + margen < criterios['desde']:
+            return False
+    if criterios['hasta'] is not None and serie.fecha_inicio > criterios['hasta']:
+        return False
+    return True
+
+
+def _fechas_utc(serie, desde, zona):
+    # Fechas de inicio de ``serie`` desde el día local ``desde``, en UTC como
+    # las que lee el ORM
+    inicio = timezone.localtime(serie.fecha_inicio, zona).replace(tzinfo=None)
+    for fecha in fechas_serie(serie.regla_interpretada, inicio, desde, serie.dias_exceptuados):
+        yield timezone.make_aware(fecha, zona).astimezone(dt_timezone.utc)
+
+
+def _ocurrencia(serie, fecha_inicio, largo_descripcion):
+    """
+    La ocurrencia de ``serie`` que empieza en ``fecha_inicio``, como un
+    evento sin guardar con las columnas que usan las tarjetas y el detalle.
+    """
+    ocurrencia = Evento(
+        id=-serie.pk,
+        titulo=serie.titulo,
+        titulo_normalizado=serie.titulo_normalizado,
+        descripcion=serie.descripcion,
+        categoria=serie.categoria,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_inicio + serie.duracion if serie.duracion else None,
+        ubicacion=serie.ubicacion,
+        direccion=serie.direccion,
+        precio=serie.precio,
+        contacto=serie.contacto,
+        enlace=serie.enlace,
+        fecha_actualizacion=serie.fecha_actualizacion,
+    )
+    ocurrencia.descripcion_corta = serie.descripcion[:largo_descripcion]
+    ocurrencia.serie = serie
+    return ocurrencia
+
+
+class ConsultaConSeries:
+    """
+    Resultado de ``ejecutar_consulta_eventos`` cuando alguna serie cumple
+    los criterios: la consulta de eventos (QuerySet o ConsultaMemoria) más
+    las series, que se expanden al pedir cada página.
+    """
+    campo_orden = 'fecha_inicio'
+
+    def __init__(self, eventos, series, criterios, largo_descripcion):
+        self.eventos = eventos
+        self.series = series
+        self.criterios = criterios
+        self.largo_descripcion = largo_descripcion
+
+    def pagina(self, eventos, posicion, cantidad):
+        """
+        Intercala ``eventos`` (la página de la consulta de eventos, ya
+        ordenada y después de ``posicion``) con las ocurrencias siguientes a
+        ``posicion``, y retorna las ``cantidad`` primeras. Se intercalan
+        tuplas (fecha_inicio, id, evento o serie), únicas por sus dos
+        primeros valores: solo se crean los eventos de las ocurrencias que
+        quedan en la página.
+        """
+        zona = timezone.get_current_timezone()
+        claves = heapq.merge(
+            ((evento.fecha_inicio, evento.pk, evento) for evento in eventos),
+            *(self._de_serie(serie, posicion, zona) for serie in self.series),
+        )
+        return [
+            _ocurrencia(origen, fecha, self.largo_descripcion) if isinstance(origen, SerieEvento) else origen
+            for fecha, _, origen in itertools.islice(claves, cantidad)
+        ]
+
+    def _de_serie(self, serie, posicion, zona):
+        criterios = self.criterios
+        desde, hasta = criterios['desde'], criterios['hasta']
+        dias = criterios['dias']
+        # Día local desde el que hay que expandir: el del rango o, si es
+        # posterior, el de la posición del cursor
+        primer_dia = None
+        if dias is not None:
+            # Las ocurrencias en curso el primer día empezaron hasta su duración antes
+            atras = min((serie.duracion or timedelta()).days + 1, settings.CALENDARIO_MAX_DIAS)
+            primer_dia = dias[0] - timedelta(days=atras)
+        elif desde is not None:
+            primer_dia = timezone.localdate(desde, zona)
+        if posicion is not None:
+            dia_posicion = timezone.localdate(posicion[0], zona)
+            primer_dia = dia_posicion if primer_dia is None else max(primer_dia, dia_posicion)
+
+        pk = -serie.pk
+        for fecha in _fechas_utc(serie, primer_dia, zona):
+            if dias is not None:
+                primero, ultimo = dias_del_evento(fecha, fecha + serie.duracion if serie.duracion else None, zona)
+                if dias[1] is not None and primero >= dias[1]:
+                    return
+                if ultimo < dias[0]:
+                    continue
+            else:
+                if hasta is not None and (fecha > hasta or (fecha == hasta and not criterios['hasta_incluido'])):
+                    return
+                if desde is not None and fecha < desde:
+                    continue
+            if posicion is not None and (fecha, pk) <= tuple(posicion):
+                continue
+            yield fecha, pk, serie
@@ -0,0 +1,166 @@
+"""
+Servidor HTTP local que imita la API de Gemini para los benchmarks.
+
+Responde a ``generateContent`` (y a ``streamGenerateContent`` por SSE,
+partiendo el texto en fragmentos) con un texto fijo y una latencia opcional
+(con ``goteo``, el cuerpo de ``generateContent`` también llega en fragmentos),
+sin salir a internet, de forma que los benchmarks midan solo el costo del
+lado del cliente (construcción, conexiones, concurrencia).
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+TEXTO_POR_DEFECTO = '{"es_sobre_eventos": true, "es_recomendacion": false, "tipo_consulta": "todos"}'
+
+
+class _ManejadorGemini(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo se escriben por separado; sin esto el ACK retardado
+    # agrega ~40 ms a cada respuesta sobre una conexión keep-alive.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.registrar_conexion()
+
+    def log_message(self, format, *args):
+        # Silenciar el log por petición de BaseHTTPRequestHandler
+        pass
+
+    def do_POST(self):
+        longitud = int(self.headers.get('Content-Length') or 0)
+        tokens_entrada = _estimar_tokens(self.rfile.read(longitud)) if longitud else 0
+
+        if self.server.latencia:
+            time.sleep(self.server.latencia)
+
+        if ':streamGenerateContent' in self.path:
+            self._responder_stream(tokens_entrada)
+            return
+
+        cuerpo = json.dumps(_respuesta(self.server.texto, tokens_entrada)).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        if not self.server.goteo:
+            self.wfile.write(cuerpo)
+            return
+        # Cuerpo enviado de a poco: cada pausa es corta, la respuesta completa no
+        tamano = max(1, -(-len(cuerpo) // self.server.fragmentos))
+        for inicio in range(0, len(cuerpo), tamano):
+            if inicio:
+                time.sleep(self.server.goteo)
+            self.wfile.write(cuerpo[inicio:inicio + tamano])
+            self.wfile.flush()
+
+    def _responder_stream(self, tokens_entrada):
+        """
+        Envía el texto en varios eventos SSE con codificación chunked, con una
+        pausa de ``latencia_fragmento`` entre ellos.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        palabras = self.server.texto.split(' ')
+        tamano = max(1, -(-len(palabras) // self.server.fragmentos))
+        for inicio in range(0, len(palabras), tamano):
+            if inicio and self.server.latencia_fragmento:
+                time.sleep(self.server.latencia_fragmento)
+            texto = ' '.join(palabras[inicio:inicio + tamano])
+            if inicio + tamano < len(palabras):
+                texto += ' '
+            evento = f'data: {json.dumps(_respuesta(texto, tokens_entrada))}\r\n\r\n'.encode('utf-8')
+            self.wfile.write(f'{len(evento):X}\r\n'.encode('ascii') + evento + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def _estimar_tokens(cuerpo):
+    """
+    Aproxima los tokens de entrada (~4 caracteres por token) sumando el texto
+    de ``systemInstruction`` y ``contents``, para que los contadores de uso
+    reflejen el tamaño real de los prompts.
+    """
+    try:
+        peticion = json.loads(cuerpo)
+    except ValueError:
+        return 0
+    contenidos = list(peticion.get('contents') or [])
+    if peticion.get('systemInstruction'):
+        contenidos.append(peticion['systemInstruction'])
+    caracteres = sum(
+        len(parte.get('text') or '')
+        for contenido in contenidos
+        for parte in contenido.get('parts') or []
+    )
+    return caracteres // 4
+
+
+def _respuesta(texto, tokens_entrada=1):
+    tokens_salida = max(1, len(texto) // 4)
+    return {
+        'candidates': [{
+            'content': {'role': 'model', 'parts': [{'text': texto}]},
+            'finishReason': 'STOP',
+        }],
+        'usageMetadata': {
+            'promptTokenCount': tokens_entrada,
+            'candidatesTokenCount': tokens_salida,
+            'totalTokenCount': tokens_entrada + tokens_salida,
+        },
+    }
+
+
+class ServidorStubGemini(ThreadingHTTPServer):
+    """
+    Servidor stub de Gemini. Se usa como context manager:
+
+        with ServidorStubGemini(latencia=0.2) as servidor:
+            ... settings.GEMINI_BASE_URL = servidor.url ...
+    """
+    daemon_threads = True
+    # Los benchmarks de concurrencia abren cientos de conexiones a la vez
+    request_queue_size = 1024
+
+    def __init__(self, latencia=0.0, texto=TEXTO_POR_DEFECTO, puerto=0, fragmentos=4, latencia_fragmento=0.0, goteo=0.0):
+        super().__init__(('127.0.0.1', puerto), _ManejadorGemini)
+        self.latencia = latencia
+        self.texto = texto
+        self.fragmentos = fragmentos
+        self.latencia_fragmento = latencia_fragmento
+        self.goteo = goteo
+        self.conexiones = 0
+        self._lock_conexiones = threading.Lock()
+        self._hilo = None
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f'http://{host}:{puerto}/'
+
+    def handle_error(self, request, client_address):
+        # El cliente cierra la conexión cuando se le agota el plazo; no es un error del stub
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def registrar_conexion(self):
+        with self._lock_conexiones:
+            self.conexiones += 1
+
+    def __enter__(self):
+        self._hilo = threading.Thread(target=self.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        return False
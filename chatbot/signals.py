@@ -0,0 +1,93 @@
+"""
+Señales de los modelos Evento y SerieEvento para mantener al día las cachés
+del chatbot.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import imagenes
+from .calendario import indexar_dias
+from .evento_queries import (
+    cache_resumenes,
+    catalogo_memoria,
+    muestreador_recomendaciones,
+    series_recurrentes,
+    vigilante_catalogo,
+)
+from .models import Evento, SerieEvento
+
+
+@receiver(post_save, sender=Evento)
+@receiver(post_delete, sender=Evento)
+def invalidar_resumenes_evento(sender, instance, **kwargs):
+    """
+    Descarta los textos de las listas que contienen el evento guardado o eliminado.
+    """
+    cache_resumenes.invalidar_etiqueta(instance.pk)
+
+
+@receiver(post_save, sender=Evento)
+@receiver(post_delete, sender=Evento)
+def invalidar_muestreador_recomendaciones(sender, instance, **kwargs):
+    """
+    Descarta los conteos de eventos por día que usa el muestreo de recomendaciones.
+    """
+    muestreador_recomendaciones.invalidar()
+
+
+@receiver(post_save, sender=Evento)
+@receiver(post_delete, sender=Evento)
+def actualizar_catalogo_memoria(sender, instance, **kwargs):
+    """
+    Vuelve a leer el evento en el catálogo en memoria, si está cargado, una
+    vez confirmada la transacción.
+    """
+    if catalogo_memoria.cargado:
+        pk = instance.pk
+        transaction.on_commit(lambda: catalogo_memoria.recargar_evento(pk))
+
+
+@receiver(post_save, sender=Evento)
+def indexar_dias_evento(sender, instance, **kwargs):
+    """
+    Rehace los días del calendario en que el evento está en curso (las filas
+    de un evento eliminado se borran en cascada).
+    """
+    indexar_dias(Evento.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Evento)
+def generar_derivados_imagen(sender, instance, **kwargs):
+    """
+    Programa los derivados de la imagen (imagenes.py) cuando cambió, una vez
+    confirmada la transacción, fuera de la petición que guardó el evento.
+    """
+    if imagenes.necesita_derivados(instance):
+        pk = instance.pk
+        transaction.on_commit(lambda: imagenes.programar(pk))
+
+
+@receiver(post_save, sender=Evento)
+@receiver(post_delete, sender=Evento)
+def incrementar_version_catalogo(sender, instance, **kwargs):
+    """
+    Sube la versión del catálogo para que los demás procesos descarten sus
+    cachés de eventos. La limpieza de eventos pasados y la importación no
+    pasan por aquí: la suben una vez por lote (limpieza.py, importacion.py).
+    """
+    vigilante_catalogo.incrementar()
+
+
+@receiver(post_save, sender=SerieEvento)
+@receiver(post_delete, sender=SerieEvento)
+def actualizar_series_recurrentes(sender, instance, **kwargs):
+    """
+    Descarta las series leídas por el proceso, una vez confirmada la
+    transacción, y los textos de las listas con ocurrencias de la serie (su
+    id en negativo, ver recurrencia.py). Sube la versión del catálogo para
+    que los demás procesos también las descarten.
+    """
+    cache_resumenes.invalidar_etiqueta(-instance.pk)
+    transaction.on_commit(series_recurrentes.descartar)
+    vigilante_catalogo.incrementar()
@@ -368,6 +368,18 @@ document.addEventListener('DOMContentLoaded', function() {
         if (shouldScroll) {
             scrollToBottom();
         }
+
+        return messageDiv;
+    }
+
+    // Reemplaza el texto de un mensaje ya agregado (usado en streaming)
+    function setMessageText(messageDiv, text) {
+        const shouldScroll = isNearBottom();
+        const messageContentWrapper = messageDiv.querySelector('.message-content-wrapper');
+        messageContentWrapper.replaceChildren(createMessageParagraph(text));
+        if (shouldScroll) {
+            scrollToBottom();
+        }
     }
 
     function createEventCard(event) {
@@ -483,6 +495,10 @@ document.addEventListener('DOMContentLoaded', function() {
             body.appendChild(description);
         }
 
+        const media = createEventImage(event.imagen);
+        if (media) {
+            content.appendChild(media);
+        }
         content.appendChild(body);
 
         card.appendChild(orbs);
@@ -493,7 +509,80 @@ document.addEventListener('DOMContentLoaded', function() {
         return card;
     }
 
-    function addEventCards(events) {
+    // Miniatura de la tarjeta: WebP con JPEG de respaldo, el navegador elige
+    // el ancho según el tamaño de la tarjeta y la densidad de la pantalla
+    function createEventImage(imagen) {
+        if (!imagen || !imagen.src) {
+            return null;
+        }
+        const sizes = '(max-width: 600px) 90vw, 320px';
+        const picture = document.createElement('picture');
+        picture.className = 'event-card__media';
+
+        if (imagen.srcset && imagen.srcset.webp) {
+            const source = document.createElement('source');
+            source.type = 'image/webp';
+            source.srcset = imagen.srcset.webp;
+            source.sizes = sizes;
+            picture.appendChild(source);
+        }
+
+        const img = document.createElement('img');
+        img.src = imagen.src;
+        if (imagen.srcset && imagen.srcset.jpeg) {
+            img.srcset = imagen.srcset.jpeg;
+            img.sizes = sizes;
+        }
+        // Reserva el espacio antes de que cargue
+        img.width = imagen.ancho;
+        img.height = imagen.alto;
+        img.alt = '';
+        img.loading = 'lazy';
+        img.decoding = 'async';
+        picture.appendChild(img);
+        return picture;
+    }
+
+    function appendCards(grid, events) {
+        events.forEach((event) => {
+            const card = createEventCard(event);
+            grid.appendChild(card);
+            cardObserver.observe(card);
+        });
+    }
+
+    // Botón "Ver más": pide la siguiente página con el cursor de la respuesta
+    // y agrega las tarjetas a la misma cuadrícula, sin pasar por el chat
+    function createMoreButton(grid, cursor) {
+        const button = document.createElement('button');
+        button.className = 'faq-pill event-cards-more';
+        button.textContent = 'Ver más';
+
+        button.addEventListener('click', async () => {
+            button.disabled = true;
+            try {
+                const response = await fetch(`/api/eventos/mas/?cursor=${encodeURIComponent(cursor)}`);
+                const data = await response.json();
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                appendCards(grid, data.events || []);
+                if (data.cursor) {
+                    cursor = data.cursor;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+            } catch (error) {
+                button.disabled = false;
+                console.error('Error:', error);
+            }
+        });
+
+        return button;
+    }
+
+    function addEventCards(events, cursor = null) {
         if (!events || !events.length) {
             return;
         }
@@ -505,14 +594,12 @@ document.addEventListener('DOMContentLoaded', function() {
 
         const grid = document.createElement('div');
         grid.className = 'event-cards-grid';
-
-        events.forEach((event) => {
-            const card = createEventCard(event);
-            grid.appendChild(card);
-            cardObserver.observe(card);
-        });
+        appendCards(grid, events);
 
         wrapper.appendChild(grid);
+        if (cursor) {
+            wrapper.appendChild(createMoreButton(grid, cursor));
+        }
         chatMessages.appendChild(wrapper);
 
         requestAnimationFrame(() => {
@@ -524,10 +611,54 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    function addBotResponse(text, events = []) {
+    function addBotResponse(text, events = [], cursor = null) {
         addMessage(text, false);
         if (events && events.length) {
-            addEventCards(events);
+            addEventCards(events, cursor);
+        }
+    }
+
+    // Lee una respuesta NDJSON de /api/chat/: primero llegan las tarjetas y
+    // luego el texto del bot por fragmentos, que se va mostrando al recibirlos
+    async function readChatStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let botMessage = null;
+        let text = '';
+
+        const handlePart = (part) => {
+            if (part.tipo === 'eventos') {
+                hideTypingIndicator();
+                botMessage = addMessage('', false);
+                botMessage.querySelector('.message-content-wrapper').innerHTML =
+                    '<div class="typing-dots"><span></span><span></span><span></span></div>';
+                addEventCards(part.events || [], part.cursor);
+            } else if (part.tipo === 'texto' && botMessage) {
+                text += part.texto;
+                setMessageText(botMessage, text);
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter((line) => line.trim()).forEach((line) => handlePart(JSON.parse(line)));
+        }
+        if (buffer.trim()) {
+            handlePart(JSON.parse(buffer));
+        }
+
+        if (!botMessage) {
+            throw new Error('Respuesta en streaming vacía');
+        }
+        if (!text) {
+            setMessageText(botMessage, 'Lo siento, hubo un error al procesar tu mensaje.');
         }
     }
 
@@ -593,9 +724,15 @@ document.addEventListener('DOMContentLoaded', function() {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ message: trimmed })
+                body: JSON.stringify({ message: trimmed, stream: true })
             });
 
+            const contentType = response.headers.get('Content-Type') || '';
+            if (response.body && contentType.includes('application/x-ndjson')) {
+                await readChatStream(response);
+                return;
+            }
+
             const data = await response.json();
 
             // Ocultar indicador de escribiendo
@@ -604,7 +741,7 @@ document.addEventListener('DOMContentLoaded', function() {
             if (data.error) {
                 addBotResponse('Lo siento, hubo un error al procesar tu mensaje.');
             } else {
-                addBotResponse(data.response, data.events || []);
+                addBotResponse(data.response, data.events || [], data.cursor);
             }
         } catch (error) {
             hideTypingIndicator();
@@ -0,0 +1,28 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from chatbot.estaticos import nombre_webp
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagen_animada(nombre, **atributos):
+    """
+    <img> de un GIF animado, dentro de un <picture> con su variante WebP si
+    collectstatic la generó (chatbot/estaticos.py). Los atributos pasan al
+    <img>: {% imagen_animada 'images/mascota.gif' alt='CantaClaro' class='gif' %}
+    """
+    imagen = format_html('<img src="{}"{}>', static(nombre), flatatt(atributos))
+    webp = nombre_webp(nombre)
+    # Con DEBUG, runserver sirve las carpetas de origen, que no tienen la variante
+    if settings.DEBUG or webp not in getattr(staticfiles_storage, 'hashed_files', {}):
+        return imagen
+    return format_html(
+        '<picture class="imagen-animada"><source srcset="{}" type="image/webp">{}</picture>',
+        static(webp), imagen,
+    )
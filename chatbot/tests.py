@@ -1,3 +1,1755 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import httpx
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Q
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from PIL import Image, ImageChops
+
+from . import estaticos, gemini
+from .busqueda import buscar_por_titulo, ids_por_relevancia
+from .cache_local import CacheVariantes, normalizar_mensaje, proxima_medianoche_local
+from .evento_queries import (
+    INSTRUCCIONES_POR_ETAPA,
+    LARGO_DESCRIPCION_TARJETA,
+    SAL_CURSOR,
+    cache_niveles,
+    cache_resumenes,
+    catalogo_memoria,
+    circuito_gemini,
+    _config_etapa,
+    ejecutar_consulta_eventos,
+    especulacion,
+    estado_gemini,
+    formatear_respuesta_eventos,
+    _desde_posicion,
+    _generar_texto,
+    _generar_texto_stream,
+    interpretar_consulta,
+    interpretar_consulta_local,
+    interpretar_consulta_usuario,
+    interpretar_y_consultar,
+    paginar_eventos,
+    _prompt_fallback,
+    _prompt_interpretacion,
+    _prompt_recomendacion,
+    series_recurrentes,
+    siguiente_pagina,
+    uso_gemini,
+    vigilante_catalogo,
+)
+from .calendario import indexar_dias
+from .circuito import Circuito, CircuitoAbierto
+from .coalescencia import VueloCancelado
+from .catalogo_sintetico import sembrar_eventos
+from .imagenes import info_imagen
+from .importacion import importar_eventos, leer_archivo
+from .limpieza import programar_limpieza
+from .models import DiaEvento, Evento, EventoArchivado, SerieEvento, VersionCatalogo, normalizar_titulo
+from .recomendacion import MuestreadorEventos
+from .recurrencia import fechas_serie, interpretar_regla
+from .servidor_stub import ServidorStubGemini
+from .views import (
+    _detalle_evento,
+    _evento_aleatorio,
+    _info_recomendacion,
+    _procesar_coalescido,
+    _procesar_coalescido_async,
+    _respuesta_detalle,
+    vuelos_chat,
+)
+
+
+def crear_catalogo():
+    """
+    Catálogo pequeño con eventos de varias categorías, precios y fechas, y
+    descripciones largas para comprobar el recorte en SQL.
+    """
+    ahora = timezone.now()
+    categorias = ['musica', 'teatro', 'deporte', 'cultural']
+    eventos = []
+    for indice in range(16):
+        titulo = f'Evento {indice}'
+        eventos.append(Evento(
+            titulo=titulo,
+            titulo_normalizado=normalizar_titulo(titulo),
+            descripcion='Descripción larga. ' * 40,
+            categoria=categorias[indice % len(categorias)],
+            fecha_inicio=ahora + timedelta(days=indice % 5, hours=indice),
+            ubicacion='Parque Central' if indice % 2 else 'Teatro Bolívar',
+            precio=Decimal('0.00') if indice % 3 == 0 else Decimal('5.00'),
+            activo=indice != 15,
+        ))
+    Evento.objects.bulk_create(eventos)
+    indexar_dias(Evento.objects.all())
+
+
+PARAMETROS_POR_TIPO = {
+    'todos': {'tipo_consulta': 'todos'},
+    'por_fecha': {'tipo_consulta': 'por_fecha', 'fecha': 'hoy'},
+    'por_rango_fechas': {'tipo_consulta': 'por_rango_fechas', 'fecha_inicio': 'hoy', 'fecha_fin': 'mañana'},
+    'por_categoria': {'tipo_consulta': 'por_categoria', 'categoria': 'musica'},
+    'por_ubicacion': {'tipo_consulta': 'por_ubicacion', 'ubicacion': 'parque'},
+    'gratuitos': {'tipo_consulta': 'gratuitos', 'solo_gratuitos': True},
+    'proximos': {'tipo_consulta': 'proximos', 'dias_proximos': 7},
+    'busqueda': {'tipo_consulta': 'busqueda', 'texto_busqueda': 'parque'},
+    'precio_maximo': {'tipo_consulta': 'todos', 'precio_maximo': 3},
+}
+
+
+# L2 de cache_niveles en memoria, para que las pruebas que fijan el número de
+# consultas SQL no cuenten las de la tabla de caché (CacheNivelesTests usa la real)
+CACHES_MEMORIA = {
+    **settings.CACHES,
+    'compartida': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+
+# Estáticos sin manifiesto, para renderizar plantillas (el admin) sin haber
+# ejecutado collectstatic
+STORAGES_SIN_MANIFIESTO = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class GeminiStubMixin:
+    """
+    Apunta el cliente de Gemini al servidor stub local, que responde siempre
+    ``TEXTO_GEMINI``, y deja en blanco el estado por proceso (cachés y
+    circuito) entre pruebas.
+    """
+    TEXTO_GEMINI = 'Encontré eventos chéveres para ti.'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ServidorStubGemini(texto=cls.TEXTO_GEMINI)
+        cls.servidor.__enter__()
+        cls.ajustes = override_settings(GEMINI_BASE_URL=cls.servidor.url, CACHES=CACHES_MEMORIA)
+        cls.ajustes.enable()
+        gemini.reiniciar_cliente()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ajustes.disable()
+        cls.servidor.__exit__(None, None, None)
+        gemini.reiniciar_cliente()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        cache_niveles.limpiar_local()
+        caches['compartida'].clear()
+        cache_resumenes.limpiar()
+        circuito_gemini.reiniciar()
+        # Las series recurrentes se leen una vez por proceso, no en cada consulta
+        series_recurrentes.descartar()
+        series_recurrentes.cargar()
+
+
+class ClienteGeminiTests(GeminiStubMixin, TestCase):
+    """
+    Un cliente de Gemini por proceso, con sus conexiones keep-alive; se
+    vuelve a crear tras un fork o al reiniciarlo.
+    """
+
+    def test_un_cliente_por_proceso(self):
+        cliente = gemini.obtener_cliente()
+        self.assertIs(gemini.obtener_cliente(), cliente)
+
+        # Después de un fork el pid cambia y las conexiones no sirven
+        with mock.patch('chatbot.gemini.os.getpid', return_value=os.getpid() + 1):
+            hijo = gemini.obtener_cliente()
+        self.assertIsNot(hijo, cliente)
+
+        gemini.reiniciar_cliente()
+        self.assertIsNot(gemini.obtener_cliente(), hijo)
+
+    def test_conexion_reutilizada(self):
+        gemini.reiniciar_cliente()
+        conexiones = self.servidor.conexiones
+        for _ in range(3):
+            self.assertEqual(_generar_texto('formateo', 'eventos de hoy'), self.TEXTO_GEMINI)
+        self.assertEqual(self.servidor.conexiones - conexiones, 1)
+
+    def test_pools_async_por_loop(self):
+        async def pedir():
+            async with gemini.cliente_async() as primero:
+                # Con el primer pool ocupado se usa otro
+                async with gemini.cliente_async() as ocupado:
+                    pass
+            async with gemini.cliente_async() as segundo:
+                pass
+            return primero, ocupado, segundo
+
+        primero, ocupado, segundo = asyncio.run(pedir())
+        self.assertIs(segundo, primero)
+        self.assertIsNot(ocupado, primero)
+        self.assertIsNot(asyncio.run(pedir())[0], primero)
+
+
+@override_settings(EVENTOS_POR_PAGINA=4)
+class PaginacionTests(TestCase):
+    """
+    "Ver más" recorre la consulta por clave (fecha_inicio, id) con un cursor
+    firmado, sin repetir ni saltarse eventos, también con fechas empatadas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+        # Tres eventos a la misma hora, justo en el corte de una página
+        empate = Evento.objects.order_by('fecha_inicio', 'id')[3].fecha_inicio
+        for indice in range(3):
+            titulo = f'Empate {indice}'
+            Evento.objects.create(
+                titulo=titulo, descripcion='Evento empatado', categoria='musica',
+                fecha_inicio=empate, ubicacion='Parque Central', precio=Decimal('0.00'),
+            )
+
+    def test_recorrer_todas_las_paginas(self):
+        parametros = {'tipo_consulta': 'todos'}
+        eventos, cursor = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        titulos = [evento.titulo for evento in eventos]
+        paginas = 1
+        while cursor:
+            respuesta = self.client.get('/api/eventos/mas/', {'cursor': cursor})
+            self.assertEqual(respuesta.status_code, 200)
+            datos = respuesta.json()
+            self.assertLessEqual(len(datos['events']), 4)
+            titulos += [evento['titulo'] for evento in datos['events']]
+            cursor = datos['cursor']
+            paginas += 1
+
+        # Todos los eventos activos empiezan ahora o después
+        esperados = list(
+            Evento.objects.filter(activo=True).order_by('fecha_inicio', 'id').values_list('titulo', flat=True)
+        )
+        self.assertEqual(titulos, esperados)
+        self.assertEqual(paginas, -(-len(esperados) // 4))
+
+    def test_cursor_invalido(self):
+        parametros = {'tipo_consulta': 'todos'}
+        _, cursor = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        datos = signing.loads(cursor, salt=SAL_CURSOR)
+        datos['parametros'] = {'tipo_consulta': 'busqueda', 'texto_busqueda': 'x'}
+        alterado = signing.dumps(datos, salt='otra sal', compress=True)
+
+        for valor, estado in ((alterado, 400), (cursor[:-2] + 'xx', 400), ('', 400)):
+            with self.subTest(cursor=valor[-10:]):
+                self.assertEqual(self.client.get('/api/eventos/mas/', {'cursor': valor}).status_code, estado)
+
+
+class CacheIntencionesTests(GeminiStubMixin, TestCase):
+    """
+    Lo que Gemini interpreta se reutiliza para el mismo mensaje normalizado
+    hasta la medianoche local.
+    """
+    TEXTO_GEMINI = '{"es_sobre_eventos": true, "tipo_consulta": "busqueda", "texto_busqueda": "niños"}'
+    MENSAJE = 'algo para ir con niños'
+
+    def interpretar(self, mensaje):
+        with mock.patch('chatbot.evento_queries.obtener_cliente', wraps=gemini.obtener_cliente) as obtener:
+            parametros = interpretar_consulta_usuario(mensaje)
+        return parametros, obtener.call_count
+
+    def test_mensaje_repetido_sin_gemini(self):
+        parametros, llamadas = self.interpretar(self.MENSAJE)
+        self.assertEqual(llamadas, 1)
+        self.assertEqual(parametros['texto_busqueda'], 'niños')
+
+        repetido, llamadas = self.interpretar('  Algo para ir con NIÑOS ')
+        self.assertEqual(llamadas, 0)
+        self.assertEqual(repetido, parametros)
+
+    def test_expira_a_medianoche_local(self):
+        self.interpretar(self.MENSAJE)
+        clave = (timezone.localdate().strftime('%Y-%m-%d'), normalizar_mensaje(self.MENSAJE))
+        self.assertIsNotNone(cache_niveles.obtener('intenciones', clave))
+        with mock.patch('chatbot.cache_local.time.time', return_value=proxima_medianoche_local() + 1):
+            self.assertIsNone(cache_niveles.obtener('intenciones', clave))
+
+    def test_el_dia_de_la_clave_es_el_local(self):
+        # 23:30 locales, cuando en UTC ya es el día siguiente
+        hoy = timezone.localdate() + timedelta(days=1)
+        noche = timezone.make_aware(datetime.combine(hoy, datetime.min.time()) + timedelta(hours=23, minutes=30))
+        # timezone.now() devuelve la hora en UTC
+        noche = noche.astimezone(dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=noche):
+            self.assertEqual(self.interpretar(self.MENSAJE)[1], 1)
+            self.assertIsNotNone(cache_niveles.obtener('intenciones', (hoy.strftime('%Y-%m-%d'), normalizar_mensaje(self.MENSAJE))))
+            self.assertEqual(self.interpretar(self.MENSAJE)[1], 0)
+
+        # Pasada la medianoche local es otro día: se vuelve a preguntar a Gemini
+        with mock.patch('django.utils.timezone.now', return_value=noche + timedelta(hours=1)):
+            self.assertEqual(self.interpretar(self.MENSAJE)[1], 1)
+
+
+class InterpretacionLocalTests(TestCase):
+    """
+    Las consultas inequívocas se interpretan con reglas locales; cualquier
+    cosa que las reglas no cubren se deja a Gemini.
+    """
+
+    def test_consultas_inequivocas(self):
+        hoy = timezone.localdate()
+        casos = {
+            'eventos de música': {'tipo_consulta': 'por_categoria', 'categoria': 'musica'},
+            'Conciertos': {'tipo_consulta': 'por_categoria', 'categoria': 'musica'},
+            'qué hay hoy': {'tipo_consulta': 'por_fecha', 'fecha': hoy.strftime('%Y-%m-%d')},
+            'eventos de mañana': {'tipo_consulta': 'por_fecha', 'fecha': (hoy + timedelta(days=1)).strftime('%Y-%m-%d')},
+            'eventos este mes': {'tipo_consulta': 'por_fecha', 'fecha': hoy.strftime('%Y-%m')},
+            'eventos esta semana': {'tipo_consulta': 'proximos', 'dias_proximos': 7},
+            'eventos gratis': {'tipo_consulta': 'gratuitos', 'solo_gratuitos': True},
+            # Con otro criterio, "gratis" se aplica como precio máximo
+            'teatro gratis': {'tipo_consulta': 'por_categoria', 'categoria': 'teatro', 'precio_maximo': 0},
+            'eventos de menos de $10': {'tipo_consulta': 'busqueda', 'precio_maximo': 10},
+            'bailes hasta 7,50 dólares': {'tipo_consulta': 'por_categoria', 'categoria': 'danza', 'precio_maximo': 7.5},
+            'eventos de hoy gratis': {
+                'tipo_consulta': 'por_fecha', 'fecha': hoy.strftime('%Y-%m-%d'), 'precio_maximo': 0,
+            },
+        }
+        for mensaje, esperado in casos.items():
+            with self.subTest(mensaje=mensaje):
+                parametros = interpretar_consulta_local(mensaje)
+                self.assertIsNotNone(parametros)
+                self.assertTrue(parametros['es_sobre_eventos'])
+                self.assertFalse(parametros['es_recomendacion'])
+                self.assertEqual({clave: parametros.get(clave) for clave in esperado}, esperado)
+
+    def test_consultas_para_gemini(self):
+        for mensaje in (
+            '',
+            'eventos para ir con niños',
+            'música o teatro',
+            'eventos de hoy y mañana',
+            'conciertos esta semana',
+            'gratis y de menos de $5',
+            'recomiéndame algo',
+        ):
+            with self.subTest(mensaje=mensaje):
+                self.assertIsNone(interpretar_consulta_local(mensaje))
+
+    def test_sin_llamar_a_gemini(self):
+        with mock.patch('chatbot.evento_queries.obtener_cliente', wraps=gemini.obtener_cliente) as obtener:
+            parametros, origen = interpretar_consulta('eventos de teatro')
+        self.assertEqual(origen, 'local')
+        self.assertEqual(parametros['categoria'], 'teatro')
+        self.assertEqual(obtener.call_count, 0)
+
+
+class CacheResumenesTests(GeminiStubMixin, TestCase):
+    """
+    Los textos con que Gemini presentó una lista se reutilizan (varias
+    variantes por lista) hasta que cambia uno de sus eventos.
+    """
+    PARAMETROS = {'tipo_consulta': 'por_categoria', 'categoria': 'musica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+
+    def llamadas_formateo(self):
+        with mock.patch('chatbot.evento_queries.obtener_cliente', wraps=gemini.obtener_cliente) as obtener:
+            respuesta, eventos_info = formatear_respuesta_eventos(
+                ejecutar_consulta_eventos(self.PARAMETROS), self.PARAMETROS,
+            )
+        self.assertEqual(respuesta, self.TEXTO_GEMINI)
+        self.assertTrue(eventos_info)
+        return obtener.call_count
+
+    def test_variantes(self):
+        cache = CacheVariantes(tamano_maximo=10, variantes=2)
+        cache.agregar_variante('musica', 'uno', etiquetas=[1, 2])
+        self.assertIsNone(cache.obtener_variante('musica'))
+        cache.agregar_variante('musica', 'dos', etiquetas=[1, 2])
+        cache.agregar_variante('musica', 'tres', etiquetas=[1, 2])
+        # Con todas las variantes guardadas, la más antigua se descarta
+        self.assertIn(cache.obtener_variante('musica'), ('dos', 'tres'))
+        self.assertEqual(cache.variantes_de('musica'), ('dos', 'tres'))
+
+        cache.agregar_variante('teatro', 'cuatro', etiquetas=[3])
+        cache.invalidar_etiqueta(2)
+        self.assertEqual(list(cache._datos), ['teatro'])
+        self.assertEqual(cache._claves_por_etiqueta, {3: {'teatro'}})
+
+    def test_invalidar_al_guardar_un_evento_de_la_lista(self):
+        for _ in range(settings.CACHE_RESUMENES_VARIANTES):
+            self.assertEqual(self.llamadas_formateo(), 1)
+        self.assertEqual(self.llamadas_formateo(), 0)
+
+        # Un evento que no está en la lista no la afecta
+        Evento.objects.exclude(categoria='musica').first().save()
+        self.assertEqual(self.llamadas_formateo(), 0)
+
+        # La lista cambia de firma al guardar, pero sus textos no deben quedar
+        # ocupando la caché
+        Evento.objects.filter(categoria='musica', activo=True).first().save()
+        self.assertEqual(len(cache_resumenes), 0)
+        self.assertEqual(self.llamadas_formateo(), 1)
+
+@override_settings(CHAT_ESPECULATIVO=True)
+class ConsultaEspeculativaTests(GeminiStubMixin, TransactionTestCase):
+    """
+    Mientras Gemini interpreta el mensaje se ejecuta la consulta que suponen
+    las reglas locales; se usa solo si Gemini llega a la misma.
+
+    La consulta adelantada corre en otro hilo, con otra conexión: el catálogo
+    tiene que estar confirmado (TransactionTestCase).
+    """
+    TEXTO_GEMINI = '{"es_sobre_eventos": true, "tipo_consulta": "por_categoria", "categoria": "musica"}'
+    # "abuela" no lo entienden las reglas: la suposición es solo "música"
+    MENSAJE = 'conciertos para ir con mi abuela'
+
+    def setUp(self):
+        super().setUp()
+        crear_catalogo()
+        especulacion.reiniciar()
+
+    def test_acierto_usa_la_consulta_adelantada(self):
+        parametros, origen, pagina = interpretar_y_consultar(self.MENSAJE)
+        self.assertEqual((origen, parametros['categoria']), ('gemini', 'musica'))
+        self.assertIsNotNone(pagina)
+        eventos, _ = pagina
+        esperados, _ = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        self.assertEqual([evento.pk for evento in eventos], [evento.pk for evento in esperados])
+        self.assertEqual(especulacion.valores()['aciertos'], 1)
+
+    def test_descarte_si_gemini_interpreta_otra_cosa(self):
+        self.servidor.texto = '{"es_sobre_eventos": true, "tipo_consulta": "por_categoria", "categoria": "teatro"}'
+        self.addCleanup(setattr, self.servidor, 'texto', self.TEXTO_GEMINI)
+        parametros, origen, pagina = interpretar_y_consultar(self.MENSAJE)
+        self.assertEqual(parametros['categoria'], 'teatro')
+        self.assertIsNone(pagina)
+        self.assertEqual(especulacion.valores()['descartes'], 1)
+
+    def test_sin_suposicion_ni_gemini(self):
+        # Interpretación local: no hay nada que adelantar
+        self.assertIsNone(interpretar_y_consultar('eventos de música')[2])
+        # Otro tema: las reglas no suponen ninguna consulta
+        self.assertIsNone(interpretar_y_consultar('cuéntame un chiste')[2])
+        self.assertNotIn('intentos', especulacion.valores())
+
+class ConsultasPorTipoTests(GeminiStubMixin, TestCase):
+    """
+    Fija el número de consultas SQL que cuesta cada tipo_consulta, desde la
+    consulta hasta el texto de Gemini y las tarjetas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+
+    def _responder(self, parametros):
+        eventos, cursor = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        respuesta, eventos_info = formatear_respuesta_eventos(eventos, parametros)
+        return respuesta, eventos_info, cursor
+
+    # La búsqueda de texto consulta primero el índice de texto completo
+    CONSULTAS_POR_TIPO = {'busqueda': 2}
+
+    def test_una_consulta_por_tipo(self):
+        for tipo, parametros in PARAMETROS_POR_TIPO.items():
+            with self.subTest(tipo=tipo):
+                cache_resumenes.limpiar()
+                with self.assertNumQueries(self.CONSULTAS_POR_TIPO.get(tipo, 1)):
+                    respuesta, eventos_info, _ = self._responder(parametros)
+                self.assertTrue(respuesta)
+                self.assertTrue(eventos_info)
+
+    def test_recomendacion_sin_consulta(self):
+        parametros = {'tipo_consulta': 'recomendacion', 'es_recomendacion': True}
+        with self.assertNumQueries(0):
+            respuesta, eventos_info, cursor = self._responder(parametros)
+        self.assertEqual(eventos_info, [])
+        self.assertIsNone(cursor)
+
+    def test_descripcion_recortada_en_sql(self):
+        eventos, _ = paginar_eventos(ejecutar_consulta_eventos({'tipo_consulta': 'todos'}), {})
+        self.assertEqual(len(eventos[0].descripcion_corta), LARGO_DESCRIPCION_TARJETA)
+        self.assertIn('descripcion', eventos[0].get_deferred_fields())
+
+    def test_siguiente_pagina_una_consulta(self):
+        parametros = {'tipo_consulta': 'todos'}
+        primera, cursor = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        self.assertIsNotNone(cursor)
+
+        with self.assertNumQueries(1):
+            eventos_info, _ = siguiente_pagina(cursor)
+        titulos = {evento.titulo for evento in primera}
+        self.assertTrue(eventos_info)
+        self.assertFalse(titulos & {info['titulo'] for info in eventos_info})
+
+
+class DetalleYRecomendacionTests(TestCase):
+    """
+    El detalle y la recomendación leen un solo evento con una sola consulta.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+
+    def setUp(self):
+        vigilante_catalogo.verificar(forzar=True)
+        cache_niveles.limpiar_local()
+
+    def test_detalle_una_consulta(self):
+        with self.assertNumQueries(1):
+            detalle = _respuesta_detalle('Dame más información sobre evento 3')
+        self.assertEqual(detalle['events'][0]['titulo'], 'Evento 3')
+
+    def test_detalle_titulo_parecido(self):
+        for titulo in ('EVENTO 3', 'Évento 3.', 'Evnto 3'):
+            with self.subTest(titulo=titulo):
+                detalle = _respuesta_detalle(f'Dame más información sobre {titulo}')
+                self.assertEqual(detalle['events'][0]['titulo'], 'Evento 3')
+        detalle = _respuesta_detalle('Dame más información sobre concierto inexistente')
+        self.assertEqual(detalle['events'], [])
+
+    def test_titulo_normalizado_al_guardar(self):
+        evento = Evento.objects.get(titulo='Evento 3')
+        evento.titulo = 'Obra de Teatro: "El Quijote"'
+        evento.save(update_fields=['titulo'])
+        evento.refresh_from_db()
+        self.assertEqual(evento.titulo_normalizado, 'obra de teatro el quijote')
+
+    def test_detalle_guardado_hasta_cambiar_eventos(self):
+        _respuesta_detalle('Dame más información sobre Evento 3')
+        with self.assertNumQueries(0):
+            detalle = _respuesta_detalle('Dame más información sobre Evento 3')
+        self.assertEqual(detalle['events'][0]['titulo'], 'Evento 3')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Evento.objects.filter(titulo='Evento 3').get().delete()
+        detalle = _respuesta_detalle('Dame más información sobre Evento 3')
+        self.assertNotIn('Evento 3', [info['titulo'] for info in detalle['events']])
+
+    def test_recomendacion_una_consulta(self):
+        # La primera cuenta los eventos de cada día del horizonte y los guarda
+        _evento_aleatorio()
+        with self.assertNumQueries(1):
+            evento = _evento_aleatorio()
+            _info_recomendacion(evento)
+            _prompt_recomendacion(evento, 'recomiéndame algo')
+        self.assertTrue(evento.titulo)
+
+    def test_recomendacion_activa_y_proxima(self):
+        ahora = timezone.now()
+        elegidos = {_evento_aleatorio().pk for _ in range(50)}
+        self.assertGreater(len(elegidos), 1)
+        self.assertFalse(Evento.objects.filter(pk__in=elegidos).filter(Q(activo=False) | Q(fecha_inicio__lt=ahora)))
+
+    def test_recomendacion_eventos_a_la_misma_hora(self):
+        Evento.objects.all().delete()
+        manana = timezone.now() + timedelta(days=1)
+        empatados = [
+            Evento.objects.create(titulo=f'Empatado {indice}', fecha_inicio=manana) for indice in range(5)
+        ]
+        lejano = Evento.objects.create(titulo='Lejano', fecha_inicio=manana + timedelta(days=20))
+
+        muestreador = MuestreadorEventos(horizonte_dias=30, vida_media_dias=3)
+        elegidos = [muestreador.elegir().pk for _ in range(300)]
+        # Todos los empatados pueden salir, y un evento solitario lejano no
+        # gana por el hueco que lo precede
+        for evento in empatados:
+            self.assertIn(evento.pk, elegidos)
+        self.assertLess(elegidos.count(lejano.pk), 30)
+
+        parejo = MuestreadorEventos(horizonte_dias=30, vida_media_dias=None)
+        self.assertIn(lejano.pk, {parejo.elegir().pk for _ in range(200)})
+
+
+class BusquedaTextoTests(TestCase):
+    """
+    La búsqueda de texto completo ignora tildes y mayúsculas, y el detalle
+    por título corrige palabras mal escritas antes de comparar candidatos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        manana = timezone.now() + timedelta(days=1)
+        datos = [
+            ('Festival de Música Andina', 'Grupos de toda la provincia.', 'Parque Jipiro', True),
+            ('Cata de Café Lojano', 'Productores de Vilcabamba y Catamayo.', 'Casa de la Cultura', True),
+            ('Noche bohemia', 'Pasillos y música nacional con café de la casa.', 'Teatro Bolívar', True),
+            ('Música cancelada', 'No se realiza.', 'Teatro Bolívar', False),
+        ]
+        cls.eventos = {
+            titulo: Evento.objects.create(
+                titulo=titulo, descripcion=descripcion, ubicacion=ubicacion, fecha_inicio=manana, activo=activo,
+            )
+            for titulo, descripcion, ubicacion, activo in datos
+        }
+
+    def ids(self, *titulos):
+        return [self.eventos[titulo].pk for titulo in titulos]
+
+    def test_sin_tildes_ni_mayusculas(self):
+        for texto in ('musica', 'MÚSICA', 'Músíca'):
+            with self.subTest(texto=texto):
+                # El título pesa más que la descripción; el inactivo no aparece
+                self.assertEqual(ids_por_relevancia(texto), self.ids('Festival de Música Andina', 'Noche bohemia'))
+        for texto in ('cafe', 'Café'):
+            with self.subTest(texto=texto):
+                self.assertEqual(ids_por_relevancia(texto), self.ids('Cata de Café Lojano', 'Noche bohemia'))
+        self.assertEqual(ids_por_relevancia('jipiro'), self.ids('Festival de Música Andina'))
+        self.assertEqual(ids_por_relevancia('lojan'), self.ids('Cata de Café Lojano'))
+
+    @skipUnless(connection.vendor == 'sqlite', 'La corrección por vocabulario es de SQLite')
+    def test_titulo_corrige_palabras_y_compara_candidatos(self):
+        activos = Evento.objects.filter(activo=True)
+        with mock.patch('chatbot.busqueda._titulos_parecidos') as parecidos:
+            # Palabras mal escritas: las corrige el vocabulario de la tabla FTS5
+            self.assertEqual(buscar_por_titulo(activos, 'Festibal de Musika Andina').titulo, 'Festival de Música Andina')
+        parecidos.assert_not_called()
+
+        # Falta una palabra: solo lo encuentra la comparación de candidatos
+        self.assertEqual(buscar_por_titulo(activos, 'Cata de Café').titulo, 'Cata de Café Lojano')
+        self.assertIsNone(buscar_por_titulo(activos, 'Maratón nocturna'))
+        self.assertIsNone(buscar_por_titulo(activos, 'Música cancelada'))
+
+
+class ChatConsultasTests(GeminiStubMixin, TestCase):
+    """
+    Una petición completa al chat con interpretación local hace una sola
+    consulta a la base de datos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+
+    def test_chat_una_consulta(self):
+        # La versión del catálogo se lee como mucho una vez por intervalo
+        vigilante_catalogo.verificar(forzar=True)
+        with self.assertNumQueries(1):
+            respuesta = self.client.post(
+                '/api/chat/',
+                json.dumps({'message': 'eventos de música'}),
+                content_type='application/json',
+            )
+        datos = respuesta.json()
+        self.assertEqual(datos['origen'], 'local')
+        self.assertTrue(datos['events'])
+
+    def test_pregunta_frecuente_guardada(self):
+        vigilante_catalogo.verificar(forzar=True)
+        cuerpo = json.dumps({'message': 'eventos de música'})
+        primera = self.client.post('/api/chat/', cuerpo, content_type='application/json').json()
+        with self.assertNumQueries(0):
+            segunda = self.client.post('/api/chat/', cuerpo, content_type='application/json').json()
+        self.assertEqual(segunda['origen'], 'cache')
+        self.assertEqual(segunda['events'], primera['events'])
+        self.assertEqual(segunda['response'], primera['response'])
+
+
+class CacheNivelesTests(TestCase):
+    """
+    La caché en dos niveles con el L2 configurado (la tabla de caché): lo
+    que guarda un proceso lo lee otro desde L2 y lo copia a su L1.
+    """
+
+    def setUp(self):
+        cache_niveles.limpiar_local()
+        cache_niveles.contadores.reiniciar()
+
+    def test_lectura_desde_l2(self):
+        cache_niveles.guardar('faq', ('clave',), {'respuesta': 'hola'})
+        # Otro proceso: su L1 está vacío
+        cache_niveles.limpiar_local()
+        self.assertEqual(cache_niveles.obtener('faq', ('clave',)), {'respuesta': 'hola'})
+        with self.assertNumQueries(0):
+            cache_niveles.obtener('faq', ('clave',))
+        self.assertIsNone(cache_niveles.obtener('faq', ('otra',)))
+
+        faq = cache_niveles.estadisticas()['faq']
+        self.assertEqual((faq['aciertos_l1'], faq['aciertos_l2'], faq['fallos']), (1, 1, 1))
+
+    def test_espacio_solo_l1(self):
+        cache_niveles.guardar('detalles', ('clave',), 'detalle')
+        self.assertEqual(cache_niveles.obtener('detalles', ('clave',)), 'detalle')
+        cache_niveles.limpiar_local()
+        self.assertIsNone(cache_niveles.obtener('detalles', ('clave',)))
+
+    def test_obtener_o_calcular_y_expiracion(self):
+        calculos = []
+
+        def calcular():
+            calculos.append(1)
+            return 'valor'
+
+        for _ in range(3):
+            self.assertEqual(cache_niveles.obtener_o_calcular('intenciones', ('clave',), calcular), 'valor')
+        self.assertEqual(len(calculos), 1)
+
+        cache_niveles.guardar('intenciones', ('vencida',), 'valor', expira_en=time.time() - 1)
+        cache_niveles.limpiar_local()
+        self.assertIsNone(cache_niveles.obtener('intenciones', ('vencida',)))
+
+
+class UsoGeminiTests(GeminiStubMixin, TestCase):
+    """
+    Las instrucciones fijas de cada etapa viajan como system_instruction y
+    el uso (tokens y respuestas) se acumula por etapa.
+    """
+
+    def setUp(self):
+        super().setUp()
+        uso_gemini.reiniciar()
+
+    def test_instrucciones_fuera_del_prompt(self):
+        for etapa, instrucciones in INSTRUCCIONES_POR_ETAPA.items():
+            with self.subTest(etapa=etapa):
+                self.assertEqual(_config_etapa(etapa).system_instruction, instrucciones)
+
+        interpretacion = _prompt_interpretacion('eventos de hoy', timezone.localtime())
+        self.assertIn('eventos de hoy', interpretacion)
+        self.assertNotIn(INSTRUCCIONES_POR_ETAPA['interpretacion'].splitlines()[0], interpretacion)
+        self.assertNotIn(INSTRUCCIONES_POR_ETAPA['fallback'].splitlines()[0], _prompt_fallback('hola'))
+
+    def test_tokens_por_etapa(self):
+        prompt = _prompt_interpretacion('eventos de hoy', timezone.localtime())
+        _generar_texto('interpretacion', prompt)
+        list(_generar_texto_stream('formateo', 'Eventos encontrados: 0', 'respaldo'))
+
+        uso = estado_gemini()['uso']
+        # El stub estima un token por cada 4 caracteres de instrucciones y prompt
+        self.assertEqual(
+            uso['interpretacion.tokens_entrada'],
+            (len(INSTRUCCIONES_POR_ETAPA['interpretacion']) + len(prompt)) // 4,
+        )
+        self.assertEqual(uso['interpretacion.tokens_salida'], len(self.TEXTO_GEMINI) // 4)
+        self.assertEqual(uso['interpretacion.respuestas'], 1)
+        self.assertIn('interpretacion.ms_primer_token', uso)
+
+        self.assertEqual(uso['formateo.respuestas'], 1)
+        self.assertEqual(
+            uso['formateo.tokens_entrada'],
+            (len(INSTRUCCIONES_POR_ETAPA['formateo']) + len('Eventos encontrados: 0')) // 4,
+        )
+        self.assertNotIn('recomendacion.respuestas', uso)
+
+
+class CircuitoTests(TestCase):
+    """
+    Transiciones del circuito: cerrado, abierto, semiabierto con una sola
+    llamada de prueba y de vuelta a cerrado o abierto.
+    """
+
+    def setUp(self):
+        self.reloj = mock.patch('chatbot.circuito.time.monotonic', return_value=100.0)
+        self.ahora = self.reloj.start()
+        self.addCleanup(self.reloj.stop)
+        self.circuito = Circuito(umbral_fallos=2, enfriamiento=10.0)
+
+    def abrir(self):
+        for _ in range(2):
+            self.circuito.verificar()
+            self.circuito.registrar_fallo()
+
+    def test_abre_tras_fallos_consecutivos(self):
+        self.circuito.registrar_fallo()
+        self.circuito.registrar_exito()
+        self.circuito.registrar_fallo()
+        self.assertTrue(self.circuito.permitir())
+
+        self.circuito.registrar_fallo()
+        self.assertEqual(self.circuito.estadisticas()['estado'], Circuito.ABIERTO)
+        with self.assertRaises(CircuitoAbierto):
+            self.circuito.verificar()
+        self.assertEqual(self.circuito.estadisticas()['rechazadas'], 1)
+
+    def test_una_sola_llamada_de_prueba(self):
+        self.abrir()
+        self.ahora.return_value = 110.0
+        self.assertTrue(self.circuito.permitir())
+        self.assertEqual(self.circuito.estadisticas()['estado'], Circuito.SEMIABIERTO)
+        # Mientras la prueba está en curso se rechaza el resto
+        self.assertFalse(self.circuito.permitir())
+
+        self.circuito.registrar_exito()
+        self.assertEqual(self.circuito.estadisticas()['estado'], Circuito.CERRADO)
+        self.assertTrue(self.circuito.permitir())
+
+    def test_prueba_fallida_vuelve_a_abrir(self):
+        self.abrir()
+        self.ahora.return_value = 110.0
+        self.assertTrue(self.circuito.permitir())
+        self.circuito.registrar_fallo()
+
+        estadisticas = self.circuito.estadisticas()
+        self.assertEqual(estadisticas['estado'], Circuito.ABIERTO)
+        self.assertEqual(estadisticas['aperturas'], 2)
+        self.assertFalse(self.circuito.permitir())
+        self.ahora.return_value = 120.0
+        self.assertTrue(self.circuito.permitir())
+
+
+class PresupuestosGeminiTests(GeminiStubMixin, TestCase):
+    """
+    El presupuesto de cada etapa corta la llamada síncrona completa, y con el
+    circuito abierto no se llama a Gemini.
+    """
+
+    def llamadas(self, resultado):
+        return estado_gemini()['llamadas'].get(f'interpretacion.{resultado}', 0)
+
+    def test_respuesta_lenta_se_corta_al_agotar_el_presupuesto(self):
+        # Cada fragmento tarda menos que el presupuesto; la respuesta, 1 segundo
+        presupuestos = {**settings.GEMINI_PRESUPUESTOS, 'interpretacion': 0.3}
+        timeouts = self.llamadas('timeout')
+        with ServidorStubGemini(goteo=0.1, fragmentos=11) as lento, \
+                override_settings(GEMINI_BASE_URL=lento.url, GEMINI_PRESUPUESTOS=presupuestos):
+            gemini.reiniciar_cliente()
+            self.addCleanup(gemini.reiniciar_cliente)
+            inicio = time.perf_counter()
+            with self.assertRaises(httpx.TimeoutException):
+                _generar_texto('interpretacion', 'eventos de hoy')
+            transcurrido = time.perf_counter() - inicio
+
+        self.assertLess(transcurrido, 0.6)
+        self.assertEqual(self.llamadas('timeout'), timeouts + 1)
+
+    def test_circuito_abierto_no_llama(self):
+        self.assertTrue(_generar_texto('interpretacion', 'eventos de hoy'))
+        for _ in range(circuito_gemini.umbral_fallos):
+            circuito_gemini.registrar_fallo()
+        rechazadas = self.llamadas('rechazadas')
+        with self.assertRaises(CircuitoAbierto):
+            _generar_texto('interpretacion', 'eventos de hoy')
+        self.assertEqual(self.llamadas('rechazadas'), rechazadas + 1)
+
+
+def esperar_hasta(condicion, segundos=2.0):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        if time.monotonic() > limite:
+            raise AssertionError('La condición no se cumplió a tiempo')
+        time.sleep(0.01)
+
+
+@override_settings(COALESCENCIA_ESPERA_MAXIMA=5)
+class CoalescenciaTests(TestCase):
+    """
+    Las peticiones idénticas simultáneas comparten el trabajo del líder, y el
+    vuelo se libera aunque el líder se cancele o su respuesta en streaming se
+    cierre sin leerse.
+    """
+    MENSAJE = 'eventos de hoy'
+    RESPUESTA = ('Hoy hay dos eventos.', [{'id': 1}], 'gemini', None)
+
+    def en_curso(self):
+        return vuelos_chat.estadisticas()['en_curso']
+
+    def test_seguidor_reutiliza_la_respuesta(self):
+        liberar = threading.Event()
+        llamadas = []
+
+        def procesar(user_message, stream=False):
+            llamadas.append(user_message)
+            liberar.wait(5)
+            return self.RESPUESTA
+
+        seguidores = vuelos_chat.estadisticas()['seguidores']
+        with mock.patch('chatbot.views._procesar_mensaje', side_effect=procesar), ThreadPoolExecutor(2) as hilos:
+            lider = hilos.submit(_procesar_coalescido, self.MENSAJE)
+            esperar_hasta(lambda: llamadas)
+            seguidor = hilos.submit(_procesar_coalescido, self.MENSAJE)
+            esperar_hasta(lambda: vuelos_chat.estadisticas()['seguidores'] > seguidores)
+            liberar.set()
+            self.assertEqual(lider.result(2), self.RESPUESTA)
+            self.assertEqual(seguidor.result(2), self.RESPUESTA)
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(self.en_curso(), 0)
+
+    def test_stream_cerrado_sin_leer(self):
+        fragmentos = iter(['Hoy hay ', 'dos eventos.'])
+        with mock.patch('chatbot.views._procesar_mensaje', return_value=(fragmentos, [], 'gemini', None)):
+            respuesta = self.client.post(
+                '/api/chat/', json.dumps({'message': self.MENSAJE, 'stream': True}), content_type='application/json',
+            )
+            self.assertEqual(self.en_curso(), 1)
+            respuesta.close()
+        self.assertEqual(self.en_curso(), 0)
+
+        # La siguiente petición idéntica es líder, no espera al vuelo anterior
+        with mock.patch('chatbot.views._procesar_mensaje', return_value=self.RESPUESTA):
+            inicio = time.perf_counter()
+            self.assertEqual(_procesar_coalescido(self.MENSAJE), self.RESPUESTA)
+        self.assertLess(time.perf_counter() - inicio, 1)
+
+    async def test_lider_cancelado(self):
+        empezo = asyncio.Event()
+
+        async def procesar(user_message, stream=False):
+            if not empezo.is_set():
+                empezo.set()
+                await asyncio.sleep(10)
+            return self.RESPUESTA
+
+        with mock.patch('chatbot.views._procesar_mensaje_async', side_effect=procesar):
+            lider = asyncio.create_task(_procesar_coalescido_async(self.MENSAJE))
+            await empezo.wait()
+            seguidor = asyncio.create_task(_procesar_coalescido_async(self.MENSAJE))
+            await asyncio.sleep(0.01)
+            lider.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await lider
+            with self.assertRaises(VueloCancelado):
+                await asyncio.wait_for(seguidor, 1)
+
+            siguiente = await asyncio.wait_for(_procesar_coalescido_async(self.MENSAJE), 1)
+        self.assertEqual(siguiente, self.RESPUESTA)
+        self.assertEqual(self.en_curso(), 0)
+
+    async def test_stream_async_cerrado_sin_leer(self):
+        async def fragmentos():
+            yield 'Hoy hay dos eventos.'
+
+        with mock.patch('chatbot.views._procesar_mensaje_async', return_value=(fragmentos(), [], 'gemini', None)):
+            respuesta = await self.async_client.post(
+                '/api/chat/async/', {'message': self.MENSAJE, 'stream': True}, content_type='application/json',
+            )
+            self.assertEqual(self.en_curso(), 1)
+            # Como el manejador ASGI: desde un hilo
+            await sync_to_async(respuesta.close)()
+        await asyncio.sleep(0)
+        self.assertEqual(self.en_curso(), 0)
+
+        with mock.patch('chatbot.views._procesar_mensaje_async', return_value=self.RESPUESTA):
+            siguiente = await asyncio.wait_for(_procesar_coalescido_async(self.MENSAJE), 1)
+        self.assertEqual(siguiente, self.RESPUESTA)
+
+
+class ChatAsincronoTests(GeminiStubMixin, TestCase):
+    """
+    La vista asíncrona responde lo mismo que la síncrona y atiende varias
+    conversaciones a la vez mientras espera a Gemini.
+    """
+    TEXTO_GEMINI = '{"es_sobre_eventos": true, "tipo_consulta": "por_ubicacion", "ubicacion": "parque"}'
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+
+    async def preguntar(self, mensaje):
+        respuesta = await self.async_client.post(
+            '/api/chat/async/', json.dumps({'message': mensaje}), content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    async def test_igual_que_la_vista_sincrona(self):
+        datos = await self.preguntar('eventos de música')
+        self.assertEqual(datos['origen'], 'local')
+        sincrona = await sync_to_async(self.client.post)(
+            '/api/chat/', json.dumps({'message': 'eventos de música'}), content_type='application/json',
+        )
+        self.assertEqual(sincrona.json()['events'], datos['events'])
+
+    async def test_interpreta_con_gemini(self):
+        datos = await self.preguntar('eventos cerca del parque central')
+        self.assertEqual(datos['origen'], 'gemini')
+        self.assertTrue(datos['events'])
+        self.assertEqual({evento['ubicacion'] for evento in datos['events']}, {'Parque Central'})
+
+    async def test_conversaciones_en_paralelo(self):
+        self.servidor.latencia = 0.3
+        self.addCleanup(setattr, self.servidor, 'latencia', 0.0)
+        inicio = time.perf_counter()
+        respuestas = await asyncio.gather(*(
+            self.preguntar(f'eventos cerca del parque central {numero}') for numero in range(4)
+        ))
+        # Una a una serían 8 llamadas a Gemini (interpretar y presentar)
+        self.assertLess(time.perf_counter() - inicio, 1.5)
+        self.assertEqual({datos['origen'] for datos in respuestas}, {'gemini'})
+
+    async def test_errores(self):
+        vacio = await self.async_client.post('/api/chat/async/', {'message': ''}, content_type='application/json')
+        self.assertEqual(vacio.status_code, 400)
+        self.assertEqual((await self.async_client.get('/api/chat/async/')).status_code, 405)
+
+
+class ChatStreamingTests(GeminiStubMixin, TestCase):
+    """
+    Con "stream": true el chat responde NDJSON: primero las tarjetas, luego
+    el texto de Gemini en fragmentos a medida que llega y al final "fin".
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+
+    def cuerpo(self, mensaje='eventos de música'):
+        return json.dumps({'message': mensaje, 'stream': True})
+
+    def verificar_partes(self, respuesta, lineas):
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(respuesta['Cache-Control'], 'no-cache')
+        partes = [json.loads(linea) for linea in lineas]
+        self.assertEqual(partes[0]['tipo'], 'eventos')
+        self.assertEqual(partes[0]['origen'], 'local')
+        self.assertTrue(partes[0]['events'])
+        self.assertIn('cursor', partes[0])
+        self.assertEqual(partes[-1], {'tipo': 'fin'})
+        textos = [parte['texto'] for parte in partes[1:-1]]
+        self.assertEqual({parte['tipo'] for parte in partes[1:-1]}, {'texto'})
+        return textos
+
+    def test_tarjetas_y_texto_por_fragmentos(self):
+        respuesta = self.client.post('/api/chat/', self.cuerpo(), content_type='application/json')
+        lineas = b''.join(respuesta.streaming_content).decode('utf-8').splitlines()
+        textos = self.verificar_partes(respuesta, lineas)
+        self.assertGreater(len(textos), 1)
+        self.assertEqual(''.join(textos), self.TEXTO_GEMINI)
+
+    def test_respaldo_si_gemini_falla(self):
+        for _ in range(circuito_gemini.umbral_fallos):
+            circuito_gemini.registrar_fallo()
+        respuesta = self.client.post('/api/chat/', self.cuerpo(), content_type='application/json')
+        lineas = b''.join(respuesta.streaming_content).decode('utf-8').splitlines()
+        textos = self.verificar_partes(respuesta, lineas)
+        self.assertEqual(len(textos), 1)
+        self.assertNotEqual(textos[0], self.TEXTO_GEMINI)
+
+    async def test_vista_asincrona(self):
+        respuesta = await self.async_client.post('/api/chat/async/', self.cuerpo(), content_type='application/json')
+        lineas = b''.join([linea async for linea in respuesta.streaming_content]).decode('utf-8').splitlines()
+        textos = self.verificar_partes(respuesta, lineas)
+        self.assertEqual(''.join(textos), self.TEXTO_GEMINI)
+
+
+class VersionCatalogoTests(TestCase):
+    """
+    Cada cambio en los eventos sube la versión del catálogo; un proceso
+    descarta sus cachés de eventos solo si la cambió otro proceso.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+
+    def setUp(self):
+        vigilante_catalogo.verificar(forzar=True)
+        cache_resumenes.limpiar()
+        cache_resumenes.agregar_variante('lista', 'texto')
+
+    def version(self):
+        return VersionCatalogo.objects.get().version
+
+    def test_cambio_propio_no_descarta(self):
+        anterior = self.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            evento = Evento.objects.first()
+            evento.save()
+        self.assertEqual(self.version(), anterior + 1)
+        self.assertFalse(vigilante_catalogo.verificar(forzar=True))
+        self.assertEqual(len(cache_resumenes), 1)
+
+    def test_cambio_de_otro_proceso_descarta(self):
+        VersionCatalogo.objects.update(version=F('version') + 1)
+        self.assertTrue(vigilante_catalogo.verificar(forzar=True))
+        self.assertEqual(len(cache_resumenes), 0)
+        self.assertFalse(catalogo_memoria.cargado)
+        # Sin cambios nuevos no se vuelve a descartar
+        self.assertFalse(vigilante_catalogo.verificar(forzar=True))
+
+    def test_eliminar_eventos_pasados_sube_version(self):
+        Evento.objects.update(fecha_inicio=timezone.now() - timedelta(days=1))
+        anterior = self.version()
+        call_command('eliminar_eventos_pasados', stdout=StringIO())
+        self.assertFalse(Evento.objects.exists())
+        self.assertGreater(self.version(), anterior)
+        # Elimina sin señales, así que el propio proceso también descarta
+        self.assertTrue(vigilante_catalogo.verificar(forzar=True))
+
+
+class CalendarioTests(TestCase):
+    """
+    Las consultas por días incluyen los eventos de varios días que ya estaban
+    en curso, una sola vez cada uno y en orden de fecha_inicio.
+    """
+
+    def setUp(self):
+        hoy = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+        self.feria = Evento.objects.create(
+            titulo='Feria de Loja', descripcion='Feria anual', categoria='feria',
+            fecha_inicio=hoy - timedelta(days=2, hours=-10), fecha_fin=hoy + timedelta(days=1),
+            ubicacion='Recinto ferial',
+        )
+        self.concierto = Evento.objects.create(
+            titulo='Concierto', descripcion='Concierto de la orquesta', categoria='musica',
+            fecha_inicio=hoy + timedelta(hours=20), ubicacion='Teatro Bolívar',
+        )
+
+    def titulos(self, parametros):
+        return [evento.titulo for evento in ejecutar_consulta_eventos(parametros)]
+
+    def test_hoy_incluye_eventos_en_curso(self):
+        self.assertEqual(self.titulos({'tipo_consulta': 'por_fecha', 'fecha': 'hoy'}), ['Feria de Loja', 'Concierto'])
+        # Termina a medianoche: mañana ya no está en curso
+        self.assertEqual(self.titulos({'tipo_consulta': 'por_fecha', 'fecha': 'mañana'}), [])
+        este_mes = timezone.localdate().strftime('%Y-%m')
+        self.assertEqual(self.titulos({'tipo_consulta': 'por_fecha', 'fecha': este_mes}).count('Feria de Loja'), 1)
+
+    def test_guardar_rehace_los_dias(self):
+        self.feria.fecha_fin += timedelta(days=1)
+        self.feria.save()
+        self.assertEqual(self.titulos({'tipo_consulta': 'por_fecha', 'fecha': 'mañana'}), ['Feria de Loja'])
+        self.assertEqual(self.feria.dias.count(), 4)
+
+        self.feria.delete()
+        self.assertFalse(DiaEvento.objects.exclude(evento=self.concierto).exists())
+
+
+def _local(*fecha):
+    return timezone.make_aware(datetime(*fecha))
+
+
+class RecurrenciaTests(TestCase):
+    """
+    Las series recurrentes se expanden al paginar, solo dentro del rango
+    pedido, intercaladas con los eventos y sin escribir ocurrencias.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        SerieEvento.objects.create(
+            titulo='Yoga en el parque', descripcion='Clase abierta', categoria='deporte',
+            fecha_inicio=_local(2026, 10, 3, 8), duracion=timedelta(hours=1),
+            regla='FREQ=WEEKLY;BYDAY=SA', excepciones=['2026-11-14'], ubicacion='Parque Jipiro',
+        )
+        SerieEvento.objects.create(
+            titulo='Concierto del primer viernes', descripcion='Orquesta municipal', categoria='musica',
+            fecha_inicio=_local(2026, 10, 2, 20), regla='FREQ=MONTHLY;BYDAY=1FR;COUNT=3',
+            ubicacion='Teatro Bolívar', precio=Decimal('5.00'),
+        )
+        SerieEvento.objects.create(
+            titulo='Feria de fin de mes', descripcion='Dos días de feria', categoria='feria',
+            fecha_inicio=_local(2026, 10, 31, 10), duracion=timedelta(days=2),
+            regla='FREQ=MONTHLY;BYMONTHDAY=-1', ubicacion='Recinto ferial',
+        )
+        Evento.objects.create(
+            titulo='Concierto de gala', descripcion='Gala anual', categoria='musica',
+            fecha_inicio=_local(2026, 11, 21, 20), ubicacion='Teatro Bolívar',
+        )
+
+    def setUp(self):
+        series_recurrentes.descartar()
+
+    def tearDown(self):
+        # Las series de la prueba se deshacen con la transacción, sin señales
+        series_recurrentes.descartar()
+
+    def fechas(self, regla, inicio, desde=None, excepciones=()):
+        return [fecha.strftime('%Y-%m-%d %H:%M') for fecha in itertools.islice(
+            fechas_serie(interpretar_regla(regla), inicio, desde, excepciones), 4,
+        )]
+
+    def test_fechas_de_la_regla(self):
+        inicio = datetime(2026, 1, 31, 9)
+        self.assertEqual(self.fechas('FREQ=MONTHLY', inicio), [
+            '2026-01-31 09:00', '2026-03-31 09:00', '2026-05-31 09:00', '2026-07-31 09:00',
+        ])
+        self.assertEqual(self.fechas('FREQ=MONTHLY;BYDAY=-1FR', inicio, date(2026, 3, 1)), [
+            '2026-03-27 09:00', '2026-04-24 09:00', '2026-05-29 09:00', '2026-06-26 09:00',
+        ])
+        self.assertEqual(self.fechas('FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,SA', inicio, date(2026, 2, 8)), [
+            '2026-02-10 09:00', '2026-02-14 09:00', '2026-02-24 09:00', '2026-02-28 09:00',
+        ])
+        # Las excepciones cuentan para COUNT
+        self.assertEqual(
+            self.fechas('FREQ=DAILY;COUNT=3', inicio, excepciones={date(2026, 2, 1)}),
+            ['2026-01-31 09:00', '2026-02-02 09:00'],
+        )
+        self.assertEqual(self.fechas('FREQ=DAILY;UNTIL=20260201', inicio), ['2026-01-31 09:00', '2026-02-01 09:00'])
+        with self.assertRaises(ValueError):
+            interpretar_regla('FREQ=HOURLY')
+
+    def test_mes_con_ocurrencias_y_eventos(self):
+        parametros = {'tipo_consulta': 'por_fecha', 'fecha': '2026-11'}
+        esperado = [
+            # En curso desde el 31 de octubre
+            ('Feria de fin de mes', '31/10/2026 10:00'),
+            ('Concierto del primer viernes', '06/11/2026 20:00'),
+            ('Yoga en el parque', '07/11/2026 08:00'),
+            ('Yoga en el parque', '21/11/2026 08:00'),
+            ('Concierto de gala', '21/11/2026 20:00'),
+            ('Yoga en el parque', '28/11/2026 08:00'),
+            ('Feria de fin de mes', '30/11/2026 10:00'),
+        ]
+        for en_memoria in (False, True):
+            with self.subTest(en_memoria=en_memoria), override_settings(
+                CATALOGO_EN_MEMORIA=en_memoria, EVENTOS_POR_PAGINA=3,
+            ):
+                catalogo_memoria.descartar()
+                eventos, cursor = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+                vistos = [(evento.titulo, timezone.localtime(evento.fecha_inicio).strftime('%d/%m/%Y %H:%M'))
+                          for evento in eventos]
+                while cursor:
+                    eventos_info, cursor = siguiente_pagina(cursor)
+                    vistos += [(info['titulo'], timezone.localtime(
+                        datetime.strptime(info['fecha'], '%d/%m/%Y %H:%M').replace(tzinfo=dt_timezone.utc)
+                    ).strftime('%d/%m/%Y %H:%M')) for info in eventos_info]
+                self.assertEqual(vistos, esperado)
+        self.assertEqual(Evento.objects.count(), 1)
+
+    def test_filtros_y_series_sin_fin(self):
+        gratuitos = ejecutar_consulta_eventos({'tipo_consulta': 'gratuitos', 'solo_gratuitos': True})
+        eventos, cursor = paginar_eventos(gratuitos, {})
+        self.assertNotIn('Concierto del primer viernes', [evento.titulo for evento in eventos])
+        self.assertIsNotNone(cursor)
+        # La serie de conciertos terminó en diciembre
+        diciembre = {'tipo_consulta': 'por_categoria', 'categoria': 'musica'}
+        eventos, _ = paginar_eventos(ejecutar_consulta_eventos(diciembre), diciembre)
+        self.assertEqual([evento.fecha_inicio for evento in eventos if evento.pk < 0], [
+            _local(2026, 10, 2, 20), _local(2026, 11, 6, 20), _local(2026, 12, 4, 20),
+        ])
+
+    def test_detalle_de_una_serie(self):
+        with mock.patch('chatbot.recurrencia.timezone.now', return_value=_local(2026, 11, 8)):
+            detalle = _detalle_evento('yoga en el parque')
+        self.assertEqual(detalle['events'][0]['fecha'], '21/11/2026 08:00')
+        self.assertIn('**Se repite:** cada semana: sábado', detalle['response'])
+
+    def test_cambios_en_la_serie(self):
+        parametros = {'tipo_consulta': 'por_fecha', 'fecha': '2026-11-07'}
+        eventos, _ = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        self.assertEqual([evento.titulo for evento in eventos], ['Yoga en el parque'])
+        with self.captureOnCommitCallbacks(execute=True):
+            SerieEvento.objects.filter(titulo='Yoga en el parque').get().delete()
+        self.assertEqual(paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)[0], [])
+
+    def test_regla_invalida(self):
+        serie = SerieEvento(
+            titulo='Mal', descripcion='-', fecha_inicio=_local(2026, 1, 1), ubicacion='-',
+            regla='FREQ=WEEKLY;BYDAY=XX', excepciones=['ayer'],
+        )
+        with self.assertRaises(ValidationError) as contexto:
+            serie.full_clean()
+        self.assertEqual(set(contexto.exception.message_dict), {'regla', 'excepciones'})
+
+
+CSV_IMPORTACION = """uid,titulo,categoria,fecha_inicio,ubicacion,precio
+a1,Concierto de Jazz,Música,2026-11-05 20:00,Teatro Bolívar,"$12,50"
+a2,Feria del Libro,Feria,05/11/2026 10:00,Parque Central,gratis
+a3,Sin fecha,Teatro,,Teatro Bolívar,5
+a1,Concierto de Jazz,Música,2026-11-05 20:00,Teatro Bolívar,15
+a4,Recital caro,Música,2026-11-06 20:00,Teatro Bolívar,caro
+a5,Recital sin precio,Música,2026-11-06 21:00,Teatro Bolívar,nan
+"""
+
+ICS_IMPORTACION = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+BEGIN:VEVENT\r
+UID:obra-1@loja\r
+DTSTART;TZID=America/Guayaquil:20261107T193000\r
+DTEND:20261108T013000Z\r
+SUMMARY:Obra de teatro\\, comedia\r
+DESCRIPTION:Una comedia en dos actos con elenco lo\r
+ jano.\r
+LOCATION:Teatro Bolívar\r
+CATEGORIES:TEATRO,COMEDIA\r
+BEGIN:VALARM\r
+DESCRIPTION:Recordatorio\r
+END:VALARM\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:feria-1@loja\r
+DTSTART;VALUE=DATE:20261110\r
+SUMMARY:Feria cancelada\r
+STATUS:CANCELLED\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+class ImportacionTests(TestCase):
+    """
+    importar_eventos valida, deduplica e inserta o actualiza por lotes, con
+    los eventos listos para la búsqueda de texto y el detalle por título.
+    """
+
+    def test_csv_valida_y_deduplica(self):
+        resultado = importar_eventos(leer_archivo(StringIO(CSV_IMPORTACION), 'csv'), lote=2)
+        self.assertEqual((resultado.leidas, resultado.guardadas), (6, 3))
+        self.assertEqual(resultado.invalidas, 3)
+        self.assertEqual([linea for linea, _ in resultado.errores], [4, 6, 7])
+        self.assertEqual(resultado.errores[-1][1], "precio inválido: 'nan'")
+        self.assertEqual(Evento.objects.count(), 2)
+
+        jazz = Evento.objects.get(titulo='Concierto de Jazz')
+        # La repetición llegó en otro lote y sobrescribe a la primera
+        self.assertEqual(jazz.precio, Decimal('15.00'))
+        self.assertEqual(jazz.categoria, 'musica')
+        self.assertEqual(jazz.titulo_normalizado, 'concierto de jazz')
+        self.assertIn(jazz.pk, ids_por_relevancia('jazz'))
+        self.assertTrue(Evento.objects.get(titulo='Feria del Libro').es_gratuito)
+
+    def test_reimportar_actualiza(self):
+        importar_eventos(leer_archivo(StringIO(CSV_IMPORTACION), 'csv'))
+        jazz = Evento.objects.get(titulo='Concierto de Jazz')
+        version = VersionCatalogo.objects.get().version
+
+        fila = {'uid': 'a1', 'titulo': 'Concierto de Jazz Latino', 'fecha_inicio': '2026-11-05T20:00:00-05:00'}
+        resultado = importar_eventos(leer_archivo(StringIO(json.dumps(fila) + '\n'), 'jsonl'))
+        self.assertEqual(resultado.guardadas, 1)
+        self.assertEqual(Evento.objects.count(), 2)
+        actualizado = Evento.objects.get(pk=jazz.pk)
+        self.assertEqual(actualizado.titulo_normalizado, 'concierto de jazz latino')
+        self.assertEqual(actualizado.fecha_creacion, jazz.fecha_creacion)
+        self.assertIn(jazz.pk, ids_por_relevancia('latino'))
+        self.assertGreater(VersionCatalogo.objects.get().version, version)
+
+    def test_ics(self):
+        resultado = importar_eventos(leer_archivo(StringIO(ICS_IMPORTACION), 'ics'))
+        self.assertEqual((resultado.guardadas, resultado.invalidas), (2, 0))
+
+        obra = Evento.objects.get(titulo='Obra de teatro, comedia')
+        self.assertEqual(obra.descripcion, 'Una comedia en dos actos con elenco lojano.')
+        self.assertEqual(obra.categoria, 'teatro')
+        self.assertEqual(obra.fecha_inicio, obra.fecha_fin - timedelta(hours=1))
+        self.assertFalse(Evento.objects.get(titulo='Feria cancelada').activo)
+
+    def test_comando(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'eventos.csv')
+            with open(ruta, 'w', encoding='utf-8') as archivo:
+                archivo.write(CSV_IMPORTACION)
+            salida = StringIO()
+            call_command('importar_eventos', ruta, '--dry-run', stdout=salida)
+            self.assertFalse(Evento.objects.exists())
+            call_command('importar_eventos', ruta, stdout=salida)
+        self.assertIn('filas/s', salida.getvalue())
+        self.assertIn('Línea 6: precio inválido', salida.getvalue())
+        self.assertEqual(Evento.objects.count(), 2)
+
+
+class LimpiezaTests(TestCase):
+    """
+    eliminar_eventos_pasados elimina por lotes y, si se pide, archiva los
+    eventos en la tabla de archivados o en un archivo comprimido.
+    """
+
+    def setUp(self):
+        crear_catalogo()
+        # 7 de los 16 eventos pasan a ser de hace 10 días
+        pasados = Evento.objects.order_by('pk').values_list('pk', flat=True)[:7]
+        Evento.objects.filter(pk__in=list(pasados)).update(
+            fecha_inicio=timezone.now() - timedelta(days=10)
+        )
+
+    def test_archivo_por_lotes(self):
+        salida = StringIO()
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'archivo.jsonl.gz')
+            call_command(
+                'eliminar_eventos_pasados', '--lote', '3', '--pausa', '0', '--archivo', ruta,
+                stdout=salida,
+            )
+            with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+                archivados = [json.loads(linea) for linea in archivo]
+
+        self.assertIn('en 3 lote(s)', salida.getvalue())
+        self.assertEqual(Evento.objects.count(), 9)
+        self.assertEqual(len(archivados), 7)
+        self.assertFalse(Evento.objects.filter(pk__in=[datos['id'] for datos in archivados]).exists())
+        self.assertEqual(archivados[0]['descripcion'], 'Descripción larga. ' * 40)
+        self.assertFalse(EventoArchivado.objects.exists())
+
+    def test_archivar_en_tabla(self):
+        call_command('eliminar_eventos_pasados', '--dias', '5', '--archivar', '--pausa', '0', stdout=StringIO())
+        self.assertEqual(Evento.objects.count(), 9)
+        archivado = EventoArchivado.objects.first()
+        self.assertEqual(EventoArchivado.objects.count(), 7)
+        self.assertEqual(archivado.datos['titulo'], archivado.titulo)
+        self.assertIn(archivado.datos['precio'], ('0.00', '5.00'))
+        # Ya no aparecen en la búsqueda de texto
+        encontrados = ids_por_relevancia('descripción larga')
+        self.assertEqual(len(encontrados), 8)  # el inactivo no aparece
+        self.assertNotIn(archivado.evento_id, encontrados)
+
+    @override_settings(STORAGES=STORAGES_SIN_MANIFIESTO)
+    def test_accion_admin_fuera_de_la_peticion(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        seleccion = list(Evento.objects.values_list('pk', flat=True))
+        with mock.patch('chatbot.admin.programar_limpieza') as programar:
+            respuesta = self.client.post(
+                '/admin/chatbot/evento/',
+                {'action': 'archivar_eventos_pasados', '_selected_action': seleccion},
+                follow=True,
+            )
+        self.assertContains(respuesta, 'Se están archivando 7 evento(s) pasado(s) en segundo plano')
+        # La petición no eliminó nada: solo programó la limpieza
+        self.assertEqual(Evento.objects.count(), 16)
+        eventos, = programar.call_args.args
+        self.assertEqual(programar.call_args.kwargs, {'archivar': True})
+
+        with override_settings(LIMPIEZA_SEGUNDO_PLANO=False, LIMPIEZA_PAUSA=0):
+            resultado = programar_limpieza(eventos, archivar=True)
+        self.assertEqual(resultado.eliminados, 7)
+        self.assertEqual(EventoArchivado.objects.count(), 7)
+
+
+def imagen_subida(nombre, ancho, alto, modo='RGBA'):
+    """PNG de ``ancho`` x ``alto`` como si viniera del formulario del admin."""
+    salida = BytesIO()
+    Image.new(modo, (ancho, alto), (200, 80, 40, 255) if modo == 'RGBA' else 'orange').save(salida, 'PNG')
+    return SimpleUploadedFile(nombre, salida.getvalue(), content_type='image/png')
+
+
+class ImagenesTests(TestCase):
+    """
+    Al guardar un evento con una imagen nueva se generan sus derivados WebP y
+    JPEG con nombres por contenido, y las tarjetas los reciben como srcset.
+    """
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(
+            MEDIA_ROOT=directorio.name,
+            IMAGENES_DERIVADOS={**settings.IMAGENES_DERIVADOS, 'ANCHOS': (160, 320, 640), 'SEGUNDO_PLANO': False},
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def crear_evento(self, imagen):
+        with self.captureOnCommitCallbacks(execute=True):
+            evento = Evento.objects.create(
+                titulo='Feria con imagen', fecha_inicio=timezone.now() + timedelta(days=1), imagen=imagen,
+            )
+        return Evento.objects.get(pk=evento.pk)
+
+    def test_derivados_al_guardar(self):
+        evento = self.crear_evento(imagen_subida('cartel.png', 800, 400))
+        derivados = evento.imagen_derivados
+        self.assertEqual(derivados['origen'], evento.imagen.name)
+        self.assertEqual((derivados['ancho'], derivados['alto']), (800, 400))
+        for formato in ('webp', 'jpeg'):
+            tamanos = [(ancho, alto) for ancho, alto, _ in derivados[formato]]
+            self.assertEqual(tamanos, [(160, 80), (320, 160), (640, 320)])
+            for *_, nombre in derivados[formato]:
+                self.assertRegex(nombre, rf'^eventos/derivados/[0-9a-f]{{20}}\.{formato}$')
+                self.assertTrue(default_storage.exists(nombre))
+
+        tarjeta = _info_recomendacion(evento)['imagen']
+        self.assertEqual(tarjeta['src'], default_storage.url(derivados['jpeg'][0][2]))
+        self.assertEqual((tarjeta['ancho'], tarjeta['alto']), (160, 80))
+        self.assertTrue(tarjeta['srcset']['webp'].endswith('.webp 640w'))
+
+        # La misma imagen en otro evento reutiliza los archivos
+        otro = self.crear_evento(imagen_subida('cartel.png', 800, 400))
+        self.assertNotEqual(otro.imagen.name, evento.imagen.name)
+        self.assertEqual(otro.imagen_derivados['webp'], derivados['webp'])
+
+    def test_no_amplia_ni_reintenta_errores(self):
+        pequena = self.crear_evento(imagen_subida('logo.png', 200, 100, modo='RGB'))
+        self.assertEqual([ancho for ancho, *_ in pequena.imagen_derivados['jpeg']], [160, 200])
+
+        rota = self.crear_evento(SimpleUploadedFile('rota.png', b'no es una imagen', content_type='image/png'))
+        self.assertIn('error', rota.imagen_derivados)
+        self.assertIsNone(info_imagen(rota.imagen_derivados))
+        # Guardarlo de nuevo no vuelve a intentarlo
+        with mock.patch('chatbot.imagenes.generar_derivados') as generar, \
+                self.captureOnCommitCallbacks(execute=True):
+            rota.save()
+        generar.assert_not_called()
+
+    def test_comando(self):
+        evento = self.crear_evento(imagen_subida('cartel.png', 400, 300))
+        Evento.objects.filter(pk=evento.pk).update(imagen_derivados={})
+        salida = StringIO()
+        call_command('generar_imagenes', stdout=salida)
+        self.assertIn('Derivados de 1 imagen(es)', salida.getvalue())
+        self.assertEqual(Evento.objects.get(pk=evento.pk).imagen_derivados, evento.imagen_derivados)
+
+
+class EstaticosTests(TestCase):
+    """
+    construir_estaticos deja los estáticos con hash, el GIF animado también en
+    WebP y el CSS precomprimido; la plantilla ofrece el WebP y Django sirve
+    la versión comprimida con caché de un año.
+    """
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        origen = os.path.join(directorio.name, 'origen')
+        os.makedirs(os.path.join(origen, 'images'))
+        # Degradados: el GIF los guarda mal, el WebP bien
+        base = Image.radial_gradient('L').resize((160, 160))
+        cuadros = [
+            Image.merge('RGB', (base, ImageChops.offset(base, indice * 8, 0), base.transpose(Image.Transpose.ROTATE_90)))
+            for indice in range(4)
+        ]
+        cuadros[0].save(
+            os.path.join(origen, 'images', 'mascota.gif'),
+            save_all=True, append_images=cuadros[1:], duration=[50, 50, 100, 100], loop=0,
+        )
+        cuadros[0].save(os.path.join(origen, 'images', 'fija.gif'))
+        self.css = '.tarjeta { color: #333; margin: 0 auto; }\n' * 50
+        with open(os.path.join(origen, 'estilos.css'), 'w', encoding='utf-8') as archivo:
+            archivo.write(self.css)
+
+        ajustes = override_settings(
+            STATIC_ROOT=os.path.join(directorio.name, 'publicos'),
+            STATICFILES_DIRS=[origen],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        estaticos._nombres_con_hash.cache_clear()
+        self.addCleanup(estaticos._nombres_con_hash.cache_clear)
+
+        self.salida = StringIO()
+        call_command('construir_estaticos', '--todos', stdout=self.salida)
+
+    def test_construir(self):
+        archivos = staticfiles_storage.hashed_files
+        self.assertRegex(archivos['images/mascota.webp'], r'^images/mascota\.[0-9a-f]{12}\.webp$')
+        self.assertNotIn('images/fija.webp', archivos)
+        with staticfiles_storage.open(archivos['images/mascota.webp']) as archivo, Image.open(archivo) as webp:
+            self.assertEqual(webp.n_frames, 4)
+            webp.seek(2)
+            webp.load()
+            self.assertEqual(webp.info['duration'], 100)
+
+        with staticfiles_storage.open(archivos['estilos.css'] + '.gz') as archivo:
+            self.assertEqual(gzip.decompress(archivo.read()).decode(), self.css)
+        self.assertRegex(self.salida.getvalue(), r'images/mascota\.gif: .* \(webp, -\d+%\)')
+        self.assertRegex(self.salida.getvalue(), r'estilos\.css: .* \(gzip, -\d+%\)')
+
+    def test_plantilla_y_servir(self):
+        html = Template(
+            "{% load estaticos %}{% imagen_animada 'images/mascota.gif' alt='Mascota' class='gif' %}"
+        ).render(Context())
+        self.assertIn('<source srcset="/static/images/mascota.', html)
+        self.assertIn('alt="Mascota" class="gif"', html)
+        with override_settings(DEBUG=True):
+            self.assertNotIn('<picture', Template(
+                "{% load estaticos %}{% imagen_animada 'images/mascota.gif' %}"
+            ).render(Context()))
+
+        url = staticfiles_storage.url('estilos.css')
+        respuesta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(respuesta['Content-Type'], 'text/css')
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertEqual(respuesta['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(respuesta.streaming_content)).decode(), self.css)
+
+        respuesta = self.client.get('/static/estilos.css')
+        self.assertNotIn('Content-Encoding', respuesta)
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=3600')
+
+
+class CatalogoMemoriaTests(TestCase):
+    """
+    El catálogo en memoria responde lo mismo que el ORM, página por página y
+    con los mismos cursores, para cada tipo_consulta, también después de
+    guardar, crear y eliminar eventos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+        ahora = timezone.now()
+        mismo_momento = ahora + timedelta(days=2)
+        extras = [
+            # Dos eventos a la misma hora, para el desempate por id
+            ('Feria del libro', 'feria', mismo_momento, 'Plaza San Sebastián', 'Calle Bolívar y Rocafuerte', '0.00'),
+            ('Feria de ciencias', 'feria', mismo_momento, 'Plaza San Sebastián', '', '2.50'),
+            ('Cine al parque', 'cultural', ahora - timedelta(days=1), 'PARQUE JIPIRO', '', '0.00'),
+            ('Concierto sinfónico', 'musica', ahora + timedelta(days=35), 'Teatro Bolívar', 'Centro Histórico', '12.00'),
+            ('Danza urbana', 'danza', ahora + timedelta(days=6), 'Coliseo', 'Av. Universitaria, Parque Central', '3.00'),
+        ]
+        # Eventos de varios días que ya están en curso hoy
+        en_curso = [
+            ('Feria de artesanías', 'feria', ahora - timedelta(days=2), timedelta(days=4), '0.00'),
+            ('Exposición de fotografía', 'cultural', ahora - timedelta(days=40), timedelta(days=60), '1.00'),
+        ]
+        Evento.objects.bulk_create([
+            Evento(
+                titulo=titulo, titulo_normalizado=normalizar_titulo(titulo), descripcion=f'{titulo} en Loja',
+                categoria=categoria, fecha_inicio=fecha, ubicacion=ubicacion, direccion=direccion,
+                precio=Decimal(precio),
+            )
+            for titulo, categoria, fecha, ubicacion, direccion, precio in extras
+        ] + [
+            Evento(
+                titulo=titulo, titulo_normalizado=normalizar_titulo(titulo), descripcion=f'{titulo} en Loja',
+                categoria=categoria, fecha_inicio=fecha, fecha_fin=fecha + duracion, ubicacion='Parque Central',
+                precio=Decimal(precio),
+            )
+            for titulo, categoria, fecha, duracion, precio in en_curso
+        ])
+        indexar_dias(Evento.objects.all())
+
+    def setUp(self):
+        super().setUp()
+        catalogo_memoria.descartar()
+        self.addCleanup(catalogo_memoria.descartar)
+        este_mes = timezone.localdate().strftime('%Y-%m')
+        self.consultas = list(PARAMETROS_POR_TIPO.values()) + [
+            {'tipo_consulta': 'por_fecha', 'fecha': 'mañana'},
+            {'tipo_consulta': 'por_fecha', 'fecha': este_mes},
+            {'tipo_consulta': 'por_fecha', 'fecha': 'cualquier día'},
+            {'tipo_consulta': 'por_rango_fechas', 'fecha_inicio': 'hoy'},
+            {'tipo_consulta': 'por_rango_fechas', 'fecha_fin': 'mañana'},
+            {'tipo_consulta': 'por_rango_fechas', 'fecha_inicio': este_mes},
+            {'tipo_consulta': 'por_categoria', 'categoria': 'feria'},
+            {'tipo_consulta': 'por_categoria', 'categoria': 'circo'},
+            {'tipo_consulta': 'por_categoria', 'categoria': 'teatro', 'precio_maximo': 3},
+            {'tipo_consulta': 'por_ubicacion', 'ubicacion': 'PARQUE'},
+            {'tipo_consulta': 'por_ubicacion', 'ubicacion': 'bolívar'},
+            {'tipo_consulta': 'proximos', 'dias_proximos': 2, 'solo_gratuitos': True},
+            {'tipo_consulta': 'busqueda', 'texto_busqueda': 'feria'},
+            {'tipo_consulta': 'busqueda', 'texto_busqueda': 'teatro bolívar', 'precio_maximo': 5},
+            {'tipo_consulta': 'busqueda', 'texto_busqueda': 'el de'},
+            {'tipo_consulta': 'busqueda', 'texto_busqueda': 'mañana'},
+        ]
+
+    def _paginas(self, parametros):
+        """
+        Todas las páginas de la consulta: la primera con ids y fechas de
+        actualización, las siguientes como las pide el frontend.
+        """
+        eventos, cursor = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        paginas = [[
+            (evento.pk, evento.titulo, evento.fecha_inicio, evento.precio, evento.categoria,
+             evento.ubicacion, evento.descripcion_corta, evento.fecha_actualizacion)
+            for evento in eventos
+        ]]
+        while cursor:
+            # Los cursores firmados llevan la hora; se compara su contenido
+            paginas.append(signing.loads(cursor, salt=SAL_CURSOR))
+            eventos_info, cursor = siguiente_pagina(cursor)
+            paginas.append(eventos_info)
+        return paginas
+
+    def _verificar_paridad(self):
+        for parametros in self.consultas:
+            with self.subTest(parametros=parametros):
+                with override_settings(CATALOGO_EN_MEMORIA=False):
+                    esperado = self._paginas(parametros)
+                with override_settings(CATALOGO_EN_MEMORIA=True):
+                    self.assertEqual(self._paginas(parametros), esperado)
+
+    @override_settings(EVENTOS_POR_PAGINA=3)
+    def test_paridad_con_orm(self):
+        self._verificar_paridad()
+
+    @override_settings(EVENTOS_POR_PAGINA=3)
+    def test_paridad_tras_cambios(self):
+        with override_settings(CATALOGO_EN_MEMORIA=True):
+            self._paginas({'tipo_consulta': 'todos'})
+        self.assertTrue(catalogo_memoria.cargado)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            evento = Evento.objects.get(titulo='Evento 3')
+            evento.fecha_inicio += timedelta(days=10)
+            evento.categoria = 'feria'
+            evento.precio = Decimal('0.00')
+            evento.save()
+            Evento.objects.filter(titulo='Evento 4').get().delete()
+            inactivo = Evento.objects.get(titulo='Evento 5')
+            inactivo.activo = False
+            inactivo.save()
+            reactivado = Evento.objects.get(titulo='Evento 15')
+            reactivado.activo = True
+            reactivado.save()
+            Evento.objects.create(
+                titulo='Feria nueva', descripcion='En el parque', categoria='feria',
+                fecha_inicio=timezone.now() + timedelta(days=2), ubicacion='Parque Central',
+            )
+        self._verificar_paridad()
+
+    def test_pagina_sin_consultas(self):
+        parametros = {'tipo_consulta': 'por_categoria', 'categoria': 'musica'}
+        with override_settings(CATALOGO_EN_MEMORIA=True):
+            self._paginas(parametros)
+            with self.assertNumQueries(0):
+                eventos, _ = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        self.assertTrue(eventos)
+
+
+class PlanesConsultaMixin:
+    """
+    Ejecuta EXPLAIN sobre la primera página y sobre una página con cursor de
+    cada tipo_consulta, en un catálogo de 100k eventos, y falla si alguna
+    recorre la tabla completa u ordena todos los resultados. Las búsquedas de
+    texto sí ordenan, pero solo los BUSQUEDA_MAX_RESULTADOS más relevantes.
+    """
+    TOTAL_EVENTOS = 100_000
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar_eventos(cls.TOTAL_EVENTOS)
+
+    def verificar_plan(self, plan, ordena=False):
+        raise NotImplementedError
+
+    def test_planes_por_tipo(self):
+        for tipo, parametros in PARAMETROS_POR_TIPO.items():
+            # Las búsquedas de texto se ordenan por su puesto en el ranking
+            valor = 3 if tipo == 'busqueda' else timezone.now()
+            for posicion in (None, (valor, 1)):
+                with self.subTest(tipo=tipo, cursor=posicion is not None):
+                    consulta = _desde_posicion(ejecutar_consulta_eventos(parametros), posicion)
+                    self.verificar_plan(consulta.explain(), ordena=tipo == 'busqueda')
+
+    def test_busqueda_con_ids_grandes(self):
+        # El puesto en el ranking se calcula sobre ids BigAutoField
+        grande = Evento.objects.create(
+            pk=2 ** 31 + 7, titulo='Concierto gigantesco', fecha_inicio=timezone.now() + timedelta(days=1),
+        )
+        consulta = ejecutar_consulta_eventos({'tipo_consulta': 'busqueda', 'texto_busqueda': 'gigantesco'})
+        self.assertEqual([evento.pk for evento in consulta], [grande.pk])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Requiere SQLite')
+class PlanesSQLiteTests(PlanesConsultaMixin, TestCase):
+
+    def verificar_plan(self, plan, ordena=False):
+        # "SCAN <tabla>" sin "USING INDEX" es un recorrido de la tabla completa
+        self.assertNotRegex(plan, rf'SCAN {Evento._meta.db_table}\b(?! USING)', plan)
+        if not ordena:
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, plan)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Requiere PostgreSQL (CHATBOT_POSTGRES_DB)')
+class PlanesPostgreSQLTests(PlanesConsultaMixin, TestCase):
+
+    def verificar_plan(self, plan, ordena=False):
+        self.assertNotIn('Seq Scan', plan, plan)
+        if not ordena:
+            self.assertNotRegex(plan, r'\bSort\b', plan)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -5,6 +6,9 @@ app_name = 'chatbot'
 
 urlpatterns = [
     path('', views.index, name='index'),
-    path('api/chat/', views.chat, name='chat'),
+    path('api/chat/', views.chat_async if settings.CHAT_ASINCRONO else views.chat, name='chat'),
+    path('api/chat/async/', views.chat_async, name='chat_async'),
+    path('api/eventos/mas/', views.mas_eventos, name='mas_eventos'),
+    path('api/metricas/', views.metricas, name='metricas'),
 ]
 
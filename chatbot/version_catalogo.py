@@ -0,0 +1,117 @@
+"""
+Invalidación de las cachés de eventos entre procesos con un número de versión
+del catálogo guardado en la base de datos (modelo VersionCatalogo).
+
+Cada cambio en los eventos sube la versión dentro de la misma transacción
+(signals.py; las cargas que no pasan por las señales deben llamar a
+``incrementar(descartar_locales=True)``). Cada proceso la lee como mucho una
+vez por petición y una vez cada ``intervalo`` segundos (middleware.py) y, si
+otro proceso la subió, descarta sus cachés de eventos. Los cambios del propio proceso ya los
+resuelven las señales evento por evento, así que no provocan el descarte.
+"""
+import threading
+import time
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import VersionCatalogo
+
+ID_VERSION = 1
+
+
+class VigilanteVersion:
+    """
+    Sigue la versión del catálogo en un proceso y llama a las funciones
+    registradas con ``al_cambiar`` cuando cambia por otro proceso.
+    """
+
+    def __init__(self, intervalo=1.0):
+        self.intervalo = intervalo
+        self._al_cambiar = []
+        self._lock = threading.Lock()
+        self._conocida = None
+        self._propios = 0
+        self._proxima = 0.0
+        self.verificaciones = 0
+        self.cambios_externos = 0
+
+    def al_cambiar(self, funcion):
+        self._al_cambiar.append(funcion)
+        return funcion
+
+    def incrementar(self, descartar_locales=False):
+        """
+        Sube la versión del catálogo. Se llama dentro de la transacción que
+        modifica los eventos, así los demás procesos ven el cambio recién al
+        confirmarse. Con ``descartar_locales`` el propio proceso también
+        descarta sus cachés en la próxima verificación (para las cargas que
+        no pasan por las señales).
+        """
+        versiones = VersionCatalogo.objects.filter(pk=ID_VERSION)
+        cambios = {'version': F('version') + 1, 'fecha_actualizacion': timezone.now()}
+        if not versiones.update(**cambios):
+            VersionCatalogo.objects.get_or_create(pk=ID_VERSION)
+            versiones.update(**cambios)
+        if not descartar_locales:
+            transaction.on_commit(self._registrar_cambio_propio)
+
+    def _registrar_cambio_propio(self):
+        with self._lock:
+            self._propios += 1
+
+    def version_actual(self):
+        """
+        Versión que ve el proceso, con sus propios cambios ya confirmados, o
+        None si aún no la leyó. Sirve como parte de claves de caché que deben
+        quedar atrás cuando cambian los eventos.
+        """
+        with self._lock:
+            if self._conocida is None:
+                return None
+            return self._conocida + self._propios
+
+    def toca_verificar(self):
+        return time.monotonic() >= self._proxima
+
+    def verificar(self, forzar=False):
+        """
+        Lee la versión (si pasó el intervalo desde la última lectura o con
+        ``forzar``) y descarta las cachés si otro proceso cambió los eventos.
+        Retorna True si las descartó.
+
+        Un cambio propio cuya confirmación aún no se registró puede provocar
+        un descarte de más, nunca uno de menos.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            if not forzar and ahora < self._proxima:
+                return False
+            self._proxima = ahora + self.intervalo
+
+        version = (
+            VersionCatalogo.objects.filter(pk=ID_VERSION)
+            .values_list('version', flat=True)
+            .first()
+        ) or 0
+
+        with self._lock:
+            self.verificaciones += 1
+            anterior, propios = self._conocida, self._propios
+            self._conocida, self._propios = version, 0
+            if anterior is None or version == anterior + propios:
+                return False
+            self.cambios_externos += 1
+
+        for funcion in self._al_cambiar:
+            funcion()
+        return True
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'version': self._conocida,
+                'verificaciones': self.verificaciones,
+                'cambios_externos': self.cambios_externos,
+            }
@@ -1,27 +1,113 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from django.core import signing
 from django.utils import timezone
+from asgiref.sync import sync_to_async
 import json
 from .evento_queries import (
-    interpretar_consulta_usuario,
+    cache_intenciones,
+    cache_niveles,
+    cache_resumenes,
+    contar_llamadas_gemini,
+    es_respuesta_respaldo,
+    muestreador_recomendaciones,
+    estadisticas_especulacion,
+    estado_gemini,
+    interpretaciones,
+    interpretar_y_consultar,
+    interpretar_y_consultar_async,
     ejecutar_consulta_eventos,
+    paginar_eventos,
+    paginar_eventos_async,
+    siguiente_pagina,
     formatear_respuesta_eventos,
-    generar_respuesta_fallback
+    formatear_respuesta_eventos_async,
+    formatear_respuesta_eventos_stream,
+    formatear_respuesta_eventos_stream_async,
+    generar_respuesta_recomendacion,
+    generar_respuesta_recomendacion_async,
+    generar_respuesta_recomendacion_stream,
+    generar_respuesta_recomendacion_stream_async,
+    generar_respuesta_fallback,
+    generar_respuesta_fallback_async,
+    generar_respuesta_fallback_stream,
+    generar_respuesta_fallback_stream_async,
+    series_recurrentes,
+    vigilante_catalogo,
 )
-from .models import Evento
+from .busqueda import buscar_por_titulo
+from .cache_local import normalizar_mensaje, proxima_medianoche_local
+from .coalescencia import Vuelos
+from .imagenes import info_imagen
+from .models import Evento, normalizar_titulo
+from .recurrencia import describir_regla
 
 # Create your views here.
 
+# Respuestas quemadas para preguntas frecuentes
+FAQ_RESPONSES = {
+    'eventos de hoy': 'eventos de hoy',
+    'eventos de esta semana': 'eventos de esta semana',
+    'eventos de este mes': 'eventos de este mes',
+    'eventos gratis': 'eventos gratis',
+    'eventos de música': 'eventos de música',
+    'eventos de teatro': 'eventos de teatro'
+}
+
+DETALLE_PREFIX = "dame más información sobre "
+
+# Columnas que leen la respuesta de detalle y la recomendación (prompt y tarjeta)
+CAMPOS_DETALLE = (
+    'id', 'titulo', 'descripcion', 'categoria', 'fecha_inicio', 'fecha_fin',
+    'ubicacion', 'direccion', 'precio', 'contacto', 'enlace', 'imagen_derivados',
+)
+CAMPOS_RECOMENDACION = (
+    'id', 'titulo', 'descripcion', 'categoria', 'fecha_inicio', 'ubicacion', 'precio', 'imagen_derivados',
+)
+
+SIN_EVENTOS_PARA_RECOMENDAR = 'Lo siento, no hay eventos disponibles en este momento. Pronto habrá más eventos chéveres en Loja.'
+
+# Peticiones de chat en curso por mensaje normalizado; las idénticas que
+# llegan mientras tanto comparten la respuesta en lugar de llamar a Gemini.
+vuelos_chat = Vuelos()
+
+
 def index(request):
     """Vista principal del chatbot"""
     return render(request, 'chatbot/index.html')
 
+@staff_member_required
+def metricas(request):
+    """
+    Estado del circuito de Gemini y contadores del chat para monitoreo
+    (solo staff). Los valores son del proceso que atiende la petición.
+    """
+    return JsonResponse({
+        'gemini': estado_gemini(),
+        'interpretaciones': interpretaciones.valores(),
+        'especulacion': estadisticas_especulacion(),
+        'cache_intenciones': cache_intenciones.estadisticas(),
+        'cache_resumenes': cache_resumenes.estadisticas(),
+        'cache_niveles': cache_niveles.estadisticas(),
+        'coalescencia': vuelos_chat.estadisticas(),
+        'version_catalogo': vigilante_catalogo.estadisticas(),
+    })
+
+
 @csrf_exempt
 def chat(request):
     """
     Endpoint para recibir mensajes y responder con Gemini.
     Gemini interpreta la consulta, extrae parámetros y ejecuta consultas SQL predefinidas.
+    Las consultas inequívocas se interpretan localmente sin llamar a Gemini; el campo
+    'origen' de la respuesta indica qué camino la resolvió (local, cache, gemini, respaldo).
+    Con ``"stream": true`` en el cuerpo la respuesta es NDJSON (ver ``_lineas_stream``).
+    Las listas de eventos se devuelven por páginas: 'cursor' permite pedir la
+    siguiente a ``mas_eventos`` (None si no hay más).
     """
     if request.method == 'POST':
         try:
@@ -31,163 +117,582 @@ def chat(request):
             if not user_message:
                 return JsonResponse({'error': 'Mensaje vacío'}, status=400)
             
-            lower_message = user_message.strip().lower()
+            stream = bool(data.get('stream'))
+            respuesta, eventos_info, origen, cursor = _procesar_coalescido(user_message, stream=stream)
+
+            if stream:
+                return _respuesta_stream(
+                    _lineas_stream(respuesta, eventos_info, origen, cursor),
+                    al_cerrar=getattr(respuesta, 'close', None),
+                )
+
+            return JsonResponse({
+                'response': respuesta,
+                'events': eventos_info,
+                'origen': origen,
+                'cursor': cursor
+            })
+            
+        except Exception as e:
+            return JsonResponse({
+                'error': f'Error al procesar la solicitud: {str(e)}'
+            }, status=500)
+    
+    return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+
+@csrf_exempt
+async def chat_async(request):
+    """
+    Versión asíncrona de ``chat`` para despliegues ASGI (config/asgi.py).
+    Las llamadas a Gemini usan el cliente asíncrono y el ORM se ejecuta con
+    querysets asíncronos o ``sync_to_async``, de modo que un solo proceso puede
+    atender muchas conversaciones mientras espera al LLM.
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            user_message = data.get('message', '')
+            
+            if not user_message:
+                return JsonResponse({'error': 'Mensaje vacío'}, status=400)
             
-            # Respuestas quemadas para preguntas frecuentes
-            faq_responses = {
-                'eventos de hoy': 'eventos de hoy',
-                'eventos de esta semana': 'eventos de esta semana',
-                'eventos de este mes': 'eventos de este mes',
-                'eventos gratis': 'eventos gratis',
-                'eventos de música': 'eventos de música',
-                'eventos de teatro': 'eventos de teatro'
-            }
+            stream = bool(data.get('stream'))
+            respuesta, eventos_info, origen, cursor = await _procesar_coalescido_async(user_message, stream=stream)
+
+            if stream:
+                return _respuesta_stream(
+                    _lineas_stream_async(respuesta, eventos_info, origen, cursor),
+                    al_cerrar=getattr(respuesta, 'close', None),
+                )
+
+            return JsonResponse({
+                'response': respuesta,
+                'events': eventos_info,
+                'origen': origen,
+                'cursor': cursor
+            })
             
-            # Verificar si es una pregunta frecuente
-            is_faq = False
-            for faq_key in faq_responses.keys():
-                if faq_key in lower_message:
-                    is_faq = True
-                    # Normalizar la consulta para que funcione con el sistema existente
-                    user_message = faq_responses[faq_key]
-                    break
-            detalle_prefix = "dame más información sobre "
-            eventos_info = []
+        except Exception as e:
+            return JsonResponse({
+                'error': f'Error al procesar la solicitud: {str(e)}'
+            }, status=500)
+    
+    return JsonResponse({'error': 'Método no permitido'}, status=405)
 
-            if lower_message.startswith(detalle_prefix):
-                titulo_evento = user_message.strip()[len(detalle_prefix):].strip()
 
-                if not titulo_evento:
-                    return JsonResponse({
-                        'response': 'Necesito que me digas el nombre del evento del que quieres más información.'
-                    })
+@require_GET
+def mas_eventos(request):
+    """
+    Siguiente página de eventos de una respuesta del chat ("Ver más"). Recibe
+    el 'cursor' de la respuesta anterior y ejecuta la misma consulta desde ahí,
+    sin volver a interpretar el mensaje ni llamar a Gemini.
+    """
+    cursor = request.GET.get('cursor', '')
+    if not cursor:
+        return JsonResponse({'error': 'Cursor vacío'}, status=400)
 
-                evento = Evento.objects.filter(titulo__iexact=titulo_evento).first()
+    try:
+        eventos_info, cursor = siguiente_pagina(cursor)
+    except signing.BadSignature:
+        return JsonResponse({'error': 'Cursor inválido'}, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Error al procesar la solicitud: {str(e)}'
+        }, status=500)
 
-                if not evento:
-                    return JsonResponse({
-                        'response': f"No encontré un evento con el nombre '{titulo_evento}'. ¿Quieres intentar con otro nombre?"
-                    })
+    return JsonResponse({'events': eventos_info, 'cursor': cursor})
 
-                fecha_inicio = timezone.localtime(evento.fecha_inicio)
-                fecha_fin = timezone.localtime(evento.fecha_fin) if evento.fecha_fin else None
 
-                fecha_texto = fecha_inicio.strftime('%d/%m/%Y a las %H:%M')
-                if fecha_fin and fecha_fin.date() != fecha_inicio.date():
-                    fecha_texto += f" hasta el {fecha_fin.strftime('%d/%m/%Y a las %H:%M')}"
-                elif fecha_fin and fecha_fin != fecha_inicio:
-                    fecha_texto += f" hasta las {fecha_fin.strftime('%H:%M')}"
+def _procesar_coalescido(user_message, stream=False):
+    """
+    Como ``_procesar_mensaje``, pero si ya hay una petición con el mismo
+    mensaje normalizado en curso, espera y reutiliza sus partes (tarjetas y
+    texto) a medida que se publican, sin repetir las llamadas a Gemini.
+    """
+    clave = normalizar_mensaje(user_message)
+    vuelo, es_lider = vuelos_chat.unirse(clave)
+    if not es_lider:
+        partes = vuelo.seguir(settings.COALESCENCIA_ESPERA_MAXIMA)
+        _, eventos_info, origen, cursor = next(partes)
+        textos = (texto for _, texto in partes)
+        return (textos if stream else ''.join(textos)), eventos_info, origen, cursor
 
-                precio_texto = "Gratis" if evento.es_gratuito else f"${evento.precio}"
-                ubicacion_texto = evento.ubicacion or "Ubicación por confirmar"
-                direccion_texto = f" ({evento.direccion})" if evento.direccion else ""
-                descripcion = (evento.descripcion or "").strip()
+    try:
+        with contar_llamadas_gemini(vuelo.llamadas):
+            respuesta, eventos_info, origen, cursor = _procesar_mensaje(user_message, stream=stream)
+        vuelo.publicar(('eventos', eventos_info, origen, cursor))
+    except BaseException as e:
+        vuelos_chat.terminar(clave, vuelo, error=e)
+        raise
 
-                lineas_respuesta = [
-                    f"A ver, mijo, te cuento del {evento.titulo}:",
-                    f"[calendar] **Fecha y horario:** {fecha_texto}",
-                    f"[location] **Lugar:** {ubicacion_texto}{direccion_texto}",
-                ]
+    if isinstance(respuesta, str):
+        vuelo.publicar(('texto', respuesta))
+        vuelos_chat.terminar(clave, vuelo)
+        return respuesta, eventos_info, origen, cursor
+    return _Retransmision(clave, vuelo, respuesta), eventos_info, origen, cursor
 
-                if descripcion:
-                    lineas_respuesta.append(f"[detail] **¿Qué habrá?:** {descripcion}")
 
-                lineas_respuesta.append(f"[price] **Costo:** {precio_texto}")
-                lineas_respuesta.append(f"[category] **Categoría:** {evento.get_categoria_display()}")
+class _Retransmision:
+    """
+    Entrega los fragmentos del líder publicándolos también para sus
+    seguidores. El vuelo termina cuando se acaban, cuando fallan (también si
+    la lectura se cancela) o con ``close``, que Django llama al cerrar la
+    respuesta aunque nunca se haya empezado a leer.
+    """
 
-                if evento.contacto:
-                    lineas_respuesta.append(f"[contact] **Contacto:** {evento.contacto}")
-                if evento.enlace:
-                    lineas_respuesta.append(f"[link] **Más info:** {evento.enlace}")
+    def __init__(self, clave, vuelo, fragmentos):
+        self.clave = clave
+        self.vuelo = vuelo
+        self.fragmentos = fragmentos
+        self.terminada = False
 
-                lineas_respuesta.append("Apoya lo local.")
+    def __iter__(self):
+        return self
 
-                respuesta_detalle = "\n".join(lineas_respuesta)
+    def __next__(self):
+        if self.terminada:
+            raise StopIteration
+        try:
+            with contar_llamadas_gemini(self.vuelo.llamadas):
+                fragmento = next(self.fragmentos, None)
+        except BaseException as e:
+            self._terminar(error=e)
+            raise
+        if fragmento is None:
+            self._terminar()
+            raise StopIteration
+        self.vuelo.publicar(('texto', fragmento))
+        return fragmento
 
-                eventos_info.append({
-                    'titulo': evento.titulo,
-                    'descripcion': evento.descripcion or '',
-                    'fecha': fecha_inicio.strftime('%d/%m/%Y %H:%M'),
-                    'ubicacion': ubicacion_texto,
-                    'precio': precio_texto,
-                    'categoria': evento.get_categoria_display()
-                })
+    def _terminar(self, error=None):
+        if not self.terminada:
+            self.terminada = True
+            vuelos_chat.terminar(self.clave, self.vuelo, error=error)
 
-                return JsonResponse({
-                    'response': respuesta_detalle,
-                    'events': eventos_info
-                })
+    def close(self):
+        self._terminar()
+        cerrar = getattr(self.fragmentos, 'close', None)
+        if cerrar is not None:
+            cerrar()
 
-            # Paso 1: Gemini interpreta el mensaje y extrae parámetros
-            parametros = interpretar_consulta_usuario(user_message)
-            
-            # Verificar si la pregunta es sobre eventos
-            es_sobre_eventos = parametros.get('es_sobre_eventos', True)
-            es_recomendacion = parametros.get('es_recomendacion', False)
-            tipo_consulta = parametros.get('tipo_consulta', '')
-            
-            # Solo tratar como recomendación si es explícitamente una recomendación SIN parámetros específicos
-            # Si hay parámetros como fecha, categoría, etc., NO es una recomendación simple
-            tiene_parametros_especificos = any([
-                parametros.get('fecha'),
-                parametros.get('fecha_inicio'),
-                parametros.get('fecha_fin'),
-                parametros.get('categoria'),
-                parametros.get('ubicacion'),
-                parametros.get('solo_gratuitos'),
-                parametros.get('dias_proximos'),
-                tipo_consulta in ['por_fecha', 'por_rango_fechas', 'por_categoria', 'por_ubicacion', 'gratuitos', 'proximos']
-            ])
-            
-            # Solo es recomendación si Gemini lo detectó Y no hay parámetros específicos
-            es_recomendacion_simple = es_recomendacion and not tiene_parametros_especificos
-            
-            if not es_sobre_eventos:
-                # Usar fallback para preguntas fuera de tema
-                respuesta = generar_respuesta_fallback(user_message)
-                eventos_info = []
-            elif es_recomendacion_simple:
-                # Obtener un evento aleatorio activo
-                import random
-                eventos_activos = list(Evento.objects.filter(activo=True))
-                
-                if eventos_activos:
-                    evento_aleatorio = random.choice(eventos_activos)
-                    fecha_inicio = timezone.localtime(evento_aleatorio.fecha_inicio)
-                    
-                    precio_texto = "Gratis" if evento_aleatorio.es_gratuito else f"${evento_aleatorio.precio}"
-                    ubicacion_texto = evento_aleatorio.ubicacion or "Ubicación por confirmar"
-                    
-                    # Usar Gemini para generar una respuesta personalizada basada en el contexto del mensaje
-                    from .evento_queries import generar_respuesta_recomendacion
-                    respuesta = generar_respuesta_recomendacion(evento_aleatorio, user_message)
-                    
-                    eventos_info = [{
-                        'titulo': evento_aleatorio.titulo,
-                        'descripcion': evento_aleatorio.descripcion or '',
-                        'fecha': fecha_inicio.strftime('%d/%m/%Y %H:%M'),
-                        'ubicacion': ubicacion_texto,
-                        'precio': precio_texto,
-                        'categoria': evento_aleatorio.get_categoria_display()
-                    }]
-                else:
-                    respuesta = 'Lo siento, no hay eventos disponibles en este momento. Pronto habrá más eventos chéveres en Loja.'
-                    eventos_info = []
+
+async def _procesar_coalescido_async(user_message, stream=False):
+    """
+    Versión asíncrona de ``_procesar_coalescido``.
+    """
+    clave = normalizar_mensaje(user_message)
+    vuelo, es_lider = vuelos_chat.unirse_async(clave)
+    if not es_lider:
+        partes = vuelo.seguir(settings.COALESCENCIA_ESPERA_MAXIMA)
+        _, eventos_info, origen, cursor = await anext(partes)
+        textos = (texto async for _, texto in partes)
+        if not stream:
+            return ''.join([texto async for texto in textos]), eventos_info, origen, cursor
+        return textos, eventos_info, origen, cursor
+
+    try:
+        with contar_llamadas_gemini(vuelo.llamadas):
+            respuesta, eventos_info, origen, cursor = await _procesar_mensaje_async(user_message, stream=stream)
+        vuelo.publicar(('eventos', eventos_info, origen, cursor))
+    except BaseException as e:
+        # También asyncio.CancelledError, si el cliente se desconecta
+        vuelos_chat.terminar(clave, vuelo, error=e)
+        raise
+
+    if isinstance(respuesta, str):
+        vuelo.publicar(('texto', respuesta))
+        vuelos_chat.terminar(clave, vuelo)
+        return respuesta, eventos_info, origen, cursor
+    return _RetransmisionAsync(clave, vuelo, respuesta), eventos_info, origen, cursor
+
+
+class _RetransmisionAsync(_Retransmision):
+    """
+    Versión asíncrona de ``_Retransmision``. ``close`` sigue siendo síncrona
+    (Django la llama desde un hilo) y no espera al generador de fragmentos.
+    """
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.terminada:
+            raise StopAsyncIteration
+        try:
+            with contar_llamadas_gemini(self.vuelo.llamadas):
+                fragmento = await anext(self.fragmentos, None)
+        except BaseException as e:
+            self._terminar(error=e)
+            raise
+        if fragmento is None:
+            self._terminar()
+            raise StopAsyncIteration
+        self.vuelo.publicar(('texto', fragmento))
+        return fragmento
+
+    def close(self):
+        self._terminar()
+
+
+def _procesar_mensaje(user_message, stream=False):
+    """
+    Resuelve un mensaje del usuario y retorna (respuesta, eventos_info, origen,
+    cursor). Con ``stream=True`` la respuesta puede ser un iterador con el
+    texto de Gemini a medida que llega, mientras que eventos_info ya está
+    completo. cursor apunta a la siguiente página de eventos, si la hay.
+    """
+    lower_message = user_message.strip().lower()
+    user_message = _aplicar_faq(user_message, lower_message)
+
+    if lower_message.startswith(DETALLE_PREFIX):
+        detalle = _respuesta_detalle(user_message)
+        return detalle['response'], detalle['events'], 'local', None
+
+    clave_faq = _clave_faq(user_message)
+    if clave_faq is not None:
+        guardada = cache_niveles.obtener('faq', clave_faq)
+        if guardada is not None:
+            respuesta, eventos_info, cursor = guardada
+            return respuesta, eventos_info, 'cache', cursor
+
+    # Paso 1: Interpretar el mensaje y extraer parámetros (reglas locales o Gemini).
+    # Si hubo que esperar a Gemini, la consulta puede venir ya ejecutada en paralelo.
+    parametros, origen, pagina_especulada = interpretar_y_consultar(user_message)
+    
+    # Verificar si la pregunta es sobre eventos
+    es_sobre_eventos = parametros.get('es_sobre_eventos', True)
+    cursor = None
+    
+    if not es_sobre_eventos:
+        # Usar fallback para preguntas fuera de tema
+        if stream:
+            respuesta = generar_respuesta_fallback_stream(user_message)
+        else:
+            respuesta = generar_respuesta_fallback(user_message)
+        eventos_info = []
+    elif _es_recomendacion_simple(parametros):
+        # Obtener un evento aleatorio activo
+        evento_aleatorio = _evento_aleatorio()
+        
+        if evento_aleatorio:
+            # Usar Gemini para generar una respuesta personalizada basada en el contexto del mensaje
+            if stream:
+                respuesta = generar_respuesta_recomendacion_stream(evento_aleatorio, user_message)
             else:
-                # Paso 2: Ejecutar consulta SQL predefinida con los parámetros
-                eventos = ejecutar_consulta_eventos(parametros)
-                
-                # Paso 3: Formatear respuesta usando Gemini
-                respuesta, eventos_info = formatear_respuesta_eventos(eventos, parametros)
-            
-            return JsonResponse({
-                'response': respuesta,
-                'events': eventos_info
-            })
-            
-        except Exception as e:
-            return JsonResponse({
-                'error': f'Error al procesar la solicitud: {str(e)}'
-            }, status=500)
+                respuesta = generar_respuesta_recomendacion(evento_aleatorio, user_message)
+            eventos_info = [_info_recomendacion(evento_aleatorio)]
+        else:
+            respuesta = SIN_EVENTOS_PARA_RECOMENDAR
+            eventos_info = []
+    else:
+        # Paso 2: Ejecutar consulta SQL predefinida con los parámetros (solo
+        # la primera página)
+        if pagina_especulada is not None:
+            eventos, cursor = pagina_especulada
+        else:
+            eventos, cursor = paginar_eventos(ejecutar_consulta_eventos(parametros), parametros)
+        
+        # Paso 3: Formatear respuesta usando Gemini
+        if stream:
+            eventos_info, respuesta = formatear_respuesta_eventos_stream(eventos, parametros)
+        else:
+            respuesta, eventos_info = formatear_respuesta_eventos(eventos, parametros)
+
+    _guardar_respuesta_faq(clave_faq, respuesta, eventos_info, origen, cursor)
+    return respuesta, eventos_info, origen, cursor
+
+
+async def _procesar_mensaje_async(user_message, stream=False):
+    """
+    Versión asíncrona de ``_procesar_mensaje``; en modo stream la respuesta
+    puede ser un iterador asíncrono.
+    """
+    lower_message = user_message.strip().lower()
+    user_message = _aplicar_faq(user_message, lower_message)
+
+    if lower_message.startswith(DETALLE_PREFIX):
+        detalle = await sync_to_async(_respuesta_detalle)(user_message)
+        return detalle['response'], detalle['events'], 'local', None
+
+    clave_faq = _clave_faq(user_message)
+    if clave_faq is not None:
+        guardada = await sync_to_async(cache_niveles.obtener)('faq', clave_faq)
+        if guardada is not None:
+            respuesta, eventos_info, cursor = guardada
+            return respuesta, eventos_info, 'cache', cursor
+
+    parametros, origen, pagina_especulada = await interpretar_y_consultar_async(user_message)
+    es_sobre_eventos = parametros.get('es_sobre_eventos', True)
+    cursor = None
     
-    return JsonResponse({'error': 'Método no permitido'}, status=405)
+    if not es_sobre_eventos:
+        if stream:
+            respuesta = generar_respuesta_fallback_stream_async(user_message)
+        else:
+            respuesta = await generar_respuesta_fallback_async(user_message)
+        eventos_info = []
+    elif _es_recomendacion_simple(parametros):
+        evento_aleatorio = await sync_to_async(_evento_aleatorio)()
+        
+        if evento_aleatorio:
+            if stream:
+                respuesta = generar_respuesta_recomendacion_stream_async(evento_aleatorio, user_message)
+            else:
+                respuesta = await generar_respuesta_recomendacion_async(evento_aleatorio, user_message)
+            eventos_info = [_info_recomendacion(evento_aleatorio)]
+        else:
+            respuesta = SIN_EVENTOS_PARA_RECOMENDAR
+            eventos_info = []
+    else:
+        if pagina_especulada is not None:
+            eventos, cursor = pagina_especulada
+        else:
+            # La búsqueda de texto y el catálogo en memoria consultan la base
+            # de datos al armar la consulta
+            eventos = await sync_to_async(ejecutar_consulta_eventos)(parametros)
+            eventos, cursor = await paginar_eventos_async(eventos, parametros)
+        if stream:
+            eventos_info, respuesta = await formatear_respuesta_eventos_stream_async(eventos, parametros)
+        else:
+            respuesta, eventos_info = await formatear_respuesta_eventos_async(eventos, parametros)
+
+    await sync_to_async(_guardar_respuesta_faq)(clave_faq, respuesta, eventos_info, origen, cursor)
+    return respuesta, eventos_info, origen, cursor
+
+
+def _linea_stream(parte):
+    return json.dumps(parte, ensure_ascii=False) + '\n'
+
+
+def _lineas_stream(respuesta, eventos_info, origen, cursor=None):
+    """
+    Genera la respuesta en streaming como NDJSON, una parte por línea:
+    primero {"tipo": "eventos", ...} con las tarjetas y el cursor de la
+    siguiente página, luego uno o más
+    {"tipo": "texto", "texto": ...} con el texto a medida que llega, y al
+    final {"tipo": "fin"}.
+    """
+    yield _linea_stream({'tipo': 'eventos', 'events': eventos_info, 'origen': origen, 'cursor': cursor})
+    fragmentos = [respuesta] if isinstance(respuesta, str) else respuesta
+    for fragmento in fragmentos:
+        yield _linea_stream({'tipo': 'texto', 'texto': fragmento})
+    yield _linea_stream({'tipo': 'fin'})
+
+
+async def _lineas_stream_async(respuesta, eventos_info, origen, cursor=None):
+    """
+    Versión asíncrona de ``_lineas_stream``.
+    """
+    yield _linea_stream({'tipo': 'eventos', 'events': eventos_info, 'origen': origen, 'cursor': cursor})
+    if isinstance(respuesta, str):
+        yield _linea_stream({'tipo': 'texto', 'texto': respuesta})
+    else:
+        async for fragmento in respuesta:
+            yield _linea_stream({'tipo': 'texto', 'texto': fragmento})
+    yield _linea_stream({'tipo': 'fin'})
+
+
+class _RespuestaStream(StreamingHttpResponse):
+    """
+    StreamingHttpResponse que llama a ``al_cerrar`` al cerrarse, aunque el
+    contenido no se haya leído (cliente desconectado antes del primer byte).
+    """
+
+    def __init__(self, *args, al_cerrar=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.al_cerrar = al_cerrar
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.al_cerrar is not None:
+                self.al_cerrar()
+
+
+def _respuesta_stream(lineas, al_cerrar=None):
+    respuesta = _RespuestaStream(lineas, al_cerrar=al_cerrar, content_type='application/x-ndjson; charset=utf-8')
+    respuesta['Cache-Control'] = 'no-cache'
+    # Evita que nginx acumule la respuesta antes de enviarla al navegador
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+
+def _aplicar_faq(user_message, lower_message):
+    """
+    Si el mensaje contiene una pregunta frecuente, la normaliza para que
+    funcione con el sistema existente.
+    """
+    for faq_key in FAQ_RESPONSES.keys():
+        if faq_key in lower_message:
+            return FAQ_RESPONSES[faq_key]
+    return user_message
+
+
+def _clave_faq(user_message):
+    """
+    Clave de la respuesta guardada (espacio "faq" de ``cache_niveles``) para
+    una pregunta frecuente ya normalizada por ``_aplicar_faq``, o None si el
+    mensaje no lo es o el proceso aún no leyó la versión del catálogo. La
+    fecha y la versión dejan atrás la respuesta al cambiar el día o los eventos.
+    """
+    version = vigilante_catalogo.version_actual()
+    if user_message not in FAQ_RESPONSES.values() or version is None:
+        return None
+    return (timezone.localdate().isoformat(), version, user_message)
+
+
+def _guardar_respuesta_faq(clave_faq, respuesta, eventos_info, origen, cursor):
+    """
+    Guarda la respuesta completa de una pregunta frecuente, salvo que sea un
+    texto en streaming o de respaldo.
+    """
+    if (
+        clave_faq is None
+        or not isinstance(respuesta, str)
+        or origen == 'respaldo'
+        or es_respuesta_respaldo(respuesta, eventos_info)
+    ):
+        return
+    cache_niveles.guardar(
+        'faq', clave_faq, (respuesta, eventos_info, cursor), expira_en=proxima_medianoche_local()
+    )
+
+
+def _es_recomendacion_simple(parametros):
+    """
+    Solo tratar como recomendación si es explícitamente una recomendación SIN parámetros específicos.
+    Si hay parámetros como fecha, categoría, etc., NO es una recomendación simple.
+    """
+    es_recomendacion = parametros.get('es_recomendacion', False)
+    tipo_consulta = parametros.get('tipo_consulta', '')
+    
+    tiene_parametros_especificos = any([
+        parametros.get('fecha'),
+        parametros.get('fecha_inicio'),
+        parametros.get('fecha_fin'),
+        parametros.get('categoria'),
+        parametros.get('ubicacion'),
+        parametros.get('solo_gratuitos'),
+        parametros.get('dias_proximos'),
+        tipo_consulta in ['por_fecha', 'por_rango_fechas', 'por_categoria', 'por_ubicacion', 'gratuitos', 'proximos']
+    ])
+    
+    # Solo es recomendación si Gemini lo detectó Y no hay parámetros específicos
+    return es_recomendacion and not tiene_parametros_especificos
+
+
+def _evento_aleatorio():
+    """
+    Retorna un evento activo próximo al azar, o None si no hay eventos. Se
+    elige con una búsqueda en el índice (ver recomendacion.py), que devuelve
+    una sola fila con CAMPOS_RECOMENDACION.
+    """
+    return muestreador_recomendaciones.elegir(CAMPOS_RECOMENDACION)
+
+
+def _info_recomendacion(evento):
+    """Datos de la tarjeta de un evento recomendado."""
+    fecha_inicio = timezone.localtime(evento.fecha_inicio)
+    return {
+        'titulo': evento.titulo,
+        'descripcion': evento.descripcion or '',
+        'fecha': fecha_inicio.strftime('%d/%m/%Y %H:%M'),
+        'ubicacion': evento.ubicacion or "Ubicación por confirmar",
+        'precio': "Gratis" if evento.es_gratuito else f"${evento.precio}",
+        'categoria': evento.get_categoria_display(),
+        'imagen': info_imagen(evento.imagen_derivados),
+    }
+
+
+def _respuesta_detalle(user_message):
+    """
+    Construye la respuesta para "Dame más información sobre <título>".
+    """
+    titulo_evento = user_message.strip()[len(DETALLE_PREFIX):].strip()
+
+    if not titulo_evento:
+        return {
+            'response': 'Necesito que me digas el nombre del evento del que quieres más información.',
+            'events': []
+        }
+
+    # Guardada por versión del catálogo: cualquier cambio en los eventos la deja atrás
+    version = vigilante_catalogo.version_actual()
+    if version is None:
+        return _detalle_evento(titulo_evento)
+    return cache_niveles.obtener_o_calcular(
+        'detalles', (version, titulo_evento), lambda: _detalle_evento(titulo_evento)
+    )
+
+
+def _detalle_evento(titulo_evento):
+    evento = buscar_por_titulo(Evento.objects.only(*CAMPOS_DETALLE), titulo_evento)
+    repeticion = None
+
+    if not evento:
+        # Una serie recurrente: se muestra su próxima ocurrencia
+        serie = series_recurrentes.buscar_por_titulo(normalizar_titulo(titulo_evento))
+        if serie is not None:
+            evento = series_recurrentes.proxima_ocurrencia(serie)
+            repeticion = describir_regla(serie.regla_interpretada)
+
+    if not evento:
+        return {
+            'response': f"No encontré un evento con el nombre '{titulo_evento}'. ¿Quieres intentar con otro nombre?",
+            'events': []
+        }
+
+    fecha_inicio = timezone.localtime(evento.fecha_inicio)
+    fecha_fin = timezone.localtime(evento.fecha_fin) if evento.fecha_fin else None
+
+    fecha_texto = fecha_inicio.strftime('%d/%m/%Y a las %H:%M')
+    if fecha_fin and fecha_fin.date() != fecha_inicio.date():
+        fecha_texto += f" hasta el {fecha_fin.strftime('%d/%m/%Y a las %H:%M')}"
+    elif fecha_fin and fecha_fin != fecha_inicio:
+        fecha_texto += f" hasta las {fecha_fin.strftime('%H:%M')}"
+
+    precio_texto = "Gratis" if evento.es_gratuito else f"${evento.precio}"
+    ubicacion_texto = evento.ubicacion or "Ubicación por confirmar"
+    direccion_texto = f" ({evento.direccion})" if evento.direccion else ""
+    descripcion = (evento.descripcion or "").strip()
+
+    lineas_respuesta = [
+        f"A ver, mijo, te cuento del {evento.titulo}:",
+        f"[calendar] **Fecha y horario:** {fecha_texto}",
+        f"[location] **Lugar:** {ubicacion_texto}{direccion_texto}",
+    ]
+
+    if repeticion:
+        lineas_respuesta.insert(2, f"[calendar] **Se repite:** {repeticion}")
+
+    if descripcion:
+        lineas_respuesta.append(f"[detail] **¿Qué habrá?:** {descripcion}")
+
+    lineas_respuesta.append(f"[price] **Costo:** {precio_texto}")
+    lineas_respuesta.append(f"[category] **Categoría:** {evento.get_categoria_display()}")
+
+    if evento.contacto:
+        lineas_respuesta.append(f"[contact] **Contacto:** {evento.contacto}")
+    if evento.enlace:
+        lineas_respuesta.append(f"[link] **Más info:** {evento.enlace}")
+
+    lineas_respuesta.append("Apoya lo local.")
+
+    respuesta_detalle = "\n".join(lineas_respuesta)
+
+    eventos_info = [{
+        'titulo': evento.titulo,
+        'descripcion': evento.descripcion or '',
+        'fecha': fecha_inicio.strftime('%d/%m/%Y %H:%M'),
+        'ubicacion': ubicacion_texto,
+        'precio': precio_texto,
+        'categoria': evento.get_categoria_display(),
+        'imagen': info_imagen(evento.imagen_derivados),
+    }]
+
+    return {
+        'response': respuesta_detalle,
+        'events': eventos_info
+    }
@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+# Bajo ASGI, /api/chat/ se sirve con la vista asíncrona (chatbot.views.chat_async)
+os.environ.setdefault('CHATBOT_CHAT_ASINCRONO', '1')
+
 application = get_asgi_application()
@@ -14,11 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from chatbot.estaticos import servir_estatico
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('chatbot.urls')),
@@ -28,3 +32,8 @@ urlpatterns = [
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+elif settings.ESTATICOS['SERVIR']:
+    # Estáticos de collectstatic, comprimidos y con caché de un año
+    urlpatterns += [
+        re_path(r'^%s(?P<ruta>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), servir_estatico),
+    ]